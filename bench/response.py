@@ -0,0 +1,60 @@
+import argparse
+import timeit
+
+from src import utils
+from src.communication import SerialCommunication
+from src.request import THREE_AXIS
+from src.response import ValuesResponse
+
+# Benchmarks latency of encoding and framing a ValuesResponse (everything send_response does
+# short of the actual write), against the number of samples in a batched IMU read
+# Run with: python -m bench.response
+
+DEFAULT_BATCH_SIZES = [1, 10, 100, 1000, 5000] # 5000*3 int32s is near the 64KiB body limit
+
+# Stands in for the transport, so only host-side encoding is measured
+class NullPort:
+    def write(self, data):
+        return len(data)
+
+# Old per-value encoding of response bodies, kept here as the baseline for comparison
+def encode_per_value(response):
+    msg_body = bytes()
+    for value in response.values:
+        if response.analog:
+            msg_body += utils.encode_int(value, width=4, signed=True)
+        else:
+            msg_body += utils.encode_int(value, width=1, signed=False)
+    return msg_body
+
+# Returns best per-call time of f in microseconds
+def time_call(f, repeat=5):
+    number, _ = timeit.Timer(f).autorange()
+    return min(timeit.repeat(f, number=number, repeat=repeat)) / number * 10**6
+
+def run(batch_sizes, analog=True):
+    sc = SerialCommunication()
+    sc.transport = NullPort()
+    rows = []
+    for num in batch_sizes:
+        if analog:
+            values = [(-1)**i * i for i in range(num*len(THREE_AXIS))] # int32 range
+        else:
+            values = [i%2 for i in range(num*len(THREE_AXIS))]
+        response = ValuesResponse(values=values, analog=analog)
+        bulk = time_call(lambda: sc.send_response(response))
+        per_value = time_call(lambda: encode_per_value(response))
+        rows.append((num, per_value, bulk))
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", help="Batch sizes (samples per channel)", type=int,
+                        nargs="+", default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--digital", help="Benchmark uint8 (digital) values",
+                        action="store_true")
+    args = parser.parse_args()
+
+    print("{:>8} {:>16} {:>16} {:>8}".format("batch", "per-value (us)", "bulk (us)", "speedup"))
+    for (num, per_value, bulk) in run(args.sizes, analog=not args.digital):
+        print("{:>8} {:>16.2f} {:>16.2f} {:>7.1f}x".format(num, per_value, bulk, per_value/bulk))
@@ -0,0 +1,50 @@
+import argparse
+import pprint
+
+from src import utils
+from src.simulator import simulate
+from src.simulator import synthetic_requests
+from src.transport import FdTransport
+from src.transport import PtyTransport
+from src.utils import InputType
+
+# End-to-end load test of the host (run_session, RequestHandler and the codecs) against a
+# simulated embedded client, with no hardware
+# Replay a recorded log:   python -m bench.simulate --log path/to/log [--testcase path/to/tc]
+# Synthetic IMU traffic:   python -m bench.simulate -n 10000 --batch 10 [--screen-every 10]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log", help="Path of RequestLog to replay")
+    parser.add_argument("--testcase", help="Path of TestCase whose handler the host uses")
+    parser.add_argument("-n", "--num", help="Number of synthetic input requests",
+                        type=int, default=1000)
+    parser.add_argument("--batch", help="Samples per synthetic request", type=int, default=1)
+    parser.add_argument("--input", help="Synthetic input type", default="Accelerometer",
+                        choices=[t.name for t in InputType])
+    parser.add_argument("--screen-every", help="Send a full screen every N synthetic inputs",
+                        type=int, default=0)
+    parser.add_argument("--pty", help="Go through a pseudo-terminal instead of an in-process "
+                        "pipe", action="store_true")
+    args = parser.parse_args()
+
+    if args.log:
+        requests = utils.load(args.log).requests
+    else:
+        requests = synthetic_requests(args.num, data_type=InputType[args.input],
+                                      batch_size=args.batch, screen_every=args.screen_every)
+
+    handler = None
+    if args.testcase:
+        handler = utils.load(args.testcase).handler
+
+    transports = None
+    if args.pty:
+        host = PtyTransport()
+        transports = (host, FdTransport.open_path(host.slave_path))
+        host.release_slave() # So the host sees the simulator disconnect
+
+    report, log = simulate(requests, handler, transports=transports)
+    pprint.pprint(report.describe())
+    for (request, problem) in report.problems[:10]:
+        print("Problem: {} (request: {})".format(problem, request))
@@ -0,0 +1,115 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from construct import construct_test
+from src import utils
+from src.log import RequestLog
+
+# Startup time of each entry point, measured as the wall time of fresh processes, since
+# grading services spawn one process per submission.  Sessions get a port that never appears
+# and --connect-timeout 0, so they stop as soon as the host is ready to talk to a board.
+# Run with: python -m bench.startup [-n RUNS] [--imports] [--check]
+#
+# To keep startup fast, modules that are slow to import (numpy, PIL, pyserial, asyncio,
+# multiprocessing, and modules that import them) are imported inside the functions that use
+# them, unless every caller of the module needs them anyway.  Then entry points only pay for
+# what they use (e.g. a session with no screens never imports numpy).  Each such import notes
+# what needs it.
+#
+# Absolute times vary a lot between machines and with load, so each entry point is timed
+# against a reference process that only imports what every entry point needs (argparse and
+# dill), with runs of the two interleaved.
+
+REFERENCE = ["-c", "import argparse, dill"]
+
+# Max ratio of each entry point's time to the reference's (see --check).  These are 1.3-1.8
+# here, and over 2.2 with numpy imported at startup
+BUDGETS = {
+    "src record": 2.0,
+    "src assess": 2.0,
+    "src assess_log": 2.0,
+    "construct": 2.0,
+}
+
+# Returns dict mapping entry point name to command line arguments (after python)
+def entry_points(tmp_dir):
+    log_path = os.path.join(tmp_dir, "empty.log")
+    testcase_path = os.path.join(tmp_dir, "blank.tc")
+    utils.save(RequestLog(), log_path)
+    utils.save(construct_test.blank_case(), testcase_path)
+    port = os.path.join(tmp_dir, "no-such-device")
+    results_dir = os.path.join(tmp_dir, "results")
+    return {
+        "src record": ["-m", "src", "record", "--port", port, "--connect-timeout", "0",
+                       "--log", os.path.join(tmp_dir, "record.log")],
+        "src assess": ["-m", "src", "assess", "--testcase", testcase_path, "--port", port,
+                       "--connect-timeout", "0", "--results", results_dir],
+        "src assess_log": ["-m", "src", "assess_log", "--testcase", testcase_path,
+                           "--log", log_path, "--results", results_dir],
+        "construct": ["-m", "construct", "--log", log_path,
+                      "--testcase", os.path.join(tmp_dir, "constructed.tc")],
+    }
+
+# Returns wall time in milliseconds of running python with args
+def time_command(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + args, stdout=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - start) * 1000
+
+# Returns median wall times in milliseconds of running python with args, and with reference
+# args, over runs runs of each, alternating so both see the same load
+def time_against(args, reference, runs):
+    times = []
+    reference_times = []
+    for i in range(runs):
+        reference_times.append(time_command(reference))
+        times.append(time_command(args))
+    return (statistics.median(times), statistics.median(reference_times))
+
+# Returns list of (cumulative microseconds, module) of the num slowest top-level imports
+def slowest_imports(args, num=5):
+    result = subprocess.run([sys.executable, "-X", "importtime"] + args,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True,
+                            universal_newlines=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue # Header
+        module = fields[2].rstrip()
+        if module.startswith("  "):
+            continue # Imported by another module
+        imports.append((int(fields[1]), module.strip()))
+    return sorted(imports, reverse=True)[:num]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--runs", help="Runs of each entry point", type=int, default=10)
+    parser.add_argument("--imports", help="Also list the slowest imports of each entry point",
+                        action="store_true")
+    parser.add_argument("--check", help="Exit with an error if an entry point is over budget",
+                        action="store_true")
+    args = parser.parse_args()
+
+    over_budget = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for (name, command) in entry_points(tmp_dir).items():
+            (elapsed, reference) = time_against(command, REFERENCE, args.runs)
+            ratio = elapsed / reference
+            status = ""
+            if ratio > BUDGETS[name]:
+                status = "  OVER BUDGET ({}x)".format(BUDGETS[name])
+                over_budget.append(name)
+            print("{:<16} {:>8.1f} ms  ({:.2f}x reference: {:.1f} ms){}".format(
+                  name, elapsed, ratio, reference, status))
+            if args.imports:
+                for (micros, module) in slowest_imports(command):
+                    print("    {:>8.1f} ms  {}".format(micros / 1000, module))
+
+    if args.check and over_budget:
+        sys.exit(1)
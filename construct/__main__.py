@@ -1,7 +1,6 @@
 import argparse
 import sys
 
-from . import construct_font
 from . import construct_test
 from src import utils
 
@@ -29,5 +28,6 @@ if args.testcase:
     utils.save(testcase, args.testcase)
 
 if args.font:
+    from . import construct_font # Only for --font
     font = construct_font.construct_font(log)
     utils.save(font, args.font)
\ No newline at end of file
@@ -14,12 +14,10 @@ from src.scaffold import Scaffold
 from src.scaffold import EvalPointTemplate
 from src.sequence import InterpolationType
 from src.sequence import Sequence
-from src.screen import Screen
 from src.utils import EventType
 from src.utils import InputType
 from src.utils import OutputType
 
-import numpy as np
 import operator
 
 # Good for testing
@@ -55,7 +53,11 @@ def blank_case(duration=10**12, default_values=None):
     evaluator = Evaluator(conditions=[], points={})
     return TestCase(handler=handler, evaluator=evaluator)
 
+# The hardcoded cases import numpy and Screen themselves, as constructing from a log doesn't
+# need them until the log is loaded
 def blinky_test_case():
+    import numpy as np
+    from src.screen import Screen
     init_condition = Condition(ConditionType.After, 
                                cause=is_start_msg)
     end_condition = Condition(ConditionType.After,
@@ -90,6 +92,8 @@ def blinky_test_case():
     return TestCase(handler=handler, evaluator=evaluator)
 
 def button_test_case():
+    import numpy as np
+    from src.screen import Screen
     init_condition = Condition(ConditionType.After,
                                cause=is_start_msg)
     end_condition = Condition(ConditionType.After,
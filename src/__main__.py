@@ -1,78 +1,100 @@
 import argparse
-import os
-import pprint
-import shutil
 import sys
 
+from . import assess
+from . import communication
 from . import run
+from . import timing
 from . import utils
 from .handler import RequestHandler
 
 parser = argparse.ArgumentParser()
-parser.add_argument("mode", help="Either 'assess' or 'record'")
-parser.add_argument("--testcase", help="Path to test case file")
-parser.add_argument("--log", help="Path to save log")
+parser.add_argument("mode", help="Either 'assess', 'assess_many', 'assess_log', 'record' "
+                    "or 'text'")
+parser.add_argument("--testcase", help="Path to test case file (assess_many: one per port)",
+                    nargs="+")
+parser.add_argument("--log", help="Path to save log (assess_many: directory for logs)")
+parser.add_argument("--port", help="Serial port, or transport spec (tcp:<host>:<port>, "
+                    "listen:<host>:<port>, tty:<path>, pty)", default=communication.ADDR)
+parser.add_argument("--ports", help="Serial ports (or transport specs) or glob patterns, "
+                    "for assess_many", nargs="+")
+parser.add_argument("--results", help="Directory for results", default=utils.RESULTS_DIR)
+parser.add_argument("-j", "--processes", help="Max parallel sessions, for assess_many (text: "
+                    "max processes reading screens)", type=int)
+parser.add_argument("--timing", help="Save per-stage request timings with the results",
+                    action="store_true")
+parser.add_argument("--coalesce", help="Merge bursts of screen updates less than this many "
+                    "milliseconds apart into one screen in the log", type=float)
+parser.add_argument("--connect-timeout", help="Seconds to wait for a board to be plugged in "
+                    "(default: forever)", type=float)
+parser.add_argument("--font", help="Path to font file, for text")
+parser.add_argument("--cache", help="Directory for cached screen texts, for text "
+                    "(default: cache)")
+parser.add_argument("--no-cache", help="Don't cache screen texts on disk", action="store_true")
 parser.add_argument("-v", "--verbose", help="Verbose printing", action="store_true")
 args = parser.parse_args()
 
 def require(field):
-    if not hasattr(args, field):
+    if getattr(args, field, None) is None:
         print("Error: Please provide path to file with --{} option".format(field))
         sys.exit(1)
 
-# Saves results of a test in results directory
-def save_results(description, brief_description, images):
-    results_dir = utils.RESULTS_DIR
-    if os.path.exists(results_dir):
-        if os.path.isdir(results_dir):
-            shutil.rmtree(results_dir) # Remove directory and all contents
-        else:
-            os.remove(results_dir) # It's a regular file, remove it
-
-    os.mkdir(results_dir) # Make new directory
-    with open(results_dir + "/description.txt", "w") as f:
-        pprint.pprint(description, f)
-    with open(results_dir + "/brief_description.txt", "w") as f:
-        pprint.pprint(brief_description, f)
-
-    if images:
-        os.mkdir(results_dir + "/images")
-        num_digits = len(str(len(images)-1))
-        for i in range(len(images)):
-            filename = results_dir + "/images/image{:0" + str(num_digits) + "d}.png"
-            filename = filename.format(i)
-            images[i].save(filename)
-
-def assess_log(evaluator, log):
-    results = evaluator.evaluate(log)
-    description = evaluator.describe(results)
-    images = evaluator.replace_images(description)
-    brief_description = evaluator.brief_description(description)
-    save_results(description, brief_description, images)
-
-if args.mode == "assess":
+def single_testcase():
     require("testcase")
+    if len(args.testcase) > 1:
+        print("Error: Please provide exactly one --testcase for mode {}".format(args.mode))
+        sys.exit(1)
+    return args.testcase[0]
+
+coalesce_window = None
+if args.coalesce is not None:
+    coalesce_window = args.coalesce * utils.MILLISECOND
 
-    testcase = utils.load(args.testcase)
-    log = run.run_session(testcase.handler, verbose=args.verbose)
+if args.mode == "assess":
+    testcase = utils.load(single_testcase())
+    timer = timing.StageTimer() if args.timing else None
+    log = run.run_session(testcase.handler, verbose=args.verbose, addr=args.port, timer=timer,
+                          coalesce_window=coalesce_window,
+                          connect_timeout=args.connect_timeout)
     if args.log is not None: # Save at that path
         utils.save(log, args.log)
 
-    assess_log(testcase.evaluator, log)
-    
+    assess.assess_log(testcase.evaluator, log, args.results)
+    if timer is not None:
+        timer.save(args.results)
 
-elif args.mode == "assess_log":
+elif args.mode == "assess_many":
     require("testcase")
+    require("ports")
+
+    try:
+        summaries = assess.assess_many(args.ports, args.testcase, results_dir=args.results,
+                                       log_dir=args.log, processes=args.processes,
+                                       verbose=args.verbose, record_timing=args.timing,
+                                       coalesce_window=coalesce_window,
+                                       connect_timeout=args.connect_timeout)
+    except ValueError as e:
+        print("Error: {}".format(e))
+        sys.exit(1)
+
+    for summary in summaries:
+        print("{}: {}".format(summary["Port"], summary["Result"]))
+
+elif args.mode == "assess_log":
     require("log")
 
-    evaluator = utils.load(args.testcase).evaluator
+    evaluator = utils.load(single_testcase()).evaluator
     log = utils.load(args.log)
+    if coalesce_window is not None:
+        log = log.coalesce_screens(coalesce_window)
 
-    assess_log(evaluator, log)
+    assess.assess_log(evaluator, log, args.results)
 
 elif args.mode == "record":
     handler = RequestHandler() # Blank, endless handler
-    log = run.run_session(handler, verbose=args.verbose)
+    log = run.run_session(handler, verbose=args.verbose, addr=args.port,
+                          coalesce_window=coalesce_window,
+                          connect_timeout=args.connect_timeout)
 
     path = args.log
     if path is None:
@@ -81,5 +103,21 @@ elif args.mode == "record":
     print("Saving recording to {}".format(path))
     utils.save(log, path)
 
+elif args.mode == "text":
+    require("log")
+    require("font")
+    from . import ocr # Only for text mode
+
+    log = utils.load(args.log)
+    if coalesce_window is not None:
+        log = log.coalesce_screens(coalesce_window)
+    cache_dir = ocr.CACHE_DIR if args.cache is None else args.cache
+    if args.no_cache:
+        cache_dir = None
+    texts = log.extract_text(utils.load(args.font), processes=args.processes,
+                             cache_dir=cache_dir).remove_duplicates()
+    for (t, text) in zip(texts.times, texts.values):
+        print("{} ms: {!r}".format(t / utils.MILLISECOND, text))
+
 else:
-    print("Invalid mode: use 'assess' or 'record' or 'assess_log'")
\ No newline at end of file
+    print("Invalid mode: use 'assess' or 'assess_many' or 'record' or 'assess_log' or 'text'")
@@ -0,0 +1,146 @@
+import glob
+import os
+import pprint
+import shutil
+
+from . import run
+from . import timing
+from . import utils
+
+SUMMARY_FILENAME = "summary.txt"
+
+# Saves results of a test in results_dir (replacing anything already there)
+def save_results(description, brief_description, images, results_dir=utils.RESULTS_DIR):
+    if os.path.exists(results_dir):
+        if os.path.isdir(results_dir):
+            shutil.rmtree(results_dir) # Remove directory and all contents
+        else:
+            os.remove(results_dir) # It's a regular file, remove it
+
+    os.makedirs(results_dir) # Make new directory
+    with open(results_dir + "/description.txt", "w") as f:
+        pprint.pprint(description, f)
+    with open(results_dir + "/brief_description.txt", "w") as f:
+        pprint.pprint(brief_description, f)
+
+    if images:
+        os.mkdir(results_dir + "/images")
+        num_digits = len(str(len(images)-1))
+        for i in range(len(images)):
+            filename = results_dir + "/images/image{:0" + str(num_digits) + "d}.png"
+            filename = filename.format(i)
+            images[i].save(filename)
+
+# Evaluates log and saves the results in results_dir
+# Returns the channel results (see Evaluator.evaluate)
+def assess_log(evaluator, log, results_dir=utils.RESULTS_DIR):
+    results = evaluator.evaluate(log)
+    description = evaluator.describe(results)
+    images = evaluator.replace_images(description)
+    brief_description = evaluator.brief_description(description)
+    save_results(description, brief_description, images, results_dir)
+    return results
+
+# Returns True if port is a glob pattern rather than a port name
+def is_pattern(port):
+    return glob.has_magic(port)
+
+# Input: list of port names or glob patterns (e.g. "/dev/ttyACM*")
+# Returns list of unique ports, in the order given, with each pattern replaced by its (sorted)
+# matches.  A pattern matching nothing is kept as is, since the board may not be plugged in
+# yet
+def expand_ports(patterns):
+    ports = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if is_pattern(pattern) else []
+        for port in matches or [pattern]:
+            if port not in ports:
+                ports.append(port)
+    return ports
+
+# Pairs ports (or patterns, see expand_ports) with testcase paths: a single testcase is used
+# for every port, otherwise there must be exactly one testcase per port, given as port names
+# (which ports a pattern matches isn't known in advance)
+# Returns list of (port, testcase) tuples
+def pair_testcases(patterns, testcases):
+    ports = expand_ports(patterns)
+    if len(testcases) == 1:
+        return [(port, testcases[0]) for port in ports]
+    elif any(is_pattern(pattern) for pattern in patterns):
+        raise ValueError("Need a single testcase when ports are given as patterns")
+    elif len(testcases) == len(ports):
+        return list(zip(ports, testcases))
+    else:
+        raise ValueError("Need one testcase, or one per port: got {} for {} ports".format(
+                         len(testcases), len(ports)))
+
+# Returns the results directory for the index-th session, on port (a serial port or transport
+# spec), within results_dir.  It's named after the port, prefixed with index since different
+# ports can share a basename (e.g. /dev/serial/by-path/... and /dev/serial/by-id/...)
+def session_results_dir(results_dir, index, port):
+    name = os.path.basename(port.rstrip("/")).replace(":", "_")
+    return os.path.join(results_dir, "{}_{}".format(index, name))
+
+# Runs and assesses a single session.  Meant to run in a worker process.
+# job: (port, testcase path, results_dir, log_dir or None, options), where options is a dict
+#   with verbose, record_timing, coalesce_window and connect_timeout (see assess_many)
+# Returns a summary dict for the session
+def assess_port(job):
+    (port, testcase_path, results_dir, log_dir, options) = job
+    summary = {"Port": port, "Testcase": testcase_path, "Results": results_dir}
+    try:
+        testcase = utils.load(testcase_path)
+        timer = timing.StageTimer() if options["record_timing"] else None
+        log = run.run_session(testcase.handler, verbose=options["verbose"], addr=port,
+                              timer=timer, coalesce_window=options["coalesce_window"],
+                              connect_timeout=options["connect_timeout"])
+        if not log.requests:
+            summary["Result"] = "ERROR"
+            summary["Error"] = "No requests received (is the board plugged in?)"
+            return summary
+        if log_dir is not None:
+            log_path = os.path.join(log_dir, os.path.basename(results_dir) + ".log")
+            utils.save(log, log_path)
+            summary["Log"] = log_path
+
+        results = assess_log(testcase.evaluator, log, results_dir)
+        if timer is not None:
+            timer.save(results_dir)
+        summary["Requests"] = len(log.requests)
+        summary["Result"] = "PASS" if all(r.passed for r in results.values()) else "FAIL"
+        summary["Channels"] = {utils.describe_channel(*key): ("PASS" if r.passed else "FAIL")
+                               for (key, r) in results.items()}
+    except Exception as e: # One bad board or file shouldn't take down the whole bench
+        summary["Result"] = "ERROR"
+        summary["Error"] = repr(e)
+    return summary
+
+# Runs sessions on all ports in parallel (one worker process per session, by default)
+# Each session's results go in their own directory within results_dir, and a combined
+# summary is saved in results_dir
+# If record_timing, per-stage timings (see timing.py) are saved with each session's results
+# coalesce_window, connect_timeout: as in run.run_session
+# ports: port names or glob patterns (see pair_testcases)
+# Returns list of summary dicts, in the same order as the (expanded) ports
+def assess_many(ports, testcases, *, results_dir=utils.RESULTS_DIR, log_dir=None,
+                processes=None, verbose=False, record_timing=False, coalesce_window=None,
+                connect_timeout=None):
+    pairs = pair_testcases(ports, testcases)
+    options = {"verbose": verbose, "record_timing": record_timing,
+               "coalesce_window": coalesce_window, "connect_timeout": connect_timeout}
+    jobs = [(port, testcase, session_results_dir(results_dir, i, port), log_dir, options)
+            for (i, (port, testcase)) in enumerate(pairs)]
+
+    os.makedirs(results_dir, exist_ok=True)
+    if log_dir is not None:
+        os.makedirs(log_dir, exist_ok=True)
+
+    if processes is None:
+        processes = len(jobs) # Sessions are I/O bound, so one process per board
+    import multiprocessing # Only for assess_many
+    with multiprocessing.Pool(processes=max(1, processes)) as pool:
+        summaries = pool.map(assess_port, jobs, chunksize=1)
+
+    with open(os.path.join(results_dir, SUMMARY_FILENAME), "w") as f:
+        pprint.pprint(summaries, f)
+    return summaries
@@ -0,0 +1,106 @@
+import asyncio
+from collections import deque
+import os
+import time
+
+from . import watch
+from .communication import ADDR
+from .communication import BAUD
+from .communication import RequestParser
+from .communication import SerialCommunication
+
+READ_SIZE = 4096 # Max bytes to take from the stream per read
+
+# Wraps a file descriptor for a character device (serial port, pty) in an asyncio
+# (StreamReader, StreamWriter) pair.  The descriptor is duplicated, so the caller still
+# owns (and should eventually close) fd.
+# Returns (reader, writer, read transport), where closing the writer and the read transport
+# closes the duplicates
+async def open_fd_connection(fd):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    read_protocol = asyncio.StreamReaderProtocol(reader)
+    read_transport, _ = await loop.connect_read_pipe(lambda: read_protocol,
+                                                     os.fdopen(os.dup(fd), 'rb', buffering=0))
+    write_transport, write_protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, os.fdopen(os.dup(fd), 'wb', buffering=0))
+    writer = asyncio.StreamWriter(write_transport, write_protocol, reader, loop)
+    return reader, writer, read_transport
+
+# Asyncio counterpart of SerialCommunication: same protocol, but get_request and send_response
+# are coroutines, so one event loop can serve many devices at once.  Works over any
+# StreamReader/StreamWriter pair (serial port, pty, socket, or in-memory streams).
+class AsyncCommunication:
+    # read_transport: transport feeding reader, closed with the connection (see
+    #   open_fd_connection)
+    def __init__(self, reader=None, writer=None, read_transport=None):
+        self.reader = reader
+        self.writer = writer
+        self.read_transport = read_transport
+        self.ser = None # Underlying serial port, if opened with connect()
+        self.protocol = SerialCommunication() # Codec and screen state (never touches a port)
+        self.parser = RequestParser(self.protocol)
+        self.pending_requests = deque() # (Request, decode ns) not yet returned by get_request
+        self.stage_times = {} # As in SerialCommunication
+
+    async def connect(self, addr=ADDR, baud=BAUD):
+        import serial # Only for real serial ports
+        try:
+            self.ser = serial.Serial(addr, baud)
+        except serial.SerialException:
+            self.ser = None
+            return False
+        (self.reader, self.writer, self.read_transport) = await open_fd_connection(
+            self.ser.fileno())
+        return True
+
+    # Waits for the device without blocking the event loop (see watch.wait_until_async)
+    # timeout: seconds to wait (None -> forever)
+    # Returns True if connected, False on timeout
+    async def wait_for_connection(self, addr=ADDR, baud=BAUD, timeout=None):
+        return await watch.wait_until_async(lambda: self.connect(addr, baud), addr,
+                                            timeout=timeout)
+
+    # timeout == None -> no timeout
+    # Returns None on timeout, or if the stream was closed
+    # Sets stage_times like SerialCommunication.get_request (read time includes time the
+    # event loop spent on other sessions)
+    async def get_request(self, timeout=None):
+        read_ns = 0
+        try:
+            while not self.pending_requests:
+                start = time.perf_counter_ns()
+                chunk = await asyncio.wait_for(self.reader.read(READ_SIZE), timeout)
+                read_ns += time.perf_counter_ns() - start
+                if len(chunk) == 0:
+                    return None # End of stream
+                decode_times = []
+                requests = self.parser.feed(chunk, decode_times)
+                self.pending_requests.extend(zip(requests, decode_times))
+        except asyncio.TimeoutError:
+            return None # read timed out
+        except OSError:
+            return None # port was closed
+
+        request, decode_ns = self.pending_requests.popleft()
+        self.stage_times = {"read": read_ns, "decode": decode_ns}
+        return request
+
+    async def send_response(self, response):
+        start = time.perf_counter_ns()
+        to_send = self.protocol.encode_response(response)
+        encoded = time.perf_counter_ns()
+        self.stage_times["encode"] = encoded - start
+        if to_send is None:
+            return # Don't do anything
+        self.writer.write(to_send)  # Must send it all at once, so it's in the same USB packet
+        await self.writer.drain()
+        self.stage_times["write"] = time.perf_counter_ns() - encoded
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.read_transport is not None:
+            self.read_transport.close()
+        if self.ser is not None:
+            self.ser.close()
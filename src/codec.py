@@ -0,0 +1,391 @@
+from collections import namedtuple
+from enum import Enum
+import struct
+
+from . import utils
+from .request import EventRequest
+from .request import InputRequest
+from .request import InvalidRequest
+from .request import OutputRequest
+from .request import THREE_AXIS
+from .response import AckResponse
+from .response import ErrorResponse
+from .response import ValuesResponse
+from .utils import BatchParams
+from .utils import EventType
+from .utils import InputType
+from .utils import OutputType
+
+# Table-driven codec for message bodies: each MessageCode is registered with a MessageSpec,
+# which holds both the decoder (used by the host) and the encoder (used by the device
+# simulator) for that message, so the two directions can't drift apart.  New message types
+# only need a new spec registered with a Codec.
+# Screen messages import screen when first used (see bench/startup.py)
+
+class MessageCode(Enum):
+    # Byte codes for system-level stuff
+    Init = 0x00
+    Print = 0x01
+
+    # Byte codes for GPIO
+    DigitalRead = 0x20
+    DigitalWrite = 0x21
+    AnalogRead = 0x22
+    AnalogWrite = 0x23
+
+    # Byte codes for IMU
+    ImuAcc = 0x30
+    ImuGyro = 0x31
+    ImuMag = 0x32
+
+    # Byte codes for Screen
+    ScreenInit = 0x40
+    ScreenFull = 0x41
+    ScreenTile = 0x42
+
+    # Byte codes for GPS
+    GpsFix = 0x50
+
+    # Byte codes for Wifi events
+    WifiReq = 0x60
+    WifiResp = 0x61
+
+    # Byte codes for responses
+    Ack = 0x80
+    AckComplete = 0x81
+    Error = 0x82
+    ErrorComplete = 0x83
+
+# Fixed-size body layouts
+ANALOG_PARAMS_SIZE = utils.ANALOG_PARAMS_STRUCT.size
+BATCH_PARAMS_SIZE = utils.BATCH_PARAMS_STRUCT.size
+DIGITAL_WRITE = struct.Struct('<BB') # <uint8 pin, uint8 value>
+ANALOG_WRITE = struct.Struct('<Biiiii') # <uint8 pin, int32 min_bin, max_bin, min_val, max_val, val>
+SCREEN_INIT = struct.Struct('<BB') # <uint8 tile_width, tile_height>
+SCREEN_TILE = struct.Struct('<BB8s') # <uint8 x, uint8 y, uint8 tile[8]>
+
+# code: MessageCode
+# data_type: data type of the Requests this message carries
+# decode: function(state, timestamp, msg_body) returning a Request, where state is the
+#   decoding SerialCommunication (which tracks the screen, for incremental screen messages,
+#   and interns decoded screens)
+#   and msg_body is any bytes-like object (a memoryview avoids copies)
+# encode: function(request) returning bytes msg_body, or None if request can't be sent as
+#   this message (e.g. a Wifi "response" event isn't a WifiReq message)
+MessageSpec = namedtuple('MessageSpec', ['code', 'data_type', 'decode', 'encode'])
+
+class Codec:
+    def __init__(self, specs=()):
+        self.decoders = {} # Maps int message code to MessageSpec
+        self.encoders = {} # Maps data type to list of MessageSpecs that may encode it
+        for spec in specs:
+            self.register(spec)
+
+    # Adds spec, replacing any spec already registered for its code
+    def register(self, spec):
+        old = self.decoders.get(spec.code.value)
+        if old is not None:
+            self.encoders[old.data_type].remove(old)
+        self.decoders[spec.code.value] = spec
+        self.encoders.setdefault(spec.data_type, []).append(spec)
+
+    # Inputs: decoding state (see MessageSpec), int msg_code, int timestamp, msg_body
+    # Returns Request object (InvalidRequest for unknown codes)
+    def decode(self, state, msg_code, timestamp, msg_body):
+        spec = self.decoders.get(msg_code)
+        if spec is None:
+            return InvalidRequest(timestamp=timestamp)
+        return spec.decode(state, timestamp, msg_body)
+
+    # Returns (MessageCode, bytes msg_body) for request, or None if it can't be encoded
+    def encode(self, request):
+        if not request.is_valid:
+            return None
+        for spec in self.encoders.get(request.data_type, ()):
+            msg_body = spec.encode(request)
+            if msg_body is not None:
+                return spec.code, msg_body
+        return None
+
+
+# Decodes the part of an input message shared by all input types (after any pin)
+# <uint8 flags, [analog params], [batch params], [recorded values]>
+# msg_body can be any bytes-like object, fields are unpacked in place (no slicing)
+# Returns an InputRequest or InvalidRequest
+def build_input_request(data_type, channels, analog, timestamp, msg_body):
+    # Process flags
+    if len(msg_body) < 1:
+        return InvalidRequest(timestamp=timestamp)
+    flags = msg_body[0]
+    offset = 1
+    is_recording = flags%2 # LSB
+    flags >>= 1
+    is_batch = flags%2 # 2nd LSB
+
+    if analog:  # Prcoess analog params, if appropriate
+        if len(msg_body) - offset < ANALOG_PARAMS_SIZE:
+            return InvalidRequest(timestamp=timestamp)
+        analog_params = utils.decode_analog_params(msg_body, offset)
+        offset += ANALOG_PARAMS_SIZE
+    else:
+        analog_params = None
+
+    if is_batch: # Process batch params, if appropriate
+        if len(msg_body) - offset < BATCH_PARAMS_SIZE:
+            return InvalidRequest(timestamp=timestamp)
+        batch_params = utils.decode_batch_params(msg_body, offset)
+        offset += BATCH_PARAMS_SIZE
+    else:
+        batch_params = BatchParams(num=1, period=0) # Single value
+
+    if is_recording: # Process recorded values, if appropriate
+        num_values = len(channels) * batch_params.num
+        if analog:
+            width = 4 # int32 values
+        else:
+            width = 1 # uint8 values
+        num_bytes = num_values * width
+
+        if len(msg_body) - offset < num_bytes:
+            return InvalidRequest(timestamp=timestamp)
+
+        values = utils.decode_ints(msg_body, num_values, width=width, signed=analog,
+                                   offset=offset)
+        offset += num_bytes
+    else:
+        values = None
+
+    if len(msg_body) > offset: # Error due to unprocessed message body leftover
+        return InvalidRequest(timestamp=timestamp)
+
+    return InputRequest(timestamp=timestamp, data_type=data_type, channels=channels,
+                        values=values, analog_params=analog_params, batch_params=batch_params)
+
+# Inverse of build_input_request
+def encode_input(request, analog):
+    is_batch = request.batch_params != BatchParams(num=1, period=0)
+    is_recording = request.values is not None
+    msg_body = bytes([2*is_batch + is_recording]) # Flags
+    if analog:
+        msg_body += utils.encode_ints(request.analog_params, width=4, signed=True)
+    if is_batch:
+        num, period = request.batch_params
+        msg_body += utils.BATCH_PARAMS_STRUCT.pack(num, round(period*1000)) # micros
+    if is_recording:
+        if analog:
+            msg_body += utils.encode_ints(request.values, width=4, signed=True)
+        else:
+            msg_body += utils.encode_ints(request.values, width=1, signed=False)
+    return msg_body
+
+# Returns a MessageSpec for an input message
+# pin: if True, the body starts with <uint8 pin>, the only channel; otherwise the channels
+#   are the three IMU axes
+def input_spec(code, data_type, analog, pin):
+    if pin:
+        def decode(state, timestamp, msg_body):
+            if len(msg_body) < 1:
+                return InvalidRequest(timestamp=timestamp)  # Not enough data
+            return build_input_request(data_type, [msg_body[0]], analog, timestamp,
+                                       msg_body[1:])
+        def encode(request):
+            return bytes([request.channels[0]]) + encode_input(request, analog)
+    else:
+        def decode(state, timestamp, msg_body):
+            return build_input_request(data_type, THREE_AXIS, analog, timestamp, msg_body)
+        def encode(request):
+            return encode_input(request, analog)
+    return MessageSpec(code, data_type, decode, encode)
+
+# Returns a MessageSpec for an event message with an empty body
+# data: the data of the EventRequest (messages with the same data type differ in data)
+def empty_event_spec(code, data_type, data=None):
+    def decode(state, timestamp, msg_body):
+        return EventRequest(timestamp=timestamp, data_type=data_type, data=data)
+    def encode(request):
+        if request.data != data:
+            return None
+        return bytes()
+    return MessageSpec(code, data_type, decode, encode)
+
+def decode_print(state, timestamp, msg_body): # <uint8 * chars>
+    text = str(msg_body, encoding='utf-8')
+    return EventRequest(timestamp=timestamp, data_type=EventType.Print, data=text)
+
+def encode_print(request):
+    return request.data.encode('utf-8')
+
+def decode_digital_write(state, timestamp, msg_body):
+    if len(msg_body) < DIGITAL_WRITE.size:
+        return InvalidRequest(timestamp=timestamp) # Not enough data
+    pin, value = DIGITAL_WRITE.unpack_from(msg_body)
+    return OutputRequest(timestamp=timestamp, data_type=OutputType.DigitalWrite,
+                         channels=[pin], values=[value])
+
+def encode_digital_write(request):
+    return DIGITAL_WRITE.pack(request.channels[0], request.values[0])
+
+def decode_analog_write(state, timestamp, msg_body):
+    if len(msg_body) < ANALOG_WRITE.size:
+        return InvalidRequest(timestamp=timestamp) # Not enough data
+    fields = ANALOG_WRITE.unpack_from(msg_body)
+    return OutputRequest(timestamp=timestamp, data_type=OutputType.AnalogWrite,
+                         channels=[fields[0]], values=[fields[5]],
+                         analog_params=utils.AnalogParams(*fields[1:5]))
+
+def encode_analog_write(request):
+    return ANALOG_WRITE.pack(request.channels[0], *request.analog_params, request.values[0])
+
+# Returns screen interned in state's pool (see screen.ScreenPool), created on the first screen
+def intern_screen(state, screen):
+    if state.screen_pool is None:
+        from .screen import ScreenPool
+        state.screen_pool = ScreenPool()
+    return state.screen_pool.intern(screen)
+
+def decode_screen_init(state, timestamp, msg_body):
+    from .screen import Screen
+    from .screen import ScreenShape
+    if len(msg_body) < SCREEN_INIT.size:
+        return InvalidRequest(timestamp=timestamp) # Not enough data
+    if state.last_screen is not None:
+        return InvalidRequest(timestamp=timestamp) # Redundant screen initialization
+    tile_width, tile_height = SCREEN_INIT.unpack_from(msg_body)
+    state.last_screen = Screen(width=8*tile_width, height=8*tile_height)
+    return EventRequest(timestamp=timestamp, data_type=EventType.ScreenInit,
+                        data=ScreenShape(width=8*tile_width, height=8*tile_height))
+
+def encode_screen_init(request):
+    shape = request.data
+    return SCREEN_INIT.pack(shape.width//8, shape.height//8)
+
+def decode_screen_full(state, timestamp, msg_body): # <uint8 * buffer>
+    from .screen import Screen
+    from .screen import changed_tiles
+    # buffer is seq of 8 byte tiles.  Tiles are 8x8 pixels.  Tiles are organized by row
+    if state.last_screen is None:
+        return InvalidRequest(timestamp=timestamp) # No screen initialization
+    tile_width = (state.last_screen.shape.width+7)//8
+    tile_height = (state.last_screen.shape.height+7)//8
+
+    if len(msg_body) < (8*tile_width*tile_height):
+        return InvalidRequest(timestamp=timestamp) # Not enough data
+
+    # Now we construct the screen, whose packed pages are the tiles in reverse
+    pages = utils.decode_screen_pages(msg_body, tile_width, tile_height)
+    dirty = changed_tiles(pages, state.last_screen.to_pages())
+    if dirty.any():
+        screen = Screen.from_pages(pages, 8*tile_width, 8*tile_height)
+        screen = intern_screen(state, screen)
+    else: # Redrawn unchanged, so share the last screen's pixels
+        screen = state.last_screen.copy()
+    screen.dirty = dirty
+
+    state.last_screen = screen.copy()
+    return OutputRequest(timestamp=timestamp, data_type=OutputType.Screen,
+                         channels=[None], values=[screen])
+
+# Screens are always sent as a full screen
+def encode_screen_full(request):
+    return utils.encode_screen_pages(request.values[0].to_pages())
+
+def decode_screen_tile(state, timestamp, msg_body):
+    if state.last_screen is None:
+        return InvalidRequest(timestamp) # No screen initialization
+    if len(msg_body) < SCREEN_TILE.size:
+        return InvalidRequest(timestamp) # Not enough data
+
+    x, y, tile = SCREEN_TILE.unpack_from(msg_body) # x and y measured in tiles, not pixels
+    if 8*x >= state.last_screen.shape.width or 8*y >= state.last_screen.shape.height:
+        return InvalidRequest(timestamp) # Tile is off the screen
+    tile = utils.decode_screen_tile(tile)
+    screen = state.last_screen.painted_tile(tile, x, y) # Shares other tiles, so not interned
+    state.last_screen = screen.copy()
+    return OutputRequest(timestamp=timestamp, data_type=OutputType.Screen,
+                         channels=[None], values=[screen], is_tile=True)
+
+# Individual tiles can't be recovered from a Screen, so requests are encoded as ScreenFull
+def encode_screen_tile(request):
+    return None
+
+DEFAULT_CODEC = Codec([
+    empty_event_spec(MessageCode.Init, EventType.Init),
+    MessageSpec(MessageCode.Print, EventType.Print, decode_print, encode_print),
+    input_spec(MessageCode.DigitalRead, InputType.DigitalRead, analog=False, pin=True),
+    MessageSpec(MessageCode.DigitalWrite, OutputType.DigitalWrite,
+                decode_digital_write, encode_digital_write),
+    input_spec(MessageCode.AnalogRead, InputType.AnalogRead, analog=True, pin=True),
+    MessageSpec(MessageCode.AnalogWrite, OutputType.AnalogWrite,
+                decode_analog_write, encode_analog_write),
+    input_spec(MessageCode.ImuAcc, InputType.Accelerometer, analog=True, pin=False),
+    input_spec(MessageCode.ImuGyro, InputType.Gyroscope, analog=True, pin=False),
+    input_spec(MessageCode.ImuMag, InputType.Magnetometer, analog=True, pin=False),
+    MessageSpec(MessageCode.ScreenInit, EventType.ScreenInit,
+                decode_screen_init, encode_screen_init),
+    MessageSpec(MessageCode.ScreenFull, OutputType.Screen,
+                decode_screen_full, encode_screen_full),
+    MessageSpec(MessageCode.ScreenTile, OutputType.Screen,
+                decode_screen_tile, encode_screen_tile),
+    empty_event_spec(MessageCode.GpsFix, EventType.Gps), # Later: expand protocol
+    empty_event_spec(MessageCode.WifiReq, EventType.Wifi, "request"), # Later: expand protocol
+    empty_event_spec(MessageCode.WifiResp, EventType.Wifi, "response"), # Later: expand protocol
+])
+
+
+# Maps (is_error, complete) to the response's MessageCode
+RESPONSE_CODES = {
+    (False, False): MessageCode.Ack,
+    (False, True): MessageCode.AckComplete,
+    (True, False): MessageCode.Error,
+    (True, True): MessageCode.ErrorComplete,
+}
+
+def encode_values(response):
+    if response.analog:  # int32 encoding
+        return utils.encode_ints(response.values, width=4, signed=True)
+    else:                # uint8 encoding
+        return utils.encode_ints(response.values, width=1, signed=False)
+
+# Maps Response type to function(response) returning bytes msg_body
+RESPONSE_ENCODERS = {
+    AckResponse: lambda response: bytes(), # Ack without data
+    ErrorResponse: lambda response: bytes(), # Error without data
+    ValuesResponse: encode_values, # Sequence of values, packed all at once
+}
+
+# Input: Response object
+# Returns (int msg_code, bytes msg_body)
+def response_to_bytes(response):
+    msg_code = RESPONSE_CODES[(bool(response.is_error), bool(response.complete))]
+    encoder = RESPONSE_ENCODERS.get(type(response))
+    if encoder is None: # Unsupported response type
+        return msg_code.value, bytes()
+    return msg_code.value, encoder(response)
+
+# Inverse of response_to_bytes, for the client side
+# Input: int msg_code, bytes msg_body, and the request it responds to
+# Returns a Response (values are decoded according to the request), or None if malformed
+def bytes_to_response(msg_code, msg_body, request):
+    try:
+        msg_code = MessageCode(msg_code)
+    except ValueError:
+        return None
+    complete = msg_code in (MessageCode.AckComplete, MessageCode.ErrorComplete)
+
+    if msg_code in (MessageCode.Error, MessageCode.ErrorComplete):
+        if len(msg_body) > 0:
+            return None
+        return ErrorResponse(complete=complete)
+    elif msg_code not in (MessageCode.Ack, MessageCode.AckComplete):
+        return None # Not a response code
+    elif len(msg_body) == 0:
+        return AckResponse(complete=complete)
+    elif request.is_input:
+        analog = request.analog_params is not None
+        width = 4 if analog else 1
+        if len(msg_body) % width != 0:
+            return None
+        values = utils.decode_ints(msg_body, len(msg_body)//width, width=width, signed=analog)
+        return ValuesResponse(values, analog, complete=complete)
+    else:
+        return None # Only input requests get values back
@@ -1,12 +1,18 @@
 from . import prefs
 from . import utils
-from .screen import Screen
 from .sequence import Sequence
 
 from collections import namedtuple
 import operator
+import sys
 
 
+# Returns True if obj is a Screen.  There can't be any unless screen was imported, so this
+# doesn't import it (and numpy) itself.
+def is_screen(obj):
+    screen = sys.modules.get(__package__ + ".screen")
+    return screen is not None and type(obj) is screen.Screen
+
 EvaluatedValue = namedtuple("EvaluatedValue", ["value", "portion", "passed"])
 
 EvalPointResult = namedtuple("EvalPointResult", ["passed", "observed"])
@@ -33,13 +39,15 @@ class EvalPoint:
     def evaluate(self, condition_met_at, sequence):
         if condition_met_at is None:
             return EvalPointResult(False, [])
+        return self.evaluate_profile(sequence.profile_interval(self.interval(condition_met_at)))
 
+    # Returns (start, end) of the interval checked, given the time the condition was met
+    def interval(self, condition_met_at):
         (start, end) = self.check_interval
-        start += condition_met_at
-        end += condition_met_at
-
-        values = sequence.profile_interval((start,end))
+        return (start + condition_met_at, end + condition_met_at)
 
+    # Same as evaluate, given the profile (see Sequence.profile_interval) of the interval
+    def evaluate_profile(self, values):
         # Add pass/fail for each value tuple
         portion_correct = 0.0
         for i in range(len(values)):
@@ -127,10 +135,16 @@ class Evaluator:
         results = {} # Map to be returned
         for key in self.points:
             sequence = sequences.get(key, Sequence())
-            point_results = []
-            for point in self.points[key]:
-                condition_met_at = satisfied_times[point.condition_id]
-                point_results.append(point.evaluate(condition_met_at, sequence))
+            points = self.points[key]
+            point_results = [EvalPointResult(False, []) for point in points] # Unless met
+
+            # All the points' intervals are profiled in one sweep through the sequence
+            met = [i for i in range(len(points))
+                   if satisfied_times[points[i].condition_id] is not None]
+            intervals = [points[i].interval(satisfied_times[points[i].condition_id])
+                         for i in met]
+            for (i, profile) in zip(met, sequence.profile_intervals(intervals)):
+                point_results[i] = points[i].evaluate_profile(profile)
 
             agg = self.aggregators.get_preference(key)
             overall_result = agg([res.passed for res in point_results])
@@ -188,13 +202,13 @@ class Evaluator:
         def helper(obj, omit_blanks):
             if type(obj) is list:
                 for i in range(len(obj)):
-                    if type(obj[i]) is Screen:
+                    if is_screen(obj[i]):
                         obj[i] = replace_image(obj[i], omit_blanks)
                     else:
                         helper(obj[i], omit_blanks)
             elif type(obj) is dict:
                 for (key, value) in obj.items():
-                    if type(value) is Screen:
+                    if is_screen(value):
                         obj[key] = replace_image(value, omit_blanks)
                     else:
                         helper(value, omit_blanks)
@@ -51,9 +51,8 @@ class Frame:
         if None in values:  # There was an error
             return ErrorResponse()
         else:
-            values = [[values[i][n] for i in range(len(request.channels))] 
-                                        for n in range(num_samples)] # Transpose 2D array
-            values = sum(values, []) # Then flatten into a 1D array of values
+            values = [values[i][n] for n in range(num_samples)
+                                    for i in range(len(request.channels))] # Transpose, flatten
 
         if request.analog_params is None: # digital
             return ValuesResponse(values=values, analog=False)
@@ -1,22 +1,73 @@
 from . import utils
 from .condition import Condition
+from .sequence import MIN_ARRAY_LENGTH
 from .sequence import Sequence
 from .utils import BatchParams
+from .utils import OutputType
+
+# Returns True if request is a (full or tile) screen output
+def is_screen_output(request):
+    return request.is_output and request.data_type == OutputType.Screen
+
+# Returns True if request is a screen output from a tile update (see OutputRequest.is_tile)
+def is_tile_output(request):
+    return is_screen_output(request) and getattr(request, "is_tile", False) # Older logs lack it
 
 class RequestLog:
-    def __init__(self):
+    # coalesce_window: if not None, screen outputs with no other request in between are
+    #   merged into one (the latest screen) for as long as they arrive within coalesce_window
+    #   of the first of them.  Only screens from tile updates are replaced, so this keeps just
+    #   the finished frame of a burst of tile updates, but every full screen.
+    def __init__(self, coalesce_window=None):
         self.requests = []
+        self.coalesce_window = coalesce_window
+        self.burst_start = None # Timestamp of first screen output in current burst
+        self.screen_pool = None # ScreenPool, so identical screens in the log share pixels
 
     def update(self, request):
+        if is_screen_output(request):
+            self.intern_screens(request)
+        self.add(request)
+
+    # Same as update, for requests whose screens are already interned in self.screen_pool
+    def add(self, request):
+        if self.coalesce_window is not None and is_screen_output(request):
+            if (self.burst_start is not None and is_tile_output(self.requests[-1])
+                    and request.timestamp - self.burst_start <= self.coalesce_window):
+                self.requests[-1] = request # Replaces the half-drawn screen
+                return
+            self.burst_start = request.timestamp
+        else:
+            self.burst_start = None
         self.requests.append(request)
 
+    # Replaces the screens output by request with their interned equivalents
+    def intern_screens(self, request):
+        if self.screen_pool is None:
+            from .screen import ScreenPool # Only once the log has screens
+            self.screen_pool = ScreenPool()
+        request.values = [self.screen_pool.intern(screen) if screen is not None else None
+                          for screen in request.values]
+
+    # Returns new RequestLog with bursts of screen outputs merged (see __init__), sharing
+    # requests (which are left unchanged) and screens with self
+    def coalesce_screens(self, window):
+        log = RequestLog(coalesce_window=window)
+        log.screen_pool = self.screen_pool
+        for request in self.requests:
+            log.add(request)
+        return log
+
     def extract_sequences(self):
-        sequences = {} # Maps (data_type, channel)-> Sequence
+        # Batched samples can be timed after later requests, so points are collected in log
+        # order and sorted once per channel at the end
+        points = {} # Maps (data_type, channel)-> (list of times, list of values)
         def add_entry(data_type, channel, timestamp, value):
             key = (data_type, channel)
-            if key not in sequences:
-                sequences[key] = Sequence() # Initialize if necessary
-            sequences[key].append(time=timestamp, value=value)
+            if key not in points:
+                points[key] = ([], []) # Initialize if necessary
+            points[key][0].append(timestamp)
+            points[key][1].append(value)
 
         for request in self.requests:
             if not request.is_valid:
@@ -37,8 +88,23 @@ class RequestLog:
                             timestamp = request.timestamp + i*batch_params.period
                             add_entry(data_type, channel, timestamp, value)
 
+        sequences = {} # Maps (data_type, channel)-> Sequence
+        for (key, (times, values)) in points.items():
+            sequence = Sequence.from_unsorted(times, values)
+            sequences[key] = sequence
+            if len(sequence) >= MIN_ARRAY_LENGTH: # Long numeric channels get vectorized queries
+                sequence.to_arrays()
         return sequences
 
+    # Returns Sequence of the text on each screen output (see ocr.extract_texts, which takes
+    # the same keyword arguments), timed like the screen outputs
+    # font: namedtuple Font
+    def extract_text(self, font, **kwargs):
+        requests = [request for request in self.requests if is_screen_output(request)]
+        from . import ocr
+        texts = ocr.extract_texts([request.values[0] for request in requests], font, **kwargs)
+        return Sequence([request.timestamp for request in requests], texts)
+
     def condition_satisfied_at(self, condition):
         # Make fresh copy (so stateful fields are reset)
         condition = Condition(condition.type, condition.cause, condition.subconditions)
@@ -60,8 +126,22 @@ class RequestLog:
     def filter(self, func): 
         log = RequestLog()
         log.requests = list(filter(func, self.requests))
+        log.screen_pool = self.screen_pool
         return log
 
+    # The pool isn't saved (pickles already store shared pixels once), but rebuilt on load
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["screen_pool"]
+        return state
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.__dict__.update(state) # Logs saved before a field existed get its default
+        for request in self.requests:
+            if is_screen_output(request):
+                self.intern_screens(request)
+
     def __eq__(self, other):
         return self.requests == other.requests #  conditions being equal is unnecessary
 
@@ -0,0 +1,91 @@
+import hashlib
+import multiprocessing
+import os
+import pickle
+
+from . import screen
+from . import utils
+
+# Batch text extraction (see Screen.extract_text) over many screens, e.g. every screen in a
+# long log: identical screens are read once, the rest are spread over a process pool, and
+# texts are cached on disk by screen digest, font and extraction options
+
+CACHE_DIR = "cache"
+MIN_PARALLEL_SCREENS = 64 # Fewer unread screens are read in-process (cheaper than a pool)
+CHUNKS_PER_PROCESS = 4 # Smooths out chunks that take longer than others
+
+# Returns hex string identifying font (namedtuple Font) and extraction options
+def options_key(font, ignored_chars, line_delimeter):
+    if ignored_chars is not None:
+        ignored_chars = sorted(ignored_chars)
+    options = (font.width, font.height, sorted(font.chars.items()), ignored_chars,
+               line_delimeter)
+    return hashlib.blake2b(repr(options).encode(), digest_size=16).hexdigest()
+
+# Texts already extracted with one font and set of options, saved in cache_dir
+class TextCache:
+    # cache_dir: directory of cache files (created if necessary), or None to not use the disk
+    def __init__(self, cache_dir, key):
+        self.path = None
+        self.texts = {} # Maps screen digest to text
+        if cache_dir is not None:
+            self.path = os.path.join(cache_dir, "text-{}.cache".format(key))
+            try:
+                self.texts = utils.load(self.path)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass # Missing or unreadable, so start over
+
+    # Saves texts, replacing the cache file at once so readers never see a partial one
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        utils.save(self.texts, temp_path)
+        os.replace(temp_path, self.path)
+
+# Extraction arguments of the worker processes, sent once per process (see init_worker)
+worker_args = None
+
+def init_worker(font, ignored_chars, line_delimeter):
+    global worker_args
+    worker_args = (screen.compile_font(font), ignored_chars, line_delimeter)
+
+def read_chunk(screens):
+    (font, ignored_chars, line_delimeter) = worker_args
+    return screen.extract_texts(screens, font, ignored_chars=ignored_chars,
+                                line_delimeter=line_delimeter)
+
+# Returns list of texts of screens, in parallel if processes > 1 and there are enough screens
+def read_screens(screens, font, ignored_chars, line_delimeter, processes):
+    if processes <= 1 or len(screens) < MIN_PARALLEL_SCREENS:
+        return screen.extract_texts(screens, font, ignored_chars=ignored_chars,
+                                    line_delimeter=line_delimeter)
+    size = -(-len(screens) // (processes*CHUNKS_PER_PROCESS)) # Rounds up
+    chunks = [screens[i:i+size] for i in range(0, len(screens), size)]
+    with multiprocessing.Pool(processes=min(processes, len(chunks)), initializer=init_worker,
+                              initargs=(font, ignored_chars, line_delimeter)) as pool:
+        results = pool.map(read_chunk, chunks)
+    return [text for chunk in results for text in chunk]
+
+# Returns list of texts of screens (see Screen.extract_text), in the same order
+# font: namedtuple Font
+# processes: max worker processes (None -> one per core)
+# cache_dir: directory for the disk cache, or None to not use one
+def extract_texts(screens, font, *, ignored_chars=None, line_delimeter='\n', processes=None,
+                  cache_dir=CACHE_DIR):
+    if processes is None:
+        processes = os.cpu_count() or 1
+    cache = TextCache(cache_dir, options_key(font, ignored_chars, line_delimeter))
+    digests = [s.digest() for s in screens]
+    unread = {} # Maps digest to screen, for screens with no cached text
+    for (digest, s) in zip(digests, screens):
+        if digest not in cache.texts and digest not in unread:
+            unread[digest] = s
+
+    if unread:
+        texts = read_screens(list(unread.values()), font, ignored_chars, line_delimeter,
+                             processes)
+        cache.texts.update(zip(unread.keys(), texts))
+        cache.save()
+    return [cache.texts[digest] for digest in digests]
@@ -47,7 +47,7 @@ class InputRequest(Request):
 # Subclass for requests that are reporting system outputs
 class OutputRequest(Request):
     def __init__(self, timestamp, data_type, channels, values, analog_params=None,
-                 *, response_expected=True):
+                 *, response_expected=True, is_tile=False):
         super().__init__(timestamp, response_expected)
         self.is_output = True # Override default
         self.data_type = data_type # Should be OutputType
@@ -55,6 +55,7 @@ class OutputRequest(Request):
         self.values = values # Should be list of values
         self.analog_params = analog_params
         self.batch_params = BatchParams(num=1, period=0)
+        self.is_tile = is_tile # True for a screen updated one tile at a time (maybe half-drawn)
 
     def __str__(self):
         s = "OutputRequest: timestamp={}, data_type={}, channels={}, values={}, analog_params={}"
@@ -1,45 +1,119 @@
 from . import utils
+from .communication import ADDR
 from .communication import SerialCommunication
 from .log import RequestLog
 from .utils import EventType
 
-import numpy as np
+import time
 
 # Runs an interactive session with the embedded side
 # Input: handler is a RequestHandler
 #   timeout: the timeout in seconds (float ok)
+#   addr: the serial port of the embedded device, or any transport spec
+#       (see transport.open_transport)
+#   transport: an already open transport to use instead of connecting to addr (left open)
+#   connect_timeout: seconds to wait for the device at addr (None -> forever).  If it doesn't
+#       show up, the returned log is empty.
+#   timer: a timing.StageTimer to record how long each stage of each request took, or None
+#   coalesce_window: if not None, bursts of screen outputs are merged in the log (see
+#       RequestLog)
 # Returns: RequestLog
-def run_session(handler, *, verbose=False, timeout=None):
-    sc = SerialCommunication()
-    sc.wait_for_connection()
+def run_session(handler, *, verbose=False, timeout=None, addr=ADDR, transport=None,
+                timer=None, coalesce_window=None, connect_timeout=None):
+    sc = SerialCommunication(transport)
+    log = RequestLog(coalesce_window)
+    if transport is None and not sc.wait_for_connection(addr, timeout=connect_timeout):
+        if verbose:
+            print("Device not found: {}".format(addr))
+        return log
+
+    if verbose:
+        print("Starting session")
+    try:
+        while True:
+            request = sc.get_request(timeout)
+            if request is None: # There was an exception or timeout
+                if verbose:
+                    print("Serial exception or timeout")
+                break
+
+            start = time.perf_counter_ns()
+            response = handle_request(handler, log, request, verbose)
+            handle_ns = time.perf_counter_ns() - start
+            sc.send_response(response)
+            if timer is not None:
+                timer.record(request, dict(sc.stage_times, handle=handle_ns))
+            if is_final_response(request, response):
+                break
+    finally:
+        if transport is None: # Opened here
+            sc.close()
+
+    if verbose:
+        print("Session complete")
+    return log
+
+# Coroutine version of run_session, over an already connected AsyncCommunication
+# Many of these can run concurrently in one event loop (e.g. with asyncio.gather)
+# Input: handler is a RequestHandler
+#   comm: an AsyncCommunication
+#   timeout: the timeout in seconds (float ok) for each request
+#   session_timeout: the timeout in seconds for the whole session
+#   timer, coalesce_window: as in run_session
+# Returns: RequestLog (of whatever happened before the session ended)
+async def run_session_async(handler, comm, *, verbose=False, timeout=None,
+                            session_timeout=None, timer=None, coalesce_window=None):
+    if session_timeout is not None:
+        deadline = time.monotonic() + session_timeout
 
-    log = RequestLog()
+    log = RequestLog(coalesce_window)
 
     if verbose:
         print("Starting session")
     while True:
-        request = sc.get_request(timeout)
+        request_timeout = timeout
+        if session_timeout is not None: # Don't wait past the end of the session
+            remaining = max(0, deadline - time.monotonic())
+            if request_timeout is None or remaining < request_timeout:
+                request_timeout = remaining
+
+        request = await comm.get_request(request_timeout)
         if request is None: # There was an exception or timeout
             if verbose:
                 print("Serial exception or timeout")
             break
 
-        log.update(request)
-        if verbose:
-            print("Request={}".format(request))
-        elif request.data_type == EventType.Print:
-            print("Debug: {}".format(request.data))
-
-        response = handler.update(request)
-        if verbose:
-            print("Response={}".format(response))
-        sc.send_response(response)
-        if response.is_error or response.complete:
-            if response.is_error:
-                print(request)
-                print(response)
+        start = time.perf_counter_ns()
+        response = handle_request(handler, log, request, verbose)
+        handle_ns = time.perf_counter_ns() - start
+        await comm.send_response(response)
+        if timer is not None:
+            timer.record(request, dict(comm.stage_times, handle=handle_ns))
+        if is_final_response(request, response):
             break
 
     if verbose:
         print("Session complete")
-    return log
\ No newline at end of file
+    return log
+
+# Logs request and returns the handler's response to it, printing as appropriate
+def handle_request(handler, log, request, verbose=False):
+    log.update(request)
+    if verbose:
+        print("Request={}".format(request))
+    elif request.data_type == EventType.Print:
+        print("Debug: {}".format(request.data))
+
+    response = handler.update(request)
+    if verbose:
+        print("Response={}".format(response))
+    return response
+
+# Returns True if the session should end after response is sent
+def is_final_response(request, response):
+    if response.is_error or response.complete:
+        if response.is_error:
+            print(request)
+            print(response)
+        return True
+    return False
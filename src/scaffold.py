@@ -9,6 +9,8 @@ from .frame import Frame
 from .handler import RequestHandler
 from .prefs import Preferences
 from .sequence import InterpolationType
+from .sequence import LinearSequence
+from .sequence import Sequence
 from .utils import InputType
 from .utils import OutputType
 
@@ -140,10 +142,14 @@ class Scaffold:
                     start_value = sequence.get_sample(start_time)
                     if init_to_default or start_value is None: # Use default
                         start_value = self.default_values.get_preference((data_type, channel))
-                    subsequence.insert(time=0, value=start_value)
+                    # Merged, rather than inserted, so long numeric channels stay arrays
+                    subsequence = Sequence.merge([Sequence([0], [start_value]), subsequence])
 
                 interpolation_type = self.interpolations.get_preference((data_type, channel))
-                subsequence = subsequence.interpolate(interpolation_type, res=utils.MILLISECOND)
+                if interpolation_type == InterpolationType.Linear: # Interpolated when sampled
+                    subsequence = LinearSequence.from_sequence(subsequence, res=utils.MILLISECOND)
+                else:
+                    subsequence = subsequence.interpolate(interpolation_type)
                 inputs[(data_type,channel)] = subsequence
         return inputs
 
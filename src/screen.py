@@ -1,7 +1,10 @@
+from collections import OrderedDict
 from collections import namedtuple
+import hashlib
 import numpy as np
-from PIL import Image
-import pytesseract
+from numpy.lib.stride_tricks import sliding_window_view
+import struct
+import weakref
 
 # width and height are width and height of fixed-width font
 # chars is map of codepoint to integer packing of bitmap
@@ -11,113 +14,293 @@ DEFAULT_IGNORED_CHARS = set(["-","_", ",", ".", "\"", "\'", "|", "`"]) # These a
 
 ScreenShape = namedtuple('ScreenShape', ['width', 'height'])  # In pixels
 
+TILE_SIZE = 8 # Screens are sent in tiles of 8 columns of one page (8x8 pixels)
+MAX_DELTA_DEPTH = 32 # Max tiles painted on top of a shared base before it's flattened
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8) # Lit bits per byte
+
+# Packs a 2D array of pixels into pages, like the OLED's memory: each byte holds 8 rows of
+# one column, top row in the MSB.  Bits past the last row are 0.
+# Returns (ceil(height/8), width) numpy array of uint8
+def pack_pixels(buff):
+    return np.packbits(np.asarray(buff) != 0, axis=0)
+
+# Inverse of pack_pixels
+# Returns (height, width) numpy array of uint8 (1 represents lit pixel)
+def unpack_pixels(pages, height):
+    return np.unpackbits(pages, axis=0, count=height)
+
+# Returns (ceil(height/8), ceil(width/8)) numpy array of bools, True for each tile (see
+# TILE_SIZE) that differs between two screens' packed pages (which must be the same shape)
+def changed_tiles(pages, other_pages):
+    diff = pages != other_pages
+    return np.logical_or.reduceat(diff, np.arange(0, diff.shape[1], TILE_SIZE), axis=1)
+
+# Returns the number of set bits in a numpy array of uint8
+def popcount(pages):
+    return int(POPCOUNT[pages].sum(dtype=np.int64))
+
 # Note: 0, 0 is considered top-left corner
 # Note: typically we'll talk in (x,y) coordinates, not (row, col)
+# Pixels are stored packed (see pack_pixels), 8 per byte, and comparisons work on the packed
+# pages directly.  Screens are copy-on-write: copy() and painted() share the packed pages,
+# storing only the painted rects on top of them.  A screen only gets its own (unpacked)
+# array when its buffer is accessed, which may then be modified in place.
 class Screen:
 
     # Specify EITHER buff (2D numpy array) or both width and height
     # width and height are measured in pixels
     def __init__(self, buff=None, width=None, height=None):
         if buff is not None:
-            self.buffer = np.copy(buff)
             self.shape = ScreenShape(width=buff.shape[1], height=buff.shape[0])
+            pages = pack_pixels(buff)
         else: # Assume width and height are provided
-            self.buffer = np.zeros((height, width), dtype=np.uint8)
             self.shape = ScreenShape(width=width, height=height)
+            pages = np.zeros(((height+7)//8, width), dtype=np.uint8)
+        self._set_pages(pages)
+
+    # Returns a Screen of shape (width, height) from packed pages (see pack_pixels)
+    @classmethod
+    def from_pages(cls, pages, width, height):
+        screen = cls.__new__(cls)
+        screen.shape = ScreenShape(width=width, height=height)
+        screen._set_pages(np.array(pages, dtype=np.uint8))
+        return screen
+
+    def _set_pages(self, pages):
+        pages.flags.writeable = False # Pages are shared, never modified
+        self._pages = pages
+        self._deltas = None # Linked list of painted rects: (previous deltas, x, y, rect)
+        self._depth = 0 # Length of self._deltas
+        self._buffer = None # Unpacked pixels owned by this screen, once buffer is accessed
+        self._digest = None # Cached result of digest(), while the pixels can't change
+        self.dirty = None # Tiles changed since the previous screen (see changed_tiles), if known
+
+    # Writable 2D numpy array of pixels, owned by this screen
+    # Once accessed, it holds the pixels (the packed pages are dropped)
+    @property
+    def buffer(self):
+        if self._buffer is None:
+            self._buffer = self._flatten()
+            self._pages = None
+            self._deltas = None
+            self._depth = 0
+            self._digest = None
+            self.dirty = None # Can't tell what will be modified
+        return self._buffer
+
+    # Returns the pixels as a 2D numpy array that must not be modified (it may be shared)
+    def _pixels(self):
+        if self._buffer is not None:
+            return self._buffer
+        return self._flatten()
+
+    # Returns a new array of the pixels, with all deltas painted on
+    def _flatten(self):
+        buff = unpack_pixels(self._pages, self.shape.height)
+        rects = []
+        node = self._deltas
+        while node is not None:
+            (node, x, y, rect) = node
+            rects.append((x, y, rect))
+        for (x, y, rect) in reversed(rects): # Oldest first
+            buff[y:y+rect.shape[0],x:x+rect.shape[1]] = rect
+        return buff
+
+    # Returns the packed pages of the pixels, which must not be modified (they may be shared)
+    def to_pages(self):
+        if self._buffer is not None:
+            return pack_pixels(self._buffer)
+        elif self._deltas is not None:
+            return pack_pixels(self._flatten())
+        return self._pages
+
+    # Returns a Screen sharing this screen's pixels (and deltas)
+    def _share(self):
+        if self._buffer is not None: # Our buffer may still change, so share a snapshot
+            return Screen.from_pages(pack_pixels(self._buffer), *self.shape)
+        other = Screen.__new__(Screen)
+        other.shape = self.shape
+        other._pages = self._pages
+        other._deltas = self._deltas
+        other._depth = self._depth
+        other._buffer = None
+        other._digest = self._digest
+        other.dirty = self.dirty
+        return other
 
     # paint rect (2D numpy array) onto buffer with top-left corner at x, y
     # Later: make this handle out-of-bounds issues
     def paint(self, rect, x, y):
         self.buffer[y:y+rect.shape[0],x:x+rect.shape[1]] = rect
 
+    # Returns a new Screen equal to this one with rect painted at x, y (see paint), sharing
+    # all unchanged pixels with this one
+    def painted(self, rect, x, y):
+        other = self._share()
+        if other._depth >= MAX_DELTA_DEPTH: # Keep materialization cheap
+            other._set_pages(other.to_pages())
+        rect = np.array(rect, dtype=np.uint8)
+        rect.flags.writeable = False
+        other._deltas = (other._deltas, x, y, rect)
+        other._depth += 1
+        other._digest = None
+        other.dirty = None
+        return other
+
+    # Returns a Screen equal to this one with tile (8x8 numpy array) painted on the tile at
+    # x, y (measured in tiles), and dirty marking that tile if it changed (see painted)
+    def painted_tile(self, tile, x, y):
+        left, top = TILE_SIZE*x, TILE_SIZE*y
+        tile = np.asarray(tile)[:self.shape.height-top,:self.shape.width-left] # Clip to screen
+        changed = not np.array_equal(self._tile_pages(x, y), pack_pixels(tile))
+        if changed:
+            other = self.painted(tile, TILE_SIZE*x, TILE_SIZE*y)
+        else: # Redrawn unchanged
+            other = self._share()
+        other.dirty = np.zeros(((self.shape.height+7)//8, (self.shape.width+7)//8), dtype=bool)
+        other.dirty[y, x] = changed
+        return other
+
+    # Returns the packed pages of the tile at x, y (measured in tiles, see painted_tile),
+    # without flattening: from the latest delta covering the tile, or the shared pages if no
+    # delta touches it (only deltas partly covering it need the pixels)
+    def _tile_pages(self, x, y):
+        left, top = TILE_SIZE*x, TILE_SIZE*y
+        right = min(left + TILE_SIZE, self.shape.width)
+        bottom = min(top + TILE_SIZE, self.shape.height)
+        if self._buffer is not None:
+            return pack_pixels(self._buffer[top:bottom,left:right])
+        node = self._deltas
+        while node is not None:
+            (node, rect_x, rect_y, rect) = node
+            rect_right, rect_bottom = rect_x + rect.shape[1], rect_y + rect.shape[0]
+            if rect_x >= right or rect_right <= left or rect_y >= bottom or rect_bottom <= top:
+                continue # Doesn't touch the tile
+            if rect_x <= left and rect_right >= right and rect_y <= top and rect_bottom >= bottom:
+                return pack_pixels(rect[top-rect_y:bottom-rect_y,left-rect_x:right-rect_x])
+            return pack_pixels(self.get_box(left, top, right-left, bottom-top))
+        return self._pages[y:y+1,left:right]
+
+    # Only unpacks the pages the box lies in
     def get_box(self, x, y, width, height):
-        return self.buffer[y:y+height,x:x+width]
+        if self._buffer is not None or self._deltas is not None:
+            return self._pixels()[y:y+height,x:x+width]
+        height = max(0, min(height, self.shape.height - y))
+        first_page = y//8
+        pages = self._pages[first_page:(y+height+7)//8,x:x+width]
+        offset = y - 8*first_page
+        return np.unpackbits(pages, axis=0, count=offset+height)[offset:]
+
+    # Returns (x, y, width, height) in pixels of the smallest rect holding all tiles changed since
+    # the previous screen (the whole screen if that's unknown), or None if nothing changed
+    def changed_region(self):
+        if self.dirty is None:
+            return (0, 0, self.shape.width, self.shape.height)
+        rows = np.flatnonzero(self.dirty.any(axis=1))
+        cols = np.flatnonzero(self.dirty.any(axis=0))
+        if len(rows) == 0:
+            return None
+        x, y = TILE_SIZE*cols[0], TILE_SIZE*rows[0]
+        width = min(TILE_SIZE*(cols[-1]+1), self.shape.width) - x
+        height = min(TILE_SIZE*(rows[-1]+1), self.shape.height) - y
+        return (int(x), int(y), int(width), int(height))
 
     def get_num_pixels_lit(self):
-        return sum(sum(self.buffer))
+        return popcount(self.to_pages())
 
     def height(self):
-        return self.buffer.shape[0]
+        return self.shape.height
 
     def width(self):
-        return self.buffer.shape[1]
+        return self.shape.width
 
     def __eq__(self, other):
-        return type(other) is Screen and np.array_equal(self.buffer, other.buffer)
+        if type(other) is not Screen or self.shape != other.shape:
+            return False
+        if (self._buffer is None and other._buffer is None and self._pages is other._pages
+                and self._deltas is other._deltas):
+            return True # Shared pixels
+        if self._buffer is None and other._buffer is None: # Digests are cached
+            return self.digest() == other.digest()
+        return np.array_equal(self.to_pages(), other.to_pages())
 
     def __repr__(self):
-        return repr(self.buffer)
+        return repr(self._pixels())
 
     def copy(self):
-        return Screen(buff=self.buffer)
+        return self._share()
+
+    # Pickles store the packed pages and deltas, so shared pixels are only saved once
+    def __getstate__(self):
+        if self._buffer is not None:
+            return {"shape": self.shape, "pages": pack_pixels(self._buffer), "deltas": None,
+                    "depth": 0, "dirty": None}
+        return {"shape": self.shape, "pages": self._pages, "deltas": self._deltas,
+                "depth": self._depth, "dirty": self.dirty}
+
+    def __setstate__(self, state):
+        self.shape = ScreenShape(*state["shape"])
+        if "buffer" in state: # Saved before screens were packed
+            self._set_pages(pack_pixels(state["buffer"]))
+        else:
+            self._set_pages(state["pages"])
+            self._deltas = state["deltas"]
+            self._depth = state["depth"]
+            self.dirty = state["dirty"]
 
     # Creates a PIL Image from the buffer.  If save is specified, calles Image.save()
     # with that argument.
     # Returns an Image
     def to_image(self, save=None):
-        im = Image.fromarray(self.buffer*255, "L")
+        from PIL import Image # Only for images
+        im = Image.fromarray(self._pixels()*255, "L")
         if save:
             im.save(save)
         return im
 
     # Extracts text out of the buffer, using a given monospace font (basically, a set of bitmaps)
-    # font: namedtuple Font (see above)
+    # font: namedtuple Font (see above), or a CompiledFont
     # ignored_chars: set of characters to ignore.  If None, defaults are used.
     # line_delimeter: character inserted between lines
     # Note that lines can overlap in height.  Also, whitespace is stripped off start and end
     # of each line, and whitespace within a single line is reduced to a single space
     def extract_text(self, font, *, ignored_chars=None, line_delimeter='\n'):
-        if ignored_chars is None:
-            ignored_chars = DEFAULT_IGNORED_CHARS
-        lut = {}
-        for (key, val) in font.chars.items():
-            lut[val] = key # Inverted chars dictionary
-        labels = self.get_box_values(font.width, font.height)
-        text = ""
-        for row in labels:
-            line = ""
-            for elt in row:
-                if elt in lut:
-                    char = chr(lut[elt])
-                    if char not in ignored_chars:
-                        line += char
-            line = line.strip() # Remove leading and trailing whitespace
-            if " " in ignored_chars:
-                line = "".join(line.split()) # Remove internal whitespace entirely
-            else:
-                line = " ".join(line.split()) # Remove duplicate internal spaces
-            if len(line) > 0:
-                text += line
-                if line_delimeter:
-                    text += line_delimeter
-        return text.strip() # strip removes trailing newline
-
-    # Return 2D list of same shape as buffer, elements are ints
+        return compile_font(font).extract_text(self, ignored_chars=ignored_chars,
+                                               line_delimeter=line_delimeter)
+
+    # Returns bytes identifying the screen's contents: equal screens have equal digests
+    # Cached unless the buffer has been accessed (it may be modified in place)
+    def digest(self):
+        if self._digest is not None:
+            return self._digest
+        h = hashlib.blake2b(digest_size=16)
+        h.update(struct.pack('<II', *self.shape))
+        h.update(np.ascontiguousarray(self.to_pages()).data)
+        if self._buffer is not None:
+            return h.digest()
+        self._digest = h.digest()
+        return self._digest
+
+    # Return 2D numpy integer array of same shape as buffer
     # Each element in the "box value" of the box with top-left corner at that position
+    # (pixels past the right and bottom edges count as unlit)
     # "box value" is bit packing, column by column, with MSB in top-left
-    # Takes about 20ms on a 128x64 screen with a 5x7 box
+    # Elements are uint64 for boxes of up to 64 pixels, otherwise Python ints (dtype object)
     def get_box_values(self, box_width, box_height):
-        labels = [[0 for x in range(self.shape.width)] for y in range(self.shape.height)]
-
-        # First, make each elt of labels the "column" hash for the box column rooted there
-        for x in range(self.shape.width):
-            rolling_sum = 0
-            for y in range(self.shape.height + box_height - 1):
-                rolling_sum = (rolling_sum << 1)%(2**box_height)
-                if y < self.shape.height:
-                    rolling_sum += self.buffer[y,x]
-                if y >= box_height-1:
-                    labels[y-box_height+1][x] = rolling_sum
-
-        # Second, sum across the rows to make each label the total "box" hash
-        for y in range(self.shape.height):
-            rolling_sum = 0
-            for x in range(self.shape.width + box_width - 1):
-                rolling_sum = (rolling_sum << box_height)%(2**(box_height*box_width))
-                if x < self.shape.width:
-                    rolling_sum += labels[y][x]
-                if x >= box_width-1:
-                    labels[y][x-box_width+1] = rolling_sum
+        dtype = np.uint64 if box_width*box_height <= 64 else object
+        height, width = self.shape.height, self.shape.width
+        padded = np.zeros((height + box_height - 1, width + box_width - 1), dtype=dtype)
+        padded[:height,:width] = self._pixels()
+
+        # First, pack each box column rooted at each position, top pixel first
+        columns = np.zeros((height, width + box_width - 1), dtype=dtype)
+        for y in range(box_height):
+            columns = (columns << 1) | padded[y:y+height,:]
+
+        # Second, pack the columns of each box, left column first
+        labels = np.zeros((height, width), dtype=dtype)
+        for x in range(box_width):
+            labels = (labels << box_height) | columns[:,x:x+width]
 
         return labels
 
@@ -128,27 +311,173 @@ class Screen:
     def get_num_matching_pixels(self, other, *, shift=None, left=0, right=0, up=0, down=0):
         if shift is not None:
             left = right = up = down = shift
-
+        self.check_comparable(other)
+        if left == right == up == down == 0:
+            return self.shape.width*self.shape.height - popcount(self.to_pages() ^ other.to_pages())
+        return int(self.get_shift_matches(other, left=left, right=right, up=up, down=down).max())
+
+    # Returns 2D numpy array of the number of matching pixels for every allowed shift (see
+    # get_num_matching_pixels), indexed [y_shift+up, x_shift+left]
+    # All shifts are scored in one pass: pixels are compared 8 at a time, by XOR of the packed
+    # pages of every shifted window of this screen with the other screen's, then a popcount
+    def get_shift_matches(self, other, *, left=0, right=0, up=0, down=0):
+        self.check_comparable(other)
+        width, height = self.shape
+        padded_buffer = np.zeros((height+up+down, width+right+left), dtype=np.uint8)
+        padded_buffer[up:up+height,left:left+width] = self._pixels()
+
+        rows = sliding_window_view(padded_buffer, height, axis=0) # (y shift, column, row)
+        pages = np.packbits(rows, axis=2) # (y shift, column, page)
+        windows = sliding_window_view(pages, width, axis=1) # (y shift, x shift, page, column)
+        diff = windows ^ other.to_pages()
+        return width*height - POPCOUNT[diff].sum(axis=(2,3), dtype=np.int64)
+
+    # Returns True if get_num_matching_pixels (with the same arguments) would be >= num, but
+    # only scores the shifts if the unshifted screens don't already match well enough and
+    # there are enough lit pixels for any shift to
+    def matches_at_least(self, other, num, *, shift=None, left=0, right=0, up=0, down=0):
+        if shift is not None:
+            left = right = up = down = shift
+        self.check_comparable(other)
+        total = self.shape.width*self.shape.height
+        pages, other_pages = self.to_pages(), other.to_pages()
+        if total - popcount(pages ^ other_pages) >= num:
+            return True # Unshifted is good enough
+        if left == right == up == down == 0:
+            return False
+
+        # Shifting can only lose lit pixels, so at least this many of the other screen's lit
+        # pixels can never be matched
+        unmatchable = max(0, popcount(other_pages) - popcount(pages))
+        if total - unmatchable < num:
+            return False
+        matches = self.get_shift_matches(other, left=left, right=right, up=up, down=down)
+        return bool(matches.max() >= num)
+
+    # Raises ValueError unless other is a Screen of the same shape
+    def check_comparable(self, other):
         if type(other) is not Screen or self.shape != other.shape:
             raise ValueError("Invalid argument: other={}".format(other))
 
-        padded_buffer = np.zeros((self.height()+up+down, self.width()+right+left), dtype=np.uint8)
-        padded_buffer[up:up+self.height(),left:left+self.width()] = self.buffer
 
-        best = 0
-        for x_shift in range(-left,right+1):
-            for y_shift in range(-up,down+1):
-                x_min = x_shift + left
-                x_max = x_min + self.width()
-                y_min = y_shift + up
-                y_max = y_min + self.height()
-                diff = np.mod(padded_buffer[y_min:y_max, x_min:x_max] + other.buffer, 2) # XOR
-                num_matching_pixels = self.width() * self.height() - sum(sum(diff))
-                if num_matching_pixels > best:
-                    best = num_matching_pixels
+# Interns Screens by content (see Screen.digest), so identical screens share one array of
+# packed pages.  Pages are only remembered while some screen still uses them.
+# Screens with deltas (see Screen.painted) aren't interned: they already share their base's
+# pages, and interning would store a flattened copy of every one of them.
+class ScreenPool:
+    def __init__(self):
+        self.pages = weakref.WeakValueDictionary() # Maps digest to packed pages
+
+    # Returns a Screen equal to screen and sharing pages with all equal screens interned before
+    # (screen itself, if it already does, or it has deltas)
+    def intern(self, screen):
+        if screen._deltas is not None:
+            return screen
+        digest = screen.digest()
+        pages = self.pages.get(digest)
+        if pages is None:
+            pages = screen.to_pages()
+            self.pages[digest] = pages
+        if screen._buffer is None and screen._pages is pages:
+            return screen
+        interned = Screen.__new__(Screen)
+        interned.shape = screen.shape
+        interned._set_pages(pages)
+        interned._digest = digest
+        interned.dirty = screen.dirty
+        return interned
+
+    def __len__(self):
+        return len(self.pages)
+
+TEXT_CACHE_SIZE = 4096 # Max texts a CompiledFont remembers
+
+# A Font prepared for extracting text from many screens: the inverted chars table (box value
+# to character) is built once, box values are matched against all glyphs at once so only rows
+# and columns with characters are visited, and extracted texts are cached by screen digest
+class CompiledFont:
+    def __init__(self, font):
+        self.width = font.width
+        self.height = font.height
+        self.lut = {}
+        for (key, val) in font.chars.items():
+            self.lut[val] = chr(key) # Inverted chars dictionary
+        self.dtype = np.uint64 if font.width*font.height <= 64 else object
+        self.glyph_sets = {} # Maps ignored chars to (char box values, whitespace box values)
+        self.cache = {} # Maps (screen digest, ignored chars, line delimeter) to text
+
+    # Returns (array of box values of characters to extract, array of box values of
+    # whitespace separating them, or None if whitespace is removed entirely)
+    def glyphs(self, ignored_chars):
+        if ignored_chars not in self.glyph_sets:
+            chars = [val for (val, char) in self.lut.items()
+                     if char not in ignored_chars and not char.isspace()]
+            spaces = [val for (val, char) in self.lut.items()
+                      if char not in ignored_chars and char.isspace()]
+            if " " in ignored_chars:
+                spaces = None
+            else:
+                spaces = np.array(spaces, dtype=self.dtype)
+            self.glyph_sets[ignored_chars] = (np.array(chars, dtype=self.dtype), spaces)
+        return self.glyph_sets[ignored_chars]
 
-        return best
+    # Same as Screen.extract_text
+    def extract_text(self, screen, *, ignored_chars=None, line_delimeter='\n'):
+        if ignored_chars is None:
+            ignored_chars = DEFAULT_IGNORED_CHARS
+        ignored_chars = frozenset(ignored_chars)
+        key = (screen.digest(), ignored_chars, line_delimeter)
+        if key not in self.cache:
+            if len(self.cache) >= TEXT_CACHE_SIZE:
+                self.cache.clear()
+            self.cache[key] = self.find_text(screen, ignored_chars, line_delimeter)
+        return self.cache[key]
+
+    def find_text(self, screen, ignored_chars, line_delimeter):
+        char_values, space_values = self.glyphs(ignored_chars)
+        labels = screen.get_box_values(self.width, self.height)
+        char_hits = np.isin(labels, char_values)
+        text = ""
+        for y in np.flatnonzero(char_hits.any(axis=1)): # Other rows would be empty lines
+            row = labels[y]
+            xs = np.flatnonzero(char_hits[y])
+            if space_values is not None: # Number of spaces left of each character
+                spaces_before = np.searchsorted(np.flatnonzero(np.isin(row, space_values)), xs)
+            values = row[xs].tolist() # Python ints, whether uint64 or object
+            line = ""
+            for i in range(len(xs)):
+                if i > 0 and space_values is not None and spaces_before[i] > spaces_before[i-1]:
+                    line += " " # Whitespace between characters is reduced to a single space
+                line += self.lut[values[i]]
+            text += line
+            if line_delimeter:
+                text += line_delimeter
+        return text.strip() # strip removes trailing newline
 
+COMPILED_FONTS_SIZE = 8 # Max Fonts compile_font remembers
+COMPILED_FONTS = OrderedDict() # Maps id(font) to (font, CompiledFont), least recently used first
+
+# Returns the CompiledFont for font (compiled once per Font object, so don't modify its chars)
+# Only the most recently used fonts are remembered (Fonts are tuples, so they can't hold it
+# themselves, or be weakly referenced)
+def compile_font(font):
+    if isinstance(font, CompiledFont):
+        return font
+    entry = COMPILED_FONTS.get(id(font))
+    if entry is None or entry[0] is not font:
+        entry = (font, CompiledFont(font))
+        COMPILED_FONTS[id(font)] = entry # Holds font, so its id can't be reused meanwhile
+        if len(COMPILED_FONTS) > COMPILED_FONTS_SIZE:
+            COMPILED_FONTS.popitem(last=False)
+    COMPILED_FONTS.move_to_end(id(font))
+    return entry[1]
+
+# Returns list of texts extracted from screens (see Screen.extract_text), extracting the text
+# of identical screens only once
+def extract_texts(screens, font, *, ignored_chars=None, line_delimeter='\n'):
+    font = compile_font(font)
+    return [font.extract_text(screen, ignored_chars=ignored_chars,
+                              line_delimeter=line_delimeter) for screen in screens]
 
 # Returns a function, f, that takes in two Screens
 #   f returns True if num matching pixels is >= num, False otherwise
@@ -157,16 +486,16 @@ class Screen:
 # refer to movement of second Screen relative to first.
 def pixel_match_min(num, *, shift=None, left=0, right=0, up=0, down=0):
     def f(expected, actual):
-        matches = expected.get_num_matching_pixels(actual, shift=shift, left=left, up=up, down=down)
-        return (matches >= num)
+        return expected.matches_at_least(actual, num, shift=shift, left=left, right=right,
+                                         up=up, down=down)
     return f
 
 # Complement of the above function, f returns True if num errors <= num
 def pixel_error_max(num, *, shift=None, left=0, right=0, up=0, down=0):
     def f(expected, actual):
-        matches = expected.get_num_matching_pixels(actual, shift=shift, left=left, up=up, down=down)
-        errors = expected.height()*expected.width() - matches
-        return (errors <= num)
+        min_matches = expected.height()*expected.width() - num
+        return expected.matches_at_least(actual, min_matches, shift=shift, left=left,
+                                         right=right, up=up, down=down)
     return f
 
 # This function is a nice one for comparing screen closeness.  Like the ones above, it
@@ -178,11 +507,11 @@ def pixel_error_max(num, *, shift=None, left=0, right=0, up=0, down=0):
 # are perfect matches
 def relatively_close(ratio, *, shift=None, left=0, right=0, up=0, down=0):
     def f(expected, actual):
-        expected_lit = sum(sum(expected.buffer))
+        expected_lit = expected.get_num_pixels_lit()
         expected_off = expected.width() * expected.height() - expected_lit
         cutoff = expected_off + ratio*expected_lit
-        matches = expected.get_num_matching_pixels(actual, shift=shift, left=left, up=up, down=down)
-        return (matches >= cutoff)
+        return expected.matches_at_least(actual, cutoff, shift=shift, left=left, right=right,
+                                         up=up, down=down)
     return f
 
 
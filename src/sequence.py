@@ -1,7 +1,10 @@
 import bisect
+import math
 from collections import namedtuple
 from enum import Enum
 
+MIN_ARRAY_LENGTH = 1024 # Shorter sequences are as quick with lists (see Sequence.to_arrays)
+
 TimedValue = namedtuple('TimedValue', ['time', 'value'])
 
 class InterpolationType(Enum):
@@ -10,24 +13,192 @@ class InterpolationType(Enum):
     End = 2 # Position samples at end of range
     Linear = 3 # Interpolate linearly between samples
 
+# Returns True if all values are ints or floats (so they fit in a numpy array)
+def is_numeric(values):
+    return all(type(value) in (int, float) for value in values)
+
+# Returns a hashable key for value, where equal values have equal keys: values with a digest
+# method (e.g. Screens, which are unhashable) are keyed by it, other hashable values by
+# themselves, and unhashable values all share the key None
+def hash_key(value):
+    if type(value) in (int, float, str):
+        return value
+    digest = getattr(value, "digest", None)
+    if digest is not None:
+        return (type(value), digest())
+    try:
+        hash(value)
+    except TypeError:
+        return None
+    return value
+
+# Returns profile (see Sequence.profile_interval) of numpy arrays of times and values, for an
+# interval ending at end and lasting duration: the portions of equal values are summed with
+# one bincount, which adds them in order like the list version, so the results are identical
+def profile_arrays(times, values, end, duration):
+    import numpy as np
+    next_times = np.append(times[1:], end)
+    portions = (next_times - times)/duration
+    unique, first, inverse = np.unique(values, return_index=True, return_inverse=True)
+    totals = np.bincount(inverse.ravel(), weights=portions, minlength=len(unique))
+    order = np.argsort(first, kind="stable") # Order first seen, like the list version
+    profile = list(zip(unique[order].tolist(), totals[order].tolist()))
+    return sorted(profile, key=lambda val: val[1], reverse=True)
+
+# The points of a sequence grouped by value (equal values, by hash_key and then ==, are in one
+# group), so that long ranges of points can be profiled with numpy whatever the values are:
+# each point's portion is added to its group's total with one bincount, which adds them in
+# order like Sequence.profile_range, so the results are identical.  Finding which groups are
+# in a range, and where each is first seen, takes a bisection per group: points are also
+# stored in order of (group, index), keyed by group*len(sequence)+index, so one sorted array
+# of keys serves all the groups.
+class ValueGroups:
+    def __init__(self, sequence):
+        import numpy as np
+        self.times = np.asarray(sequence.times)
+        self.values = sequence.values
+        self.is_array = sequence.is_array
+        n = len(sequence)
+        if self.is_array:
+            _, inverse = np.unique(self.values, return_inverse=True)
+            self.groups = inverse.ravel()
+        else:
+            groups = []
+            first_groups = {} # Maps hash_key of value to its first group
+            next_groups = [] # Next group with the same hash_key, if any
+            group_values = []
+            for value in self.values:
+                key = hash_key(value)
+                g = first_groups.get(key)
+                if g is None:
+                    g = first_groups[key] = len(group_values)
+                    group_values.append(value)
+                    next_groups.append(None)
+                else:
+                    while value != group_values[g]: # Keys collide, or values are unhashable
+                        if next_groups[g] is None:
+                            next_groups[g] = len(group_values)
+                            group_values.append(value)
+                            next_groups.append(None)
+                        g = next_groups[g]
+                groups.append(g)
+            self.groups = np.array(groups, dtype=np.int64)
+        self.num_groups = int(self.groups.max()) + 1 if n > 0 else 0
+        keys = self.groups*n + np.arange(n)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    # Returns profile (see Sequence.profile_range) of interval from start to end, given the
+    # indices of its points
+    def profile(self, start_index, end_index, start, end):
+        import numpy as np
+        n = len(self.times)
+        group_keys = np.arange(self.num_groups)*n
+        firsts = self.keys.searchsorted(group_keys + start_index) # Positions in self.order
+        present = np.flatnonzero(firsts < self.keys.searchsorted(group_keys + end_index))
+        first_indices = self.order[firsts[present]].tolist() # Where each group is first seen
+
+        times = np.append(max(self.times[start_index], start), # Bound first t
+                          self.times[start_index+1:end_index])
+        next_times = np.append(self.times[start_index+1:end_index], end)
+        portions = (next_times - times)/(end-start)
+        totals = np.bincount(self.groups[start_index:end_index], weights=portions,
+                             minlength=self.num_groups)[present].tolist()
+        if self.is_array:
+            values = self.values[first_indices].tolist()
+        else:
+            values = [self.values[i] for i in first_indices]
+        profile = sorted(zip(first_indices, values, totals), key=lambda val: (-val[2], val[0]))
+        return [(value, portion) for (_, value, portion) in profile]
+
+# Sequences of numbers (e.g. IMU channels, which can be hundreds of thousands of samples long)
+# can be backed by numpy arrays instead of lists (see from_arrays), so queries are vectorized.
+# Other values (e.g. Screens) stay in lists.  The API is the same, and values come out as
+# Python numbers either way.  numpy is only imported by array-backed sequences.
 class Sequence:
     # times must be list of unique increasing integers
     # values is times associated with those times
     def __init__(self, times=None, values=None):
-        if values:
+        if values is not None and len(values) > 0:
             self.times = times
             self.values = values
         else:
             self.times = []
             self.values = []
 
+    # Returns a Sequence backed by numpy arrays of times and values (which must be numbers)
+    @classmethod
+    def from_arrays(cls, times, values):
+        import numpy as np
+        seq = cls()
+        if len(values) > 0:
+            seq.times = np.asarray(times)
+            seq.values = np.asarray(values)
+        return seq
+
+    # Returns a Sequence of times and values (lists, or numpy arrays for an array-backed one) in
+    # any order, sorted with one stable sort, so points with equal times keep their order.
+    # Sorting is linear if they're already in order, and merges runs that are.
+    @classmethod
+    def from_unsorted(cls, times, values):
+        if type(times) is not list or type(values) is not list:
+            import numpy as np
+            order = np.argsort(times, kind="stable")
+            return cls.from_arrays(np.asarray(times)[order], np.asarray(values)[order])
+        order = sorted(range(len(times)), key=times.__getitem__)
+        return cls([times[i] for i in order], [values[i] for i in order])
+
+    # Returns a Sequence of all the points of sequences (each sorted), where points with equal
+    # times are in the order of sequences.  Array-backed if any of sequences is and the
+    # values of the rest are numbers.
+    @classmethod
+    def merge(cls, sequences):
+        sequences = [seq for seq in sequences if len(seq) > 0]
+        if (any(seq.is_array for seq in sequences)
+            and all(seq.is_array or is_numeric(seq.values) for seq in sequences)):
+            import numpy as np
+            times = np.concatenate([np.asarray(seq.times) for seq in sequences])
+            values = np.concatenate([np.asarray(seq.values) for seq in sequences])
+            return cls.from_unsorted(times, values)
+        times = []
+        values = []
+        for seq in sequences:
+            seq = seq.copy().to_lists()
+            times.extend(seq.times)
+            values.extend(seq.values)
+        return cls.from_unsorted(times, values)
+
+    # Converts to numpy arrays if all values are numbers (see from_arrays), returns self
+    def to_arrays(self):
+        if not self.is_array and len(self) > 0 and is_numeric(self.values):
+            seq = Sequence.from_arrays(self.times, self.values)
+            self.times = seq.times
+            self.values = seq.values
+        return self
+
+    # True if backed by numpy arrays
+    @property
+    def is_array(self):
+        return type(self.times) is not list
+
+    # Back to lists, before changing the sequence in place
+    def to_lists(self):
+        if self.is_array:
+            self.times = self.times.tolist()
+            self.values = self.values.tolist()
+        return self
+
     # No sorting, we assume caller only calls this with increasing times
     def append(self, time, value):
+        self.to_lists()
         self.times.append(time)
         self.values.append(value)
 
     # Returns latest value with .time <= time, or None if no value exists with .time <= time
     def get_sample(self, time):
+        if self.is_array:
+            index = int(self.times.searchsorted(time+0.0001, side="right")) - 1
+            return None if index < 0 else self.values[index].item()
         index = bisect.bisect(self.times, time+0.0001) # +0.0001 to break ties
         index -= 1
         if index < 0:
@@ -36,6 +207,16 @@ class Sequence:
             return self.values[index]
 
     def get_samples(self, start_time, num_samples, period):
+        if self.is_array:
+            import numpy as np
+            if len(self) == 0 or start_time < self.times[0]:
+                return None # No inputs before start_time
+            # Sample times accumulate period like the loop below, so they round the same way
+            steps = np.full(num_samples, period, dtype=np.result_type(start_time, period))
+            steps[:1] = start_time
+            indices = self.times.searchsorted(np.cumsum(steps), side="right") - 1
+            return self.values[indices].tolist()
+
         index = bisect.bisect(self.times, start_time)
         index -= 1
         if index < 0:
@@ -58,21 +239,33 @@ class Sequence:
         if start_time >= end_time: # To avoid weird edge cases
             return Sequence()
 
-        start_index = bisect.bisect(self.times, start_time)
+        if self.is_array:
+            start_index = int(self.times.searchsorted(start_time, side="right"))
+        else:
+            start_index = bisect.bisect(self.times, start_time)
         if start_index > 0:
             if include_start_sample:
                 start_index -= 1 # include lead-in value
             elif start_time==self.times[start_index-1]: # start_time is in self.times
                 start_index -= 1 # include exact start, even if not including a lead-in
 
-        end_index = bisect.bisect(self.times, end_time)
+        if self.is_array:
+            end_index = int(self.times.searchsorted(end_time, side="right"))
+        else:
+            end_index = bisect.bisect(self.times, end_time)
         if end_index > 0 and end_time==self.times[end_index-1]: # end_time is in self.times
             end_index -= 1 # exclude exact end
 
         times = self.times[start_index:end_index]
+        values = self.values[start_index:end_index]
+        if self.is_array:
+            import numpy as np
+            if len(times) > 0 and times[0] < start_time: # Don't change self.times (a view)
+                times = np.append(start_time, times[1:]) # Floats if start_time is one
+            return Sequence.from_arrays(times, values)
         if len(times) > 0:
             times[0] = max(times[0], start_time) # Bound first t (useful if include_start_sample)
-        return Sequence(times=times, values=self.values[start_index:end_index])
+        return Sequence(times=times, values=values)
 
     # Finds all unique values in the interval, and the portion of the interval those values
     # occurred
@@ -80,40 +273,120 @@ class Sequence:
     # by portion in descending order.  Portion will always be between 0 and 1
     # Undefined time in the interval still count 
     def profile_interval(self, interval):
-        (start, end) = interval
-        subseq = self.get_subsequence(start, end, include_start_sample=True)
-
-        profile = []
-        for i in range(len(subseq)):
-            (time, value) = subseq[i]
-            if (i+1) < len(subseq):
-                next_time = subseq[i+1].time
+        return self.profile_intervals([interval])[0]
+
+    # Returns [self.profile_interval(interval) for interval in intervals], but sweeps through
+    # the sequence in order of start (and end) time, rather than searching it for each interval.
+    # If walking through every interval's points would take longer than one pass over the
+    # sequence (e.g. many long, overlapping intervals), its values are grouped once (see
+    # ValueGroups), and intervals with more points than there are groups are profiled from them.
+    def profile_intervals(self, intervals):
+        by_start = sorted(range(len(intervals)), key=lambda i: intervals[i][0])
+        by_end = sorted(range(len(intervals)), key=lambda i: intervals[i][1])
+        start_indices = [None]*len(intervals)
+        end_indices = [None]*len(intervals)
+        for (i, index) in zip(by_start, self.bisect_sorted([intervals[i][0] for i in by_start])):
+            start_indices[i] = index
+        for (i, index) in zip(by_end, self.bisect_sorted([intervals[i][1] for i in by_end])):
+            end_indices[i] = index
+
+        ranges = []
+        for ((start, end), start_index, end_index) in zip(intervals, start_indices, end_indices):
+            if start >= end: # To avoid weird edge cases
+                ranges.append((0, 0, start, end))
+                continue
+            if start_index > 0:
+                start_index -= 1 # include lead-in value
+            if end_index > 0 and end==self.times[end_index-1]: # end is in self.times
+                end_index -= 1 # exclude exact end
+            ranges.append((start_index, end_index, start, end))
+
+        groups = None
+        if sum(max(j-i, 0) for (i, j, _, _) in ranges) > len(self): # Walking would take longer
+            groups = ValueGroups(self)
+        profiles = []
+        for (start_index, end_index, start, end) in ranges:
+            if start_index >= end_index:
+                profiles.append([])
+            elif groups is not None and end_index-start_index > groups.num_groups:
+                profiles.append(groups.profile(start_index, end_index, start, end))
             else:
-                next_time = end
+                profiles.append(self.profile_range(start_index, end_index, start, end))
+        return profiles
+
+    # Returns [bisect.bisect(self.times, t) for t in times], where times are in increasing
+    # order, so each search can start where the last one ended
+    def bisect_sorted(self, times):
+        if self.is_array:
+            return self.times.searchsorted(times, side="right").tolist()
+        indices = []
+        index = 0
+        for t in times:
+            index = bisect.bisect(self.times, t, index)
+            indices.append(index)
+        return indices
+
+    # Returns profile (see profile_interval) of interval from start to end, given the indices
+    # of its points (the first of which may come before start)
+    def profile_range(self, start_index, end_index, start, end):
+        if start_index >= end_index:
+            return []
+        times = self.times[start_index:end_index]
+        values = self.values[start_index:end_index]
+        if self.is_array:
+            import numpy as np
+            if times[0] < start: # Bound first t, without changing self.times (a view)
+                times = np.append(start, times[1:])
+            return profile_arrays(times, values, end, end-start)
+        times[0] = max(times[0], start) # Bound first t
+
+        profile = [] # [value, portion, index of next value with same key], in order first seen
+        first_indices = {} # Maps hash_key of value to index in profile of first value with it
+        next_times = times[1:] + [end]
+        for (time, next_time, value) in zip(times, next_times, values):
             portion = (next_time-time)/(end-start)
 
-            is_repeat = False
-            for j in range(len(profile)):
-                (other_value, other_portion) = profile[j]
-                if value == other_value: # Accumulate with already seen instance
-                    is_repeat = True
-                    profile[j] = (other_value, other_portion + portion)
+            key = hash_key(value)
+            j = first_indices.get(key)
+            if j is None:
+                first_indices[key] = len(profile)
+                profile.append([value, portion, None])
+                continue
+            while True: # Usually found at once, unless keys collide or values are unhashable
+                entry = profile[j]
+                if value == entry[0]: # Accumulate with already seen instance
+                    entry[1] += portion
                     break
-
-            if not is_repeat: # Need to add a new element to profile
-                profile.append((value, portion))
+                elif entry[2] is None: # Need to add a new element to profile
+                    entry[2] = len(profile)
+                    profile.append([value, portion, None])
+                    break
+                j = entry[2]
+        profile = [(value, portion) for (value, portion, _) in profile]
         return sorted(profile, key=lambda val: val[1], reverse=True)
 
     # Inserta a point into the sequence, returns self
     def insert(self, time, value):
+        self.to_lists()
         index = bisect.bisect(self.times, time)
         self.times.insert(index, time)
         self.values.insert(index, value)
         return self
 
+    # Inserts points at sorted times (after any existing points at equal times), returns self
+    # Quicker than calling insert for each point, which moves the later points every time
+    def insert_many(self, times, values):
+        merged = Sequence.merge([self, Sequence(times, values)])
+        self.times = merged.times
+        self.values = merged.values
+        return self
+
     # Shifts this sequence, returns self
     def shift(self, time_shift):
-        self.times = [(t+time_shift) for t in self.times]
+        if self.is_array:
+            self.times = self.times + time_shift
+        else:
+            self.times = [(t+time_shift) for t in self.times]
         return self
 
     # Removes duplicates, returns itself
@@ -121,6 +394,12 @@ class Sequence:
     def remove_duplicates(self):
         if len(self) < 1:
             return Sequence()
+        if self.is_array:
+            import numpy as np
+            keep = np.append(True, self.values[1:] != self.values[:-1])
+            self.times = self.times[keep]
+            self.values = self.values[keep]
+            return self
         last_value = self.values[0]
         times = [self.times[0]]
         values = [self.values[0]]
@@ -141,6 +420,12 @@ class Sequence:
         
         if interpolation_type == InterpolationType.Start: # No need to do anything
             return self.copy()
+        elif interpolation_type == InterpolationType.Mid and self.is_array:
+            import numpy as np
+            times = np.append(self.times[:1], (self.times[:-1] + self.times[1:])//2)
+            return Sequence.from_arrays(times, self.values.copy())
+        elif interpolation_type == InterpolationType.End and self.is_array:
+            return Sequence.from_arrays(self.times[:-1].copy(), self.values[1:].copy())
         elif interpolation_type == InterpolationType.Mid:
             times = [self.times[0]]
             for i in range(1,len(self)):
@@ -170,13 +455,20 @@ class Sequence:
             return self.copy()
 
     def copy(self):
+        if self.is_array:
+            return Sequence.from_arrays(self.times.copy(), self.values.copy())
         return Sequence(times=self.times[:], values=self.values[:])
 
     def __getitem__(self, key):  # To allow for list-style access
         if type(key) is slice:
             times = self.times[key]
             values = self.values[key]
+            if self.is_array:
+                times = times.tolist()
+                values = values.tolist()
             return [TimedValue(time=time, value=value) for (time, value) in zip(times,values)]
+        elif self.is_array:
+            return TimedValue(time=self.times[key].item(), value=self.values[key].item())
         else:
             return TimedValue(time=self.times[key], value=self.values[key])
 
@@ -184,7 +476,75 @@ class Sequence:
         return len(self.times)  # Should be same as len(self.values)
 
     def __eq__(self, other):
+        if self.is_array and other.is_array:
+            import numpy as np
+            return (np.array_equal(self.times, other.times)
+                    and np.array_equal(self.values, other.values))
+        elif self.is_array or other.is_array: # Compare as lists
+            return self.copy().to_lists() == other.copy().to_lists()
         return self.times == other.times and self.values == other.values
 
     def __repr__(self):
-        return "Sequence: times={}, values={}".format(self.times, self.values)
\ No newline at end of file
+        if self.is_array:
+            return "Sequence: times={}, values={}".format(self.times.tolist(),
+                                                          self.values.tolist())
+        return "Sequence: times={}, values={}".format(self.times, self.values)
+
+# Linear interpolation (see Sequence.interpolate) computed on demand: only the original points
+# are stored, rather than one point per res, and get_sample/get_samples return what they would
+# on the interpolated sequence.  Frame inputs only need those, so long frames of e.g. IMU data
+# stay small in testcase files.  Other methods see just the original points (see materialize).
+class LinearSequence(Sequence):
+    def __init__(self, times=None, values=None, res=1):
+        super().__init__(times, values)
+        self.res = res
+
+    # Returns LinearSequence interpolating the points of sequence
+    @classmethod
+    def from_sequence(cls, sequence, res):
+        sequence = sequence.copy().to_lists()
+        return cls(sequence.times, sequence.values, res)
+
+    # Returns the interpolated Sequence, with every point
+    def materialize(self):
+        return Sequence(self.times, self.values).interpolate(InterpolationType.Linear,
+                                                             res=self.res)
+
+    # Returns value of latest interpolated point with .time <= time, or None if there isn't one
+    def value_at(self, time):
+        index = bisect.bisect(self.times, time) - 1
+        if index < 0:
+            return None
+        elif index == len(self) - 1: # Last point isn't interpolated
+            return self.values[index]
+        start_time, start_val = self[index]
+        end_time, end_val = self[index+1]
+        time = start_time + math.floor((time-start_time)/self.res)*self.res # Round down to res
+        frac = (time-start_time)/(end_time-start_time)
+        return frac*(end_val-start_val) + start_val
+
+    def get_sample(self, time):
+        return self.value_at(time+0.0001) # +0.0001 to break ties, like Sequence.get_sample
+
+    def get_samples(self, start_time, num_samples, period):
+        if self.value_at(start_time) is None:
+            return None # No inputs before start_time
+        samples = []
+        t = start_time
+        for i in range(num_samples):
+            samples.append(self.value_at(t))
+            t += period
+        return samples
+
+    def copy(self):
+        return LinearSequence(self.times[:], self.values[:], self.res)
+
+    def __eq__(self, other):
+        if type(other) is LinearSequence:
+            return (self.res == other.res and self.times == other.times
+                    and self.values == other.values)
+        return self.materialize() == other
+
+    def __repr__(self):
+        return "LinearSequence: times={}, values={}, res={}".format(self.times, self.values,
+                                                                    self.res)
@@ -0,0 +1,252 @@
+import numpy as np
+import threading
+import time
+from collections import deque
+
+from . import run
+from . import utils
+from .codec import DEFAULT_CODEC
+from .codec import bytes_to_response
+from .communication import HEADER
+from .communication import RESPONSE_HEADER
+from .handler import RequestHandler
+from .log import RequestLog
+from .request import EventRequest
+from .request import InputRequest
+from .request import OutputRequest
+from .request import THREE_AXIS
+from .response import AckResponse
+from .response import ValuesResponse
+from .screen import Screen
+from .screen import ScreenShape
+from .transport import PipeTransport
+from .transport import TransportClosed
+from .utils import AnalogParams
+from .utils import BatchParams
+from .utils import EventType
+from .utils import InputType
+from .utils import OutputType
+
+# Impersonates the embedded client: replays Requests (from a recorded RequestLog, or a
+# synthetic traffic profile) over a transport in the exact wire format, checks the host's
+# responses, and measures throughput and round-trip latency
+
+PIN_INPUTS = (InputType.DigitalRead, InputType.AnalogRead) # Have a <uint8 pin> prefix
+
+DEFAULT_ANALOG_PARAMS = AnalogParams(min_bin=-2**15, max_bin=2**15-1,
+                                     min_value=-2**15, max_value=2**15-1)
+
+# Input: a Request
+# Returns the complete message (header and body) that would produce an equal Request from
+# SerialCommunication, or None if the request can't be encoded (e.g. InvalidRequest)
+def request_to_bytes(request):
+    encoded = DEFAULT_CODEC.encode(request)
+    if encoded is None:
+        return None
+    msg_code, msg_body = encoded
+    msg_code = msg_code.value
+    if not request.response_expected:
+        msg_code += 0x80 # Top bit set means no response expected
+    timestamp = int(request.timestamp // utils.MILLISECOND) % 2**32
+    return HEADER.pack(msg_code, timestamp, len(msg_body)) + msg_body
+
+# Incrementally parses responses from the host, like RequestParser does for requests
+class ResponseParser:
+    def __init__(self):
+        self.pending = bytearray()
+
+    # Returns list of (int msg_code, bytes msg_body) tuples completed by data
+    def feed(self, data):
+        self.pending += data # Amortized O(1), so slow trickles of bytes stay linear
+        data = self.pending
+        messages = []
+        offset = 0
+        while len(data) - offset >= RESPONSE_HEADER.size:
+            msg_code, msg_size = RESPONSE_HEADER.unpack_from(data, offset)
+            body_start = offset + RESPONSE_HEADER.size
+            if len(data) - body_start < msg_size:
+                break # Body hasn't fully arrived yet
+            offset = body_start + msg_size
+            messages.append((msg_code, bytes(data[body_start:offset])))
+        del self.pending[:offset]
+        return messages
+
+# Returns None if response is what the host should send for request, otherwise a string
+# describing the problem
+def check_response(request, response):
+    if response is None:
+        return "Malformed response"
+    elif response.is_error:
+        return "Error response"
+    elif request.is_input and request.values is None: # Host has to provide values
+        if type(response) is not ValuesResponse:
+            return "Expected values, got {}".format(response)
+        num_values = len(request.channels) * request.batch_params.num
+        if len(response.values) != num_values:
+            return "Expected {} values, got {}".format(num_values, len(response.values))
+    elif type(response) is not AckResponse:
+        return "Expected ack, got {}".format(response)
+    return None
+
+class SimulationReport:
+    def __init__(self):
+        self.messages = 0 # Requests sent
+        self.bytes_sent = 0
+        self.responses = 0
+        self.problems = [] # List of (request, string description)
+        self.latencies = [] # Round-trip times in seconds, for requests expecting a response
+        self.elapsed = 0.0 # Seconds
+        self.completed = False # True if the host reported the session complete
+
+    def messages_per_second(self):
+        if self.elapsed == 0:
+            return 0.0
+        return self.messages / self.elapsed
+
+    def describe(self):
+        desc = {
+            "Messages": self.messages,
+            "Bytes Sent": self.bytes_sent,
+            "Responses": self.responses,
+            "Problems": len(self.problems),
+            "Elapsed (s)": round(self.elapsed, 6),
+            "Messages/s": round(self.messages_per_second(), 1),
+            "Session Completed": self.completed,
+        }
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            for q in [50, 95, 99]:
+                key = "Latency p{} (us)".format(q)
+                desc[key] = round(utils.percentile(latencies, q) * 10**6, 1)
+            desc["Latency max (us)"] = round(latencies[-1] * 10**6, 1)
+        return desc
+
+    def __str__(self):
+        return str(self.describe())
+
+class DeviceSimulator:
+    # transport: the client side of a transport to the host
+    # requests: iterable of Requests to send, in order
+    # response_timeout: seconds to wait for each response before giving up
+    def __init__(self, transport, requests, *, response_timeout=5.0):
+        self.transport = transport
+        self.requests = requests
+        self.response_timeout = response_timeout
+        self.parser = ResponseParser()
+        self.received = deque() # (msg_code, msg_body) from the host, not yet handled
+
+    # Sends all requests (stopping early if the host completes the session or goes away)
+    # Returns a SimulationReport
+    def run(self):
+        report = SimulationReport()
+        start = time.perf_counter()
+        try:
+            for request in self.requests:
+                message = request_to_bytes(request)
+                if message is None:
+                    continue # Can't be sent (e.g. InvalidRequest in a recorded log)
+
+                sent_at = time.perf_counter()
+                self.transport.write(message)
+                report.messages += 1
+                report.bytes_sent += len(message)
+                if not request.response_expected:
+                    continue
+
+                message = self.wait_for_response()
+                if message is None:
+                    report.problems.append((request, "No response"))
+                    break
+                report.latencies.append(time.perf_counter() - sent_at)
+                report.responses += 1
+                self.check_extra_responses(request, report)
+
+                response = bytes_to_response(message[0], message[1], request)
+                problem = check_response(request, response)
+                if problem is not None:
+                    report.problems.append((request, problem))
+                if response is not None and response.complete:
+                    report.completed = True
+                    break
+        except TransportClosed:
+            report.problems.append((None, "Host closed the connection"))
+        self.check_extra_responses(None, report)
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    # Returns the next (msg_code, msg_body) from the host, or None on timeout
+    # Any further messages received with it are kept in self.received
+    def wait_for_response(self):
+        deadline = time.perf_counter() + self.response_timeout
+        while not self.received:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            self.received.extend(self.parser.feed(self.transport.read(timeout=remaining)))
+        return self.received.popleft()
+
+    # The host only ever sends one response per request, so reports (and discards) any other
+    # messages received by now.  request: the last request sent, or None at the end
+    def check_extra_responses(self, request, report):
+        while self.received:
+            self.received.popleft()
+            report.problems.append((request, "Extra response"))
+
+# Returns a list of Requests for a synthetic session:
+#   Init, then num_messages input requests in TEST mode (values come from the host),
+#   each a batch of batch_size samples of data_type, interval milliseconds apart
+#   If screen_every > 0, a random full screen output follows every screen_every inputs
+def synthetic_requests(num_messages, *, data_type=InputType.Accelerometer, batch_size=1,
+                       interval=10, screen_every=0, screen_shape=ScreenShape(128, 64), seed=0):
+    rng = np.random.RandomState(seed)
+    if data_type in PIN_INPUTS:
+        channels = [0]
+    else:
+        channels = THREE_AXIS
+    if data_type == InputType.DigitalRead:
+        analog_params = None
+    else:
+        analog_params = DEFAULT_ANALOG_PARAMS
+    if batch_size > 1:
+        batch_params = BatchParams(num=batch_size, period=interval/batch_size)
+    else:
+        batch_params = BatchParams(num=1, period=0)
+
+    t = 0
+    requests = [EventRequest(t, EventType.Init)]
+    if screen_every > 0:
+        requests.append(EventRequest(t, EventType.ScreenInit, screen_shape))
+    for i in range(num_messages):
+        t += interval * utils.MILLISECOND
+        requests.append(InputRequest(t, data_type, channels, analog_params=analog_params,
+                                     batch_params=batch_params))
+        if screen_every > 0 and (i+1) % screen_every == 0:
+            buff = rng.randint(0, 2, size=(screen_shape.height, screen_shape.width))
+            screen = Screen(buff=buff.astype(np.uint8))
+            requests.append(OutputRequest(t, OutputType.Screen, [None], [screen]))
+    return requests
+
+# Runs a host session (run.run_session, in a background thread) against a DeviceSimulator
+# sending requests, over an in-process pipe unless transports are given
+# handler: RequestHandler for the host, or None for a blank endless one
+# transports: (host transport, client transport), connected to each other
+# Returns (SimulationReport, RequestLog recorded by the host)
+def simulate(requests, handler=None, *, transports=None, timeout=5.0):
+    if handler is None:
+        handler = RequestHandler()
+    if transports is None:
+        transports = PipeTransport.pair()
+    host_transport, client_transport = transports
+
+    result = {}
+    def host():
+        result["log"] = run.run_session(handler, transport=host_transport, timeout=timeout)
+    host_thread = threading.Thread(target=host)
+    host_thread.start()
+
+    simulator = DeviceSimulator(client_transport, requests, response_timeout=timeout)
+    report = simulator.run()
+    client_transport.close() # Lets the host session end, if it hasn't already
+    host_thread.join()
+    host_transport.close()
+    return report, result.get("log", RequestLog())
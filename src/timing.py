@@ -0,0 +1,59 @@
+import os
+import pprint
+
+from . import utils
+
+# Per-stage latency instrumentation for host sessions (see run.run_session), to tell whether
+# the host is the bottleneck when a device times out
+
+STAGES = ("read", "decode", "handle", "encode", "write")
+QUANTILES = (50, 95, 99)
+TIMING_FILENAME = "timing.txt"
+
+# Returns the name the timings of request are grouped under, e.g. "Accelerometer" or "Print"
+def message_type(request):
+    if not request.is_valid or request.data_type is None:
+        return "Invalid"
+    return request.data_type.name
+
+# Returns the histogram bucket (upper bound in microseconds, a power of 2) for ns nanoseconds
+def bucket(ns):
+    micros = ns / 1000
+    upper = 1
+    while upper < micros:
+        upper *= 2
+    return upper
+
+class StageTimer:
+    def __init__(self):
+        self.samples = {} # Maps (message type, stage) to list of durations in nanoseconds
+
+    # stage_times: dict mapping stage name to duration in nanoseconds
+    def record(self, request, stage_times):
+        name = message_type(request)
+        for (stage, ns) in stage_times.items():
+            self.samples.setdefault((name, stage), []).append(ns)
+
+    # Returns a dict mapping message type to a dict mapping stage to summary statistics:
+    #   count, p50/p95/p99/max in microseconds, and a histogram (dict mapping the upper bound
+    #   of each power-of-2 bucket, in microseconds, to a count)
+    def summary(self):
+        summary = {}
+        for ((name, stage), samples) in self.samples.items():
+            samples = sorted(samples)
+            stats = {"count": len(samples)}
+            for q in QUANTILES:
+                stats["p{} (us)".format(q)] = round(utils.percentile(samples, q) / 1000, 1)
+            stats["max (us)"] = round(samples[-1] / 1000, 1)
+            histogram = {}
+            for ns in samples:
+                upper = bucket(ns)
+                histogram[upper] = histogram.get(upper, 0) + 1
+            stats["histogram (us)"] = histogram
+            summary.setdefault(name, {})[stage] = stats
+        return summary
+
+    # Saves the summary to results_dir (which must already exist)
+    def save(self, results_dir=utils.RESULTS_DIR):
+        with open(os.path.join(results_dir, TIMING_FILENAME), "w") as f:
+            pprint.pprint(self.summary(), f)
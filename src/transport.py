@@ -0,0 +1,246 @@
+import os
+import select
+import socket
+import threading
+import time
+import tty
+
+# Byte transports between the host and an embedded client (or anything impersonating one)
+# All transports share one small interface:
+#   read(size, timeout=None): waits up to timeout seconds (None -> forever) for data, then returns
+#       whatever is available, up to size bytes.  Returns empty bytes on timeout
+#   write(data): sends all of data
+#   close()
+# read and write raise TransportClosed (an IOError, like serial.SerialException) once the
+# other side has gone away
+
+DEFAULT_READ_SIZE = 4096
+
+class TransportClosed(IOError):
+    pass
+
+# Serial port (e.g. USB serial to a Teensy)
+class SerialTransport:
+    def __init__(self, addr, baud):
+        import serial # Only for real serial ports
+        self.ser = serial.Serial(addr, baud)
+
+    def read(self, size=DEFAULT_READ_SIZE, timeout=None):
+        self.ser.timeout = timeout
+        return self.ser.read(max(1, min(size, self.ser.in_waiting)))
+
+    def write(self, data):
+        self.ser.write(data)
+
+    def close(self):
+        self.ser.close()
+
+# Raw file descriptor of a character device (e.g. an existing tty), read with select
+class FdTransport:
+    def __init__(self, fd):
+        self.fd = fd
+        self.closed = False
+
+    # Opens the tty device at path in raw mode (no echo or newline translation)
+    @classmethod
+    def open_path(cls, path):
+        fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+        tty.setraw(fd)
+        return cls(fd)
+
+    def read(self, size=DEFAULT_READ_SIZE, timeout=None):
+        if self.closed:
+            raise TransportClosed("Closed")
+        try:
+            readable, _, _ = select.select([self.fd], [], [], timeout)
+            if not readable:
+                return bytes() # timed out
+            data = os.read(self.fd, size)
+        except OSError as e: # e.g. EIO once the other end of a pty is closed
+            raise TransportClosed(e)
+        if len(data) == 0:
+            raise TransportClosed("End of file")
+        return data
+
+    def write(self, data):
+        if self.closed:
+            raise TransportClosed("Closed")
+        view = memoryview(data)
+        try:
+            while len(view) > 0:
+                view = view[os.write(self.fd, view):]
+        except OSError as e:
+            raise TransportClosed(e)
+
+    def close(self):
+        if not self.closed:
+            os.close(self.fd)
+            self.closed = True
+
+# A fresh pseudo-terminal pair.  The host uses the master end, and an embedded client
+# stand-in (e.g. a device simulator) opens slave_path like it would a serial port
+# The slave end is held open as well (so reads don't fail before the client opens it), until
+# release_slave() or the first data from the client.  From then on, the client closing its
+# end is seen as a disconnect
+class PtyTransport(FdTransport):
+    def __init__(self):
+        master, self.slave = os.openpty()
+        tty.setraw(self.slave) # No echo or newline translation
+        self.slave_path = os.ttyname(self.slave)
+        super().__init__(master)
+
+    # Call once the client has opened slave_path: from then on, the client closing its end
+    # is seen as a disconnect
+    def release_slave(self):
+        if self.slave is not None:
+            os.close(self.slave)
+            self.slave = None
+
+    def read(self, size=DEFAULT_READ_SIZE, timeout=None):
+        data = super().read(size, timeout)
+        if data:
+            self.release_slave() # The client must have opened the slave to send it
+        return data
+
+    def close(self):
+        super().close()
+        self.release_slave()
+
+# TCP (or any stream) socket
+class SocketTransport:
+    def __init__(self, sock):
+        self.sock = sock
+
+    @classmethod
+    def connect(cls, host, port):
+        return cls(socket.create_connection((host, port)))
+
+    # Waits for a single client to connect on (host, port)
+    # timeout: seconds to wait (None -> forever), after which socket.timeout is raised
+    @classmethod
+    def listen(cls, host, port, timeout=None):
+        with socket.create_server((host, port)) as server:
+            server.settimeout(timeout)
+            sock, _ = server.accept()
+        return cls(sock)
+
+    def read(self, size=DEFAULT_READ_SIZE, timeout=None):
+        self.sock.settimeout(timeout)
+        try:
+            data = self.sock.recv(size)
+        except socket.timeout:
+            return bytes()
+        except OSError as e:
+            raise TransportClosed(e)
+        if len(data) == 0:
+            raise TransportClosed("Connection closed")
+        return data
+
+    def write(self, data):
+        self.sock.settimeout(None)
+        try:
+            self.sock.sendall(data)
+        except OSError as e:
+            raise TransportClosed(e)
+
+    def close(self):
+        self.sock.close()
+
+# One direction of an in-process pipe
+class _ByteChannel:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def put(self, data):
+        with self.condition:
+            if self.closed:
+                raise TransportClosed("Pipe closed")
+            self.buffer += data
+            self.condition.notify_all()
+
+    def get(self, size, timeout):
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        with self.condition:
+            while len(self.buffer) == 0:
+                if self.closed:
+                    raise TransportClosed("Pipe closed")
+                remaining = None
+                if timeout is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return bytes() # timed out
+                self.condition.wait(remaining)
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            return data
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+# In-process byte pipe, for driving the host at full speed without any OS device
+# Create connected endpoints with PipeTransport.pair().  Data written before an endpoint is
+# closed can still be read by the other side.
+class PipeTransport:
+    def __init__(self, incoming, outgoing):
+        self.incoming = incoming
+        self.outgoing = outgoing
+
+    # Returns two connected PipeTransports
+    @classmethod
+    def pair(cls):
+        a_to_b = _ByteChannel()
+        b_to_a = _ByteChannel()
+        return cls(b_to_a, a_to_b), cls(a_to_b, b_to_a)
+
+    def read(self, size=DEFAULT_READ_SIZE, timeout=None):
+        return self.incoming.get(size, timeout)
+
+    def write(self, data):
+        self.outgoing.put(data)
+
+    def close(self):
+        self.outgoing.close()
+        self.incoming.close()
+
+# Opens a transport from a string spec:
+#   "tcp:<host>:<port>"     connect to a TCP server
+#   "listen:<host>:<port>"  wait for a TCP client
+#   "tty:<path>"            an existing tty device (e.g. pty slave), in raw mode
+#   "pty"                   a new pseudo-terminal (prints the path for the client to open)
+#   "serial:<path>" or just "<path>"  a serial port
+# timeout: seconds to wait for a "listen" client (None -> forever)
+# Raises IOError (e.g. serial.SerialException) if the device isn't available (yet), or no
+# client connected in time
+def open_transport(spec, baud, timeout=None):
+    kind, _, rest = spec.partition(":")
+    if kind in ("tcp", "listen"):
+        host, _, port = rest.rpartition(":")
+        if kind == "tcp":
+            return SocketTransport.connect(host, int(port))
+        return SocketTransport.listen(host, int(port), timeout)
+    elif kind == "tty":
+        return FdTransport.open_path(rest)
+    elif spec == "pty":
+        transport = PtyTransport()
+        print("Pseudo-terminal for the client: {}".format(transport.slave_path))
+        return transport
+    elif kind == "serial":
+        return SerialTransport(rest, baud)
+    else:
+        return SerialTransport(spec, baud)
+
+# Returns the filesystem path of the device a transport spec (see open_transport) refers to,
+# or None if it isn't a device (e.g. a socket, or a new pty)
+def transport_path(spec):
+    kind, _, rest = spec.partition(":")
+    if kind in ("tcp", "listen") or spec == "pty":
+        return None
+    elif kind in ("tty", "serial"):
+        return rest
+    else:
+        return spec
@@ -1,10 +1,11 @@
 from collections import namedtuple
-import dill as pickle
 from enum import Enum
-import numpy as np
+import functools
 import operator
 import struct
 
+# numpy and dill are imported by the functions using them (see bench/startup.py)
+
 MILLISECOND = 1 # time unit(s) per millisecond
 RESULTS_DIR = "results"
 
@@ -108,6 +109,16 @@ def decode_int(raw_bytes, signed=False):
     else:
         raise ValueError('Could not decode {} with signed={}'.format(raw_bytes, signed))
 
+# Decodes count consecutive little-endian integers of the given byte-width from raw
+# (any bytes-like object, e.g. a memoryview), starting at offset.  Nothing is copied.
+# Returns a list of ints
+def decode_ints(raw, count, width=4, signed=False, offset=0):
+    if (width,signed) in FORMAT_CHARS:
+        format_char = FORMAT_CHARS[(width,signed)]
+        return list(struct.unpack_from('<{}{}'.format(count, format_char), raw, offset))
+    else:
+        raise ValueError('Could not decode width={} bytes with signed={}'.format(width, signed))
+
 # Encodes an integer (num) as bytes, little-endian.  Note that width is byte-width, not bit-width
 # width must be 1, 2, 4, or 8
 def encode_int(num, width=4, signed=False):
@@ -120,35 +131,64 @@ def encode_int(num, width=4, signed=False):
     else:
         raise ValueError('Invalid encode width={} bytes with signed={}'.format(width, signed))
 
+# Returns a compiled struct.Struct for count little-endian integers of the given byte-width
+# Cached, since the same few batch sizes come up over and over in a session
+@functools.lru_cache(maxsize=64)
+def int_struct(count, width=4, signed=False):
+    if (width,signed) in FORMAT_CHARS:
+        format_char = FORMAT_CHARS[(width,signed)]
+        return struct.Struct('<{}{}'.format(count, format_char))
+    else:
+        raise ValueError('Invalid encode width={} bytes with signed={}'.format(width, signed))
+
+# Encodes a sequence of integers as consecutive little-endian bytes, in a single pack call
+# width must be 1, 2, 4, or 8
+def encode_ints(nums, width=4, signed=False):
+    return int_struct(len(nums), width, signed).pack(*nums)
+
 
 AnalogParams = namedtuple('AnalogParams', ['min_bin', 'max_bin', 'min_value', 'max_value'])
+ANALOG_PARAMS_STRUCT = struct.Struct('<iiii')
 
-# Input: bytes of length 16 and interpret as 4 int32s
+# Input: bytes-like of length 16 (from offset) and interpret as 4 int32s
 # Return: AnalogParams
-def decode_analog_params(raw):
-    min_bin = decode_int(raw[0:4], signed=True)
-    max_bin = decode_int(raw[4:8], signed=True)
-    min_value = decode_int(raw[8:12], signed=True)
-    max_value = decode_int(raw[12:16], signed=True)
-    return AnalogParams(min_bin, max_bin, min_value, max_value)
+def decode_analog_params(raw, offset=0):
+    return AnalogParams(*ANALOG_PARAMS_STRUCT.unpack_from(raw, offset))
 
 BatchParams = namedtuple('BatchParams', ['num', 'period']) # Period is in microseconds
+BATCH_PARAMS_STRUCT = struct.Struct('<HI')
 
-# Input: bytes of length 6 (representing: uint16 num, uint32 period)
+# Input: bytes-like of length 6 from offset (representing: uint16 num, uint32 period)
 # Return: BatchParams
-def decode_batch_params(raw):
-    num = decode_int(raw[0:2], signed=False)
-    period = decode_int(raw[2:6], signed=False)/1000 # Conversion micros->millis
-    return BatchParams(num, period)
+def decode_batch_params(raw, offset=0):
+    num, period = BATCH_PARAMS_STRUCT.unpack_from(raw, offset)
+    return BatchParams(num, period/1000) # Conversion micros->millis
 
 # Input: bytes of length 8
 # Return: 8x8 numpy array of uint8 (1 represents lit pixel)
 # Each byte of input corresponds to column of output, with MSB at top of column
 def decode_screen_tile(data):
+    import numpy as np
     data = np.array([[elt] for elt in data[::-1]], dtype=np.uint8)
     tile = np.unpackbits(data, axis=1)
     return tile.transpose()
 
+# Input: bytes of length 8*tile_width*tile_height (sequence of 8 byte tiles, organized by row)
+# Return: (tile_height)x(8*tile_width) numpy array of uint8, the screen packed into pages
+# (see screen.pack_pixels).  The client sends pages column by column, top row in the MSB, but
+# in reverse order (rotated 180 degrees), so this is just the bytes reversed: the same as
+# decoding each tile with decode_screen_tile and painting it at x=8*(tile_width-x-1),
+# y=8*(tile_height-y-1) (tile rows and columns arrive bottom-to-top and right-to-left).
+def decode_screen_pages(data, tile_width, tile_height):
+    import numpy as np
+    raw = np.frombuffer(data, dtype=np.uint8, count=8*tile_width*tile_height)
+    return raw[::-1].reshape(tile_height, 8*tile_width)
+
+# Inverse of decode_screen_pages
+def encode_screen_pages(pages):
+    import numpy as np
+    return np.ascontiguousarray(pages).ravel()[::-1].tobytes()
+
 # Returns int representation of binary 2D numpy array (i.e. packs the bits)
 # bits are packed by column, MSB in top-left corner (i.e. location (0,0))
 def bitmap_to_int(bitmap):
@@ -161,6 +201,7 @@ def bitmap_to_int(bitmap):
 
 # Inverse of the above function, returns a binary 2D numpy array
 def int_to_bitmap(num, width, height):
+    import numpy as np
     bitmap = np.zeros((height,width), dtype=np.uint8)
     for x in range(width-1, -1, -1):
         for y in range(height-1, -1, -1):
@@ -168,15 +209,23 @@ def int_to_bitmap(num, width, height):
             num >>= 1
     return bitmap
 
+# Returns the q-th percentile (0 <= q <= 100) of a non-empty sorted list, using the
+# nearest-rank method (so the result is always an element of the list)
+def percentile(sorted_values, q):
+    rank = max(1, -(-len(sorted_values)*q // 100)) # Ceiling division
+    return sorted_values[int(rank)-1]
+
 # Saves an objec to a file
 def save(obj, filename):
+    import dill
     f = open(filename, 'wb')
-    pickle.dump(obj,f)
+    dill.dump(obj,f)
     f.close()
 
 # Loads an object from a file
 def load(filename):
+    import dill
     f = open(filename, 'rb')
-    obj = pickle.load(f)
+    obj = dill.load(f)
     f.close()
     return obj
\ No newline at end of file
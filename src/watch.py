@@ -0,0 +1,180 @@
+import ctypes
+import functools
+import os
+import select
+import time
+
+# Waiting for a device (e.g. a board being plugged in) without busy-waiting: on Linux, an
+# inotify watch on the device's directory wakes us up as soon as something appears there (udev
+# creating the node, or fixing its permissions).  Otherwise, and in between events, connection
+# attempts back off exponentially.
+
+IN_ATTRIB = 0x004 # Permissions etc. changed (udev sets these after creating the node)
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+WATCH_MASK = IN_ATTRIB | IN_MOVED_TO | IN_CREATE
+
+# Returns libc if it provides inotify, otherwise None
+# Loaded on first use, as finding libc is slow
+@functools.lru_cache(maxsize=None)
+def load_inotify():
+    import ctypes.util
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        libc.inotify_rm_watch
+    except (OSError, AttributeError): # Not Linux
+        return None
+    return libc
+
+# Returns the deepest existing directory containing path (path itself needn't exist)
+def existing_parent(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    while not os.path.isdir(directory):
+        directory = os.path.dirname(directory)
+    return directory
+
+# Delays between attempts: initial, then multiplied by factor each time, up to maximum
+class Backoff:
+    def __init__(self, initial=0.01, maximum=1.0, factor=2):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.reset()
+
+    def reset(self):
+        self.delay = self.initial
+
+    # Returns the next delay in seconds
+    def next(self):
+        delay = self.delay
+        self.delay = min(self.maximum, self.delay * self.factor)
+        return delay
+
+# Watches the directory of a device path for new or changed entries
+# Raises OSError if inotify isn't available
+class DirectoryWatcher:
+    def __init__(self, path):
+        self.inotify = load_inotify()
+        if self.inotify is None:
+            raise OSError("inotify is not available")
+        self.path = path
+        self.fd = self.inotify.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directory = None
+        self.wd = None # Watch descriptor of directory
+        self.refresh()
+
+    # Watches the deepest existing directory leading to path (e.g. /dev/serial/by-id only
+    # exists while a device is plugged in, so until then /dev/serial or /dev is watched)
+    # Only one directory is watched at a time, so watches don't pile up as devices come and go
+    def refresh(self):
+        directory = existing_parent(self.path)
+        if directory == self.directory:
+            return
+        wd = self.inotify.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed", directory)
+        if self.wd is not None and self.wd != wd:
+            # Fails harmlessly if the kernel already removed it (its directory was deleted)
+            self.inotify.inotify_rm_watch(self.fd, self.wd)
+        self.directory = directory
+        self.wd = wd
+
+    def fileno(self):
+        return self.fd
+
+    # Discards pending events, returns True if there were any
+    def drain(self):
+        changed = False
+        while True:
+            try:
+                if not os.read(self.fd, 4096):
+                    break
+                changed = True
+            except BlockingIOError:
+                break
+        if changed:
+            self.refresh()
+        return changed
+
+    # Waits up to timeout seconds for a change, returns True if there was one
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        return bool(readable) and self.drain()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+# Returns a DirectoryWatcher for path, or None if path is None or it can't be watched
+def watch(path):
+    if path is None:
+        return None
+    try:
+        return DirectoryWatcher(path)
+    except OSError:
+        return None
+
+# Calls attempt() until it returns True, waiting in between until something changes in the
+# directory of path (if given, and inotify is available) or a backoff delay passes
+# timeout: seconds to keep trying (None -> forever)
+# Returns True if attempt succeeded, False on timeout
+def wait_until(attempt, path=None, *, timeout=None, backoff=None):
+    if backoff is None:
+        backoff = Backoff()
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+    watcher = watch(path)
+    try:
+        while not attempt():
+            delay = backoff.next()
+            if timeout is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+            if watcher is None:
+                time.sleep(delay)
+            elif watcher.wait(delay):
+                backoff.reset() # Something appeared, so try again promptly
+        return True
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+# Coroutine version of wait_until, for a coroutine function attempt
+async def wait_until_async(attempt, path=None, *, timeout=None, backoff=None):
+    import asyncio # Only for async sessions
+    if backoff is None:
+        backoff = Backoff()
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    watcher = watch(path)
+    if watcher is not None:
+        loop.add_reader(watcher.fileno(), changed.set)
+    try:
+        while not await attempt():
+            delay = backoff.next()
+            if timeout is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+            try:
+                await asyncio.wait_for(changed.wait(), delay)
+            except asyncio.TimeoutError:
+                continue
+            changed.clear()
+            if watcher.drain():
+                backoff.reset() # Something appeared, so try again promptly
+        return True
+    finally:
+        if watcher is not None:
+            loop.remove_reader(watcher.fileno())
+            watcher.close()
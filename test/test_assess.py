@@ -0,0 +1,126 @@
+from src.assess import *
+import unittest
+
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from src import utils
+from src.case import TestCase
+
+from src.condition import Condition
+from src.condition import ConditionType
+from src.evaluator import EvalPoint
+from src.evaluator import Evaluator
+from src.handler import RequestHandler
+from src.log import RequestLog
+from src.request import EventRequest
+from src.request import OutputRequest
+from src.simulator import DeviceSimulator
+from src.transport import SocketTransport
+from src.utils import EventType
+from src.utils import OutputType
+
+class TestAssess(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.dir = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_expand_ports(self):
+        for name in ["ttyACM1", "ttyACM0", "ttyS0"]:
+            open(os.path.join(self.dir, name), "w").close()
+        patterns = [os.path.join(self.dir, "ttyACM*"), os.path.join(self.dir, "ttyACM0"),
+                    "/dev/not_plugged_in"]
+        expected = [os.path.join(self.dir, "ttyACM0"), os.path.join(self.dir, "ttyACM1"),
+                    "/dev/not_plugged_in"]
+        self.assertEqual(expand_ports(patterns), expected)
+        self.assertEqual(expand_ports(["b", "a", "b"]), ["b", "a"]) # Order given
+
+    def test_pair_testcases(self):
+        ports = ["b", "a"]
+        self.assertEqual(pair_testcases(ports, ["x.tc"]), [("b", "x.tc"), ("a", "x.tc")])
+        self.assertEqual(pair_testcases(ports, ["x.tc", "y.tc"]), [("b", "x.tc"), ("a", "y.tc")])
+        with self.assertRaises(ValueError):
+            pair_testcases(ports, ["x.tc", "y.tc", "z.tc"])
+        with self.assertRaises(ValueError): # Which ports a pattern matches isn't known
+            pair_testcases(["/dev/ttyACM*", "b"], ["x.tc", "y.tc"])
+
+    def test_session_results_dir(self):
+        self.assertEqual(session_results_dir("results", 0, "/dev/ttyACM0"), "results/0_ttyACM0")
+        self.assertEqual(session_results_dir("results", 3, "listen:127.0.0.1:5000"),
+                         "results/3_listen_127.0.0.1_5000")
+        dirs = [session_results_dir("results", i, port)
+                for (i, port) in enumerate(["/dev/a/ttyUSB0", "/dev/b/ttyUSB0"])]
+        self.assertEqual(len(set(dirs)), 2) # Same basename
+
+    def test_assess_log(self):
+        log = RequestLog()
+        log.update(OutputRequest(100, OutputType.DigitalWrite, [13], [1]))
+        key = (OutputType.DigitalWrite, 13)
+        evaluator = Evaluator(conditions=[Condition(ConditionType.After, cause=0)],
+                              points={key: [EvalPoint(0, 1, (100, 200))]})
+        results_dir = os.path.join(self.dir, "results")
+        os.makedirs(results_dir)
+        open(os.path.join(results_dir, "stale.txt"), "w").close()
+
+        results = assess_log(evaluator, log, results_dir)
+        self.assertTrue(results[key].passed)
+        self.assertEqual(sorted(os.listdir(results_dir)),
+                         ["brief_description.txt", "description.txt"])
+
+    def test_assess_many(self):
+        # Two boards impersonated over TCP, each expecting its own testcase, given out of order
+        key = (OutputType.DigitalWrite, 13)
+        port_numbers = sorted([free_port(), free_port()], key=str, reverse=True)
+        ports = ["listen:127.0.0.1:{}".format(port) for port in port_numbers]
+        testcases = []
+        clients = []
+        for (port, name, value) in zip(port_numbers, ["b", "a"], [0, 1]):
+            evaluator = Evaluator(conditions=[Condition(ConditionType.After, cause=0)],
+                                  points={key: [EvalPoint(0, value, (100, 200))]})
+            os.makedirs(os.path.join(self.dir, name))
+            testcases.append(os.path.join(self.dir, name, "testcase.tc")) # Same basename
+            utils.save(TestCase(handler=RequestHandler(), evaluator=evaluator), testcases[-1])
+            requests = [EventRequest(0, EventType.Init),
+                        OutputRequest(100, OutputType.DigitalWrite, [13], [value])]
+            clients.append(threading.Thread(target=run_client, args=(port, requests)))
+        for client in clients:
+            client.start()
+
+        results_dir = os.path.join(self.dir, "results")
+        log_dir = os.path.join(self.dir, "logs")
+        summaries = assess_many(ports, testcases, results_dir=results_dir, log_dir=log_dir,
+                                connect_timeout=5)
+        for client in clients:
+            client.join()
+        self.assertEqual([s["Port"] for s in summaries], ports)
+        self.assertEqual([s["Testcase"] for s in summaries], testcases)
+        self.assertEqual([s["Result"] for s in summaries], ["PASS", "PASS"])
+        self.assertEqual(len({s["Results"] for s in summaries}), 2) # Each session has its own
+        self.assertEqual(len(os.listdir(log_dir)), 2)
+        self.assertTrue(os.path.exists(os.path.join(results_dir, SUMMARY_FILENAME)))
+
+# Returns a TCP port number that was free a moment ago
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# Sends requests to the host listening on port, like a board would, once it's listening
+def run_client(port, requests):
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            transport = SocketTransport.connect("127.0.0.1", port)
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                return
+            time.sleep(0.01)
+    DeviceSimulator(transport, requests).run()
+    transport.close()
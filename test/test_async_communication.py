@@ -0,0 +1,103 @@
+from src.async_communication import *
+import unittest
+
+import asyncio
+import os
+import tty
+
+from src.condition import Condition
+from src.condition import ConditionType
+from src.handler import RequestHandler
+from src.request import EventRequest
+from src.request import InputRequest
+from src.response import AckResponse
+from src.run import run_session_async
+from src.utils import EventType
+from src.utils import InputType
+
+# Collects written bytes in memory, in place of an asyncio.StreamWriter
+class MemoryWriter:
+    def __init__(self):
+        self.data = bytes()
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+INIT = bytes([0x00, 1, 0, 0, 0, 0, 0]) # Init at t=1
+PRINT = bytes([0x81, 2, 0, 0, 0, 2, 0]) + b"hi" # Print at t=2, no response expected
+DIGITAL_READ = bytes([0x20, 3, 0, 0, 0, 2, 0, 6, 0]) # Read pin 6 at t=3
+
+class TestAsyncCommunication(unittest.TestCase):
+    def test_memory_streams(self):
+        async def f():
+            reader = asyncio.StreamReader()
+            writer = MemoryWriter()
+            comm = AsyncCommunication(reader, writer)
+            reader.feed_data(INIT + PRINT[:4])
+            first = await comm.get_request()
+            self.assertIsNone(await comm.get_request(timeout=0.01)) # Only partial message
+            reader.feed_data(PRINT[4:])
+            second = await comm.get_request()
+            reader.feed_eof()
+            third = await comm.get_request()
+
+            await comm.send_response(AckResponse(complete=True))
+            return first, second, third, writer.data
+
+        first, second, third, written = asyncio.run(f())
+        self.assertEqual(first, EventRequest(1, EventType.Init))
+        self.assertEqual(second.data, "hi")
+        self.assertFalse(second.response_expected)
+        self.assertIsNone(third)
+        self.assertEqual(written, bytes([0x81, 0, 0]))
+
+    def test_pty(self):
+        master, slave = os.openpty()
+        tty.setraw(slave) # No echo or newline translation
+
+        async def f():
+            reader, writer, read_transport = await open_fd_connection(master)
+            comm = AsyncCommunication(reader, writer, read_transport)
+            os.write(slave, DIGITAL_READ)
+            request = await comm.get_request(timeout=1)
+            await comm.send_response(AckResponse())
+            comm.close()
+            return request
+
+        try:
+            request = asyncio.run(f())
+            self.assertEqual(request, InputRequest(3, InputType.DigitalRead, [6]))
+            self.assertEqual(os.read(slave, 3), bytes([0x80, 0, 0]))
+        finally:
+            os.close(master)
+            os.close(slave)
+
+class TestRunSessionAsync(unittest.TestCase):
+    def test_concurrent_sessions(self):
+        async def f():
+            comms = []
+            for i in range(3):
+                reader = asyncio.StreamReader()
+                comms.append(AsyncCommunication(reader, MemoryWriter()))
+                reader.feed_data(INIT + PRINT + DIGITAL_READ)
+            comms[2].reader.feed_eof() # Ends early
+            handlers = [RequestHandler(end_condition=Condition(ConditionType.After, cause=3)),
+                        RequestHandler(),
+                        RequestHandler()]
+            logs = await asyncio.gather(
+                run_session_async(handlers[0], comms[0]), # Ends due to end condition
+                run_session_async(handlers[1], comms[1], session_timeout=0.05),
+                run_session_async(handlers[2], comms[2]))
+            return logs, [comm.writer.data for comm in comms]
+
+        logs, written = asyncio.run(f())
+        for log in logs:
+            self.assertEqual(len(log.requests), 3)
+        self.assertEqual(written[0], bytes([0x80, 0, 0, 0x81, 1, 0, 0])) # Complete
+        self.assertEqual(written[1], bytes([0x80, 0, 0, 0x80, 1, 0, 0]))
@@ -0,0 +1,80 @@
+from src.codec import *
+import unittest
+
+import numpy as np
+
+from src.communication import SerialCommunication
+from src.request import EventRequest
+from src.request import InputRequest
+from src.request import InvalidRequest
+from src.request import OutputRequest
+from src.response import AckResponse
+from src.response import ErrorResponse
+from src.response import ValuesResponse
+from src.screen import Screen
+from src.screen import ScreenShape
+from src.utils import AnalogParams
+from src.utils import BatchParams
+from src.utils import EventType
+from src.utils import InputType
+from src.utils import OutputType
+
+class TestCodec(unittest.TestCase):
+    def test_round_trip(self):
+        a_params = AnalogParams(-100, 100, -5, 5)
+        b_params = BatchParams(num=2, period=0.5)
+        screen = Screen(width=16, height=8)
+        screen.paint(np.ones((3,3)), x=2, y=1)
+        requests = [
+            EventRequest(0, EventType.Init),
+            EventRequest(0, EventType.Print, "hi"),
+            InputRequest(0, InputType.DigitalRead, [6], values=[1]),
+            InputRequest(0, InputType.AnalogRead, [2], analog_params=a_params,
+                         batch_params=b_params),
+            InputRequest(0, InputType.Magnetometer, THREE_AXIS, analog_params=a_params,
+                         values=[1, -2, 3]),
+            OutputRequest(0, OutputType.DigitalWrite, [13], [1]),
+            OutputRequest(0, OutputType.AnalogWrite, [3], [-7], analog_params=a_params),
+            EventRequest(0, EventType.ScreenInit, ScreenShape(16, 8)),
+            OutputRequest(0, OutputType.Screen, [None], [screen]),
+            EventRequest(0, EventType.Gps),
+            EventRequest(0, EventType.Wifi, "request"),
+            EventRequest(0, EventType.Wifi, "response"),
+        ]
+        state = SerialCommunication()
+        for request in requests:
+            msg_code, msg_body = DEFAULT_CODEC.encode(request)
+            decoded = DEFAULT_CODEC.decode(state, msg_code.value, 0, memoryview(msg_body))
+            self.assertEqual(decoded, request)
+
+        self.assertIsNone(DEFAULT_CODEC.encode(InvalidRequest(0)))
+        self.assertIsNone(DEFAULT_CODEC.encode(EventRequest(0, EventType.Wifi, "other")))
+        self.assertEqual(DEFAULT_CODEC.decode(state, 0x7F, 0, bytes()), InvalidRequest(0))
+
+    def test_register(self):
+        codec = Codec(DEFAULT_CODEC.decoders.values())
+        def decode_gps(state, timestamp, msg_body):
+            return EventRequest(timestamp, EventType.Gps, data=bytes(msg_body))
+        def encode_gps(request):
+            return request.data
+        codec.register(MessageSpec(MessageCode.GpsFix, EventType.Gps, decode_gps, encode_gps))
+
+        request = EventRequest(5, EventType.Gps, data=bytes([1, 2]))
+        self.assertEqual(codec.encode(request), (MessageCode.GpsFix, bytes([1, 2])))
+        self.assertEqual(codec.decode(None, 0x50, 5, bytes([1, 2])), request)
+        self.assertEqual(len(codec.encoders[EventType.Gps]), 1) # Old spec was replaced
+        self.assertEqual(DEFAULT_CODEC.decode(None, 0x50, 5, bytes([1, 2])),
+                         EventRequest(5, EventType.Gps))
+
+    def test_responses(self):
+        digital = InputRequest(0, InputType.DigitalRead, [1, 2])
+        analog = InputRequest(0, InputType.AnalogRead, [1], analog_params=AnalogParams(0,1,0,1))
+        responses = [
+            (AckResponse(), digital),
+            (ErrorResponse(complete=True), digital),
+            (ValuesResponse([1, 0], analog=False, complete=True), digital),
+            (ValuesResponse([-2], analog=True), analog),
+        ]
+        for (response, request) in responses:
+            msg_code, msg_body = response_to_bytes(response)
+            self.assertEqual(bytes_to_response(msg_code, msg_body, request), response)
@@ -6,15 +6,20 @@ from src.request import OutputRequest
 from src.response import AckResponse
 from src.response import ErrorResponse
 from src.response import ValuesResponse
+from src.log import RequestLog
+from src.screen import MAX_DELTA_DEPTH
 from src.screen import Screen
 from src.screen import ScreenShape
 from src.utils import AnalogParams
+from src.utils import BatchParams
 from src.utils import EventType
 from src.utils import InputType
 from src.utils import OutputType
+from src.utils import decode_screen_tile
 
 import itertools
 import numpy as np
+import pickle
 import unittest
 
 class TestSerialCommunication(unittest.TestCase):
@@ -167,13 +172,17 @@ class TestSerialCommunication(unittest.TestCase):
         buff[:,0] = 1 # Left
         buff[:,15] = 1 # Right
         expected = OutputRequest(t, OutputType.Screen, [None], [Screen(buff=buff)])
-        self.assertEqual(self.sc.bytes_to_request(code, t, body), expected)
+        full = self.sc.bytes_to_request(code, t, body)
+        self.assertEqual(full, expected)
 
         code = 0x42 # ScreenTile
         body = bytes([0,0] + [255]*8) # Light up entire left tile
-        buff[:,0:8] = 1
-        expected = OutputRequest(t, OutputType.Screen, [None], [Screen(buff=buff)])
+        tile_buff = np.copy(buff)
+        tile_buff[:,0:8] = 1
+        expected = OutputRequest(t, OutputType.Screen, [None], [Screen(buff=tile_buff)],
+                                 is_tile=True)
         self.assertEqual(self.sc.bytes_to_request(code, t, body), expected)
+        self.assertEqual(full.values[0], Screen(buff=buff)) # Earlier screen is unchanged
 
     def test_response_to_bytes(self):
         resp = AckResponse(complete=False)
@@ -199,3 +208,114 @@ class TestSerialCommunication(unittest.TestCase):
         resp = ValuesResponse(values=[-2,-1,65535], analog=True, complete=True)
         expected = 0x81, bytes([254, 255, 255, 255, 255, 255, 255, 255, 255, 255, 0, 0])
         self.assertEqual(self.sc.response_to_bytes(resp), expected)
+
+class TestRequestParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = RequestParser()
+        # Init at t=1 (response expected), then Print "hi" at t=258 (no response expected),
+        # then a recorded digital read of pin 13 at t=3
+        self.stream = (bytes([0x00, 1, 0, 0, 0, 0, 0])
+                       + bytes([0x81, 2, 1, 0, 0, 2, 0]) + b"hi"
+                       + bytes([0x20, 3, 0, 0, 0, 3, 0, 13, 1, 1]))
+        expected_print = EventRequest(258, EventType.Print, "hi")
+        expected_print.response_expected = False
+        self.expected = [
+            EventRequest(1, EventType.Init),
+            expected_print,
+            InputRequest(3, InputType.DigitalRead, [13], values=[1])
+        ]
+
+    def test_feed_back_to_back(self):
+        self.assertEqual(self.parser.feed(self.stream), self.expected)
+        self.assertEqual(self.parser.pending, bytes())
+
+    def test_feed_split(self):
+        for split in range(len(self.stream)+1): # Every possible two-chunk split
+            parser = RequestParser()
+            requests = parser.feed(self.stream[:split]) + parser.feed(self.stream[split:])
+            self.assertEqual(requests, self.expected)
+
+        parser = RequestParser()
+        requests = []
+        for i in range(len(self.stream)): # One byte at a time
+            requests.extend(parser.feed(self.stream[i:i+1]))
+        self.assertEqual(requests, self.expected)
+
+    def test_feed_partial(self):
+        self.assertEqual(self.parser.feed(self.stream[:-1]), self.expected[:2])
+        self.assertEqual(self.parser.pending, self.stream[-10:-1])
+        self.parser.clear()
+        self.assertEqual(self.parser.feed(self.stream), self.expected)
+
+    def test_screen_state(self):
+        sc = SerialCommunication()
+        parser = RequestParser(sc)
+        stream = bytes([0x40, 0, 0, 0, 0, 2, 0, 1, 1]) # ScreenInit, one tile
+        stream += bytes([0x42, 0, 0, 0, 0, 10, 0, 0, 0] + [255]*8) # Light up tile
+        requests = parser.feed(stream)
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[1].values[0], Screen(buff=np.ones((8,8), dtype=np.uint8)))
+        self.assertEqual(sc.last_screen, requests[1].values[0])
+
+        stream = bytes([0x41, 0, 0, 0, 0, 8, 0] + [255]*8) # Same screen, in full
+        repeated = parser.feed(stream)[0].values[0]
+        self.assertIs(repeated._pages, requests[1].values[0]._pages) # Interned
+
+    def test_split_screen(self):
+        parser = RequestParser(SerialCommunication())
+        parser.feed(bytes([0x40, 0, 0, 0, 0, 2, 0, 2, 1])) # ScreenInit, 2x1 tiles
+        stream = bytes([0x41, 0, 0, 0, 0, 16, 0] + [0]*8 + [255]*8) # Left tile lit
+        for i in range(len(stream)-1): # One byte at a time, so it's buffered in pending
+            self.assertEqual(parser.feed(stream[i:i+1]), [])
+        screen = parser.feed(stream[-1:] + bytes([0x41, 0, 0]))[0].values[0]
+        parser.feed(bytes([0, 0, 16, 0] + [0]*16)) # Reuses the buffer screen came from
+        expected = Screen(width=16, height=8)
+        expected.paint(np.ones((8,8), dtype=np.uint8), 0, 0)
+        self.assertEqual(screen, expected)
+        self.assertEqual(parser.pending, bytes())
+
+    def test_tile_burst_log(self):
+        sc = SerialCommunication()
+        parser = RequestParser(sc)
+        log = RequestLog()
+        stream = bytes([0x40, 0, 0, 0, 0, 2, 0, 16, 8]) # ScreenInit, 128x64
+        stream += bytes([0x41, 0, 0, 0, 0, 0, 4] + [0]*1024) # Blank
+        for i in range(128): # Redraw every tile
+            stream += bytes([0x42, i+1, 0, 0, 0, 10, 0, i%16, i//16] + [i+1]*8)
+        for request in parser.feed(stream):
+            log.update(request)
+
+        screens = [request.values[0] for request in log.requests[1:]]
+        self.assertEqual(len(screens), 129)
+        expected = Screen(width=128, height=64)
+        for i in range(128):
+            expected.paint(decode_screen_tile(bytes([i+1]*8)), 8*(i%16), 8*(i//16))
+        self.assertEqual(screens[-1], expected)
+        # Tiles are painted on a few shared bases (see MAX_DELTA_DEPTH), not copied in full
+        bases = {id(screen._pages) for screen in screens}
+        self.assertLessEqual(len(bases), 128//MAX_DELTA_DEPTH + 1)
+        self.assertLess(len(pickle.dumps(log)), 64*1024) # 129 full screens would be 132 KB
+
+    def test_dirty_tiles(self):
+        sc = SerialCommunication()
+        parser = RequestParser(sc)
+        parser.feed(bytes([0x40, 0, 0, 0, 0, 2, 0, 2, 1])) # ScreenInit, 2x1 tiles
+        def screen(stream):
+            return parser.feed(stream)[0].values[0]
+
+        full = bytes([0x41, 0, 0, 0, 0, 16, 0] + [0]*8 + [255]*8) # Light up left tile
+        first = screen(full)
+        np.testing.assert_array_equal(first.dirty, [[True, False]])
+        self.assertEqual(first.changed_region(), (0, 0, 8, 8))
+        again = screen(full)
+        np.testing.assert_array_equal(again.dirty, [[False, False]])
+        self.assertIs(again._pages, first._pages)
+
+        tile = screen(bytes([0x42, 0, 0, 0, 0, 10, 0, 1, 0] + [1]*8)) # Top row of right tile
+        np.testing.assert_array_equal(tile.dirty, [[False, True]])
+        self.assertEqual(tile.changed_region(), (8, 0, 8, 8))
+        tile = screen(bytes([0x42, 0, 0, 0, 0, 10, 0, 1, 0] + [1]*8)) # Unchanged
+        self.assertIsNone(tile.changed_region())
+
+        off_screen = parser.feed(bytes([0x42, 0, 0, 0, 0, 10, 0, 2, 0] + [1]*8))[0]
+        self.assertFalse(off_screen.is_valid)
@@ -143,6 +143,27 @@ class TestEvaluator(unittest.TestCase):
         actual = self.evaluator.evaluate(self.log)
         self.assertEqual(actual, expected)
 
+    def test_evaluate_many_points(self):
+        conditions = [Condition(ConditionType.After, cause=0),
+                      Condition(ConditionType.After, cause=5000)] # Never met
+        points = [EvalPoint(condition_id=i%2 if i%7 == 0 else 0, expected_value=i%2,
+                            check_interval=(i*7 % 90, i*7 % 90 + i % 30), portion=0.5)
+                  for i in range(40)]
+        evaluator = Evaluator(conditions, {(OutputType.DigitalWrite, 13): points})
+
+        log = RequestLog()
+        for (i, t) in enumerate(range(0, 100, 15)):
+            log.update(OutputRequest(timestamp=t, data_type=OutputType.DigitalWrite,
+                                     channels=[13], values=[i%2]))
+        log.update(EventRequest(timestamp=100, data_type=EventType.Print, data="foo"))
+
+        sequence = log.extract_sequences()[(OutputType.DigitalWrite, 13)]
+        met_at = [log.condition_satisfied_at(c) for c in conditions]
+        self.assertIsNone(met_at[1])
+        expected = [point.evaluate(met_at[point.condition_id], sequence) for point in points]
+        (_, actual) = evaluator.evaluate(log)[(OutputType.DigitalWrite, 13)]
+        self.assertEqual(actual, expected)
+
     def test_describe(self):
         self.evaluator.points = {(OutputType.DigitalWrite, 13): [
             EvalPoint(condition_id=0, expected_value=1, check_interval=(0,100))
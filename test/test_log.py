@@ -1,6 +1,9 @@
 from src.log import *
 import unittest
+import numpy as np
+import pickle
 
+from src import utils
 from src.condition import Condition
 from src.condition import ConditionType
 from src.request import EventRequest
@@ -58,6 +61,17 @@ class TestRequestLog(unittest.TestCase):
         
         self.assertEqual(self.log.extract_sequences(), expected_sequences)
 
+    def test_extract_sequences_interleaved(self):
+        # Second batch's samples are timed between the first batch's
+        b_params = BatchParams(num=3, period=10)
+        log = RequestLog()
+        log.update(InputRequest(timestamp=100, data_type=InputType.DigitalRead,
+                                channels=[5], values=[0,1,0], batch_params=b_params))
+        log.update(InputRequest(timestamp=105, data_type=InputType.DigitalRead,
+                                channels=[5], values=[1,1,1], batch_params=b_params))
+        expected = Sequence(times=[100, 105, 110, 115, 120, 125], values=[0, 1, 1, 1, 0, 1])
+        self.assertEqual(log.extract_sequences()[(InputType.DigitalRead, 5)], expected)
+
     def test_condition_satisfied_at(self):
         cond0 = Condition(ConditionType.After, cause=lambda req: req.is_output) # First output
         cond1 = Condition(ConditionType.After, cause=50, subconditions=[cond0]) # 50 time units later
@@ -74,3 +88,64 @@ class TestRequestLog(unittest.TestCase):
         self.assertEqual(self.log.requests, self.requests)
         self.assertEqual(log.requests, self.requests[:4])
 
+
+    def test_intern_screens(self):
+        log = RequestLog()
+        for t in range(3):
+            screen = Screen(width=16, height=8)
+            screen.paint(np.ones((8,8)), x=0, y=0)
+            log.update(OutputRequest(t, OutputType.Screen, [None], [screen]))
+        pages = [request.values[0]._pages for request in log.requests]
+        self.assertIs(pages[0], pages[1])
+        self.assertIs(pages[0], pages[2])
+
+        loaded = pickle.loads(pickle.dumps(log))
+        self.assertEqual(loaded, log)
+        self.assertIs(loaded.requests[0].values[0]._pages, loaded.requests[2].values[0]._pages)
+        loaded.update(OutputRequest(3, OutputType.Screen, [None], [log.requests[0].values[0]]))
+        self.assertIs(loaded.requests[3].values[0]._pages, loaded.requests[0].values[0]._pages)
+
+    def test_extract_text(self):
+        screen = utils.load('test/resources/screens/multiline_text')
+        font = utils.load('test/resources/fonts/u8g2_5x7')
+        blank = Screen(width=screen.shape.width, height=screen.shape.height)
+        log = RequestLog()
+        log.update(OutputRequest(100, OutputType.Screen, [None], [blank]))
+        log.update(EventRequest(150, EventType.Print, "foo"))
+        log.update(OutputRequest(200, OutputType.Screen, [None], [screen]))
+        texts = log.extract_text(font, processes=1, cache_dir=None)
+        self.assertEqual(texts, Sequence([100, 200], ["", "This is a multiline stri\nng"]))
+        self.assertEqual(RequestLog().extract_text(font, cache_dir=None), Sequence())
+
+    def test_coalesce_screens(self):
+        blank = Screen(width=16, height=8)
+        def screen_output(t, x, is_tile=True):
+            screen = blank.painted(np.ones((8,8)), x=x, y=0)
+            return OutputRequest(t, OutputType.Screen, [None], [screen], is_tile=is_tile)
+        requests = [
+            screen_output(100, 0), screen_output(101, 8), screen_output(102, 0), # Burst
+            EventRequest(103, EventType.Print, "foo"), # Ends burst
+            screen_output(104, 8),
+            screen_output(200, 0), # Too late to join previous burst
+            screen_output(204, 8),
+            screen_output(206, 0), # Too long since start of burst
+            screen_output(300, 0, is_tile=False), # Full screens are never replaced
+            screen_output(301, 8), screen_output(302, 0),
+            screen_output(303, 8, is_tile=False), # Replaces the half-drawn screen
+            screen_output(304, 0, is_tile=False),
+        ]
+        log = RequestLog(coalesce_window=5)
+        for request in requests:
+            log.update(request)
+        expected = [requests[i] for i in [2, 3, 4, 6, 7, 8, 11, 12]]
+        self.assertEqual(log.requests, expected)
+        self.assertEqual(RequestLog().coalesce_screens(5).requests, [])
+
+        uncoalesced = RequestLog()
+        for request in requests:
+            uncoalesced.update(request)
+        self.assertEqual(uncoalesced.requests, requests)
+        values = [getattr(request, "values", None) for request in uncoalesced.requests]
+        self.assertEqual(uncoalesced.coalesce_screens(5).requests, expected)
+        for (request, request_values) in zip(uncoalesced.requests, values):
+            self.assertIs(getattr(request, "values", None), request_values) # Left unchanged
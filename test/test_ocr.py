@@ -0,0 +1,50 @@
+from src.ocr import *
+import unittest
+import numpy as np
+import os
+import tempfile
+
+from src import utils
+from src.screen import Screen
+
+class TestOcr(unittest.TestCase):
+    def setUp(self):
+        self.screen = utils.load('test/resources/screens/multiline_text')
+        self.font = utils.load('test/resources/fonts/u8g2_5x7')
+        self.text = "This is a multiline stri\nng"
+
+    def test_extract_texts(self):
+        blank = Screen(width=self.screen.shape.width, height=self.screen.shape.height)
+        screens = [self.screen, blank, self.screen.copy(), blank]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            texts = extract_texts(screens, self.font, processes=1, cache_dir=cache_dir)
+            self.assertEqual(texts, [self.text, "", self.text, ""])
+
+            key = options_key(self.font, None, '\n')
+            cache = TextCache(cache_dir, key)
+            self.assertEqual(cache.texts, {self.screen.digest(): self.text, blank.digest(): ""})
+
+            cache.texts[blank.digest()] = "cached" # Cached texts aren't read again
+            cache.save()
+            texts = extract_texts(screens, self.font, processes=1, cache_dir=cache_dir)
+            self.assertEqual(texts, [self.text, "cached", self.text, "cached"])
+
+            texts = extract_texts(screens, self.font, processes=1, cache_dir=cache_dir,
+                                  line_delimeter="|") # Options have their own cache
+            self.assertEqual(texts, ["This is a multiline stri|ng|", "", texts[0], ""])
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+            with open(cache.path, "wb") as f:
+                f.write(b"garbage")
+            self.assertEqual(TextCache(cache_dir, key).texts, {})
+
+    def test_parallel(self):
+        screens = []
+        for i in range(2*MIN_PARALLEL_SCREENS):
+            screen = self.screen.copy()
+            screen.paint(np.ones((1, i % 16 + 1), dtype=np.uint8), x=0, y=i // 16)
+            screens.append(screen)
+        expected = extract_texts(screens, self.font, processes=1, cache_dir=None)
+        texts = extract_texts(screens, self.font, processes=2, cache_dir=None)
+        self.assertEqual(texts, expected)
+        self.assertIn(self.text, texts)
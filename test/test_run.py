@@ -0,0 +1,75 @@
+from src.run import *
+import threading
+import unittest
+import unittest.mock
+
+
+from src.condition import Condition
+from src.condition import ConditionType
+from src.handler import RequestHandler
+from src.request import EventRequest
+from src.timing import StageTimer
+from src.transport import FdTransport
+from src.transport import PipeTransport
+from src.transport import PtyTransport
+from src.transport import TransportClosed
+from src.utils import EventType
+
+class TestRunSession(unittest.TestCase):
+    def test_pipe_transport(self):
+        host, client = PipeTransport.pair()
+        client.write(bytes([0x00, 1, 0, 0, 0, 0, 0]) # Init at t=1
+                     + bytes([0x20, 3, 0, 0, 0, 2, 0, 6, 0])) # Read pin 6 at t=3
+        handler = RequestHandler(end_condition=Condition(ConditionType.After, cause=3))
+        log = run_session(handler, transport=host)
+        self.assertEqual(log.requests[0], EventRequest(1, EventType.Init))
+        self.assertEqual(len(log.requests), 2)
+        self.assertEqual(client.read(), bytes([0x80, 0, 0, 0x81, 1, 0, 0])) # Ack, then value 0
+
+    def test_timer(self):
+        host, client = PipeTransport.pair()
+        client.write(bytes([0x00, 1, 0, 0, 0, 0, 0]) # Init at t=1
+                     + bytes([0x20, 3, 0, 0, 0, 2, 0, 6, 0])) # Read pin 6 at t=3
+        handler = RequestHandler(end_condition=Condition(ConditionType.After, cause=3))
+        timer = StageTimer()
+        run_session(handler, transport=host, timer=timer)
+        summary = timer.summary()
+        self.assertEqual(set(summary), {"Init", "DigitalRead"})
+        self.assertEqual(set(summary["Init"]), {"read", "decode", "handle", "encode", "write"})
+        self.assertEqual(summary["DigitalRead"]["handle"]["count"], 1)
+
+    def test_timeout(self):
+        host, client = PipeTransport.pair()
+        client.write(bytes([0x00, 1, 0, 0, 0, 0, 0]))
+        log = run_session(RequestHandler(), transport=host, timeout=0.01)
+        self.assertEqual(len(log.requests), 1)
+
+    def test_closes_transport(self):
+        host, client = PipeTransport.pair()
+        client.write(bytes([0x00, 1, 0, 0, 0, 0, 0]))
+        run_session(RequestHandler(), transport=host, timeout=0.01)
+        host.write(b"still open") # Given transports are the caller's to close
+
+        host, client = PipeTransport.pair()
+        client.write(bytes([0x00, 1, 0, 0, 0, 0, 0]))
+        with unittest.mock.patch("src.communication.open_transport", return_value=host):
+            log = run_session(RequestHandler(), addr="tcp:localhost:1", timeout=0.01)
+        self.assertEqual(len(log.requests), 1)
+        with self.assertRaises(TransportClosed): # Opened by run_session, so closed by it
+            host.write(b"closed")
+
+    def test_pty_client_close(self):
+        host = PtyTransport()
+        client = FdTransport.open_path(host.slave_path)
+        client.write(bytes([0x00, 1, 0, 0, 0, 0, 0])) # Init at t=1
+        client.close()
+        session = threading.Thread(target=run_session, args=(RequestHandler(),),
+                                   kwargs={"transport": host}, daemon=True)
+        session.start()
+        session.join(timeout=5)
+        self.assertFalse(session.is_alive()) # The session ends when the client closes
+        host.close()
+
+    def test_connect_timeout(self):
+        log = run_session(RequestHandler(), addr="tty:/nonexistent/ttyACM0", connect_timeout=0.05)
+        self.assertEqual(len(log.requests), 0)
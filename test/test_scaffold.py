@@ -12,6 +12,7 @@ from src.request import InputRequest
 from src.request import OutputRequest
 from src.screen import Screen
 from src.sequence import InterpolationType
+from src.sequence import LinearSequence
 from src.sequence import Sequence
 from src.utils import EventType
 from src.utils import InputType
@@ -230,7 +231,10 @@ class ScaffoldTest(unittest.TestCase):
         expected = {(InputType.DigitalRead, 6): seq}
         actual = self.scaffold.generate_inputs(overall_sequences, start_time,
                                                end_time, init_to_default)
-        self.assertEqual(actual, expected)       
+        self.assertEqual(actual, expected)
+        actual_seq = actual[(InputType.DigitalRead, 6)]
+        self.assertIs(type(actual_seq), LinearSequence) # Only the original points are kept
+        self.assertEqual(len(actual_seq), len(times))       
 
     def test_generate_eval_points(self):
         overall_sequences = self.log.extract_sequences()
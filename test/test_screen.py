@@ -1,6 +1,8 @@
 from src.screen import *
 import unittest
+import unittest.mock
 import numpy as np
+import pickle
 from PIL import Image
 
 from src import utils
@@ -26,6 +28,144 @@ class TestScreen(unittest.TestCase):
         expected[0,0] = 1
         self.assertTrue(np.array_equal(screen2.get_box(0,0,2,3), expected))
 
+    def test_copy_on_write(self):
+        screen1 = Screen(width=16, height=8)
+        screen2 = screen1.painted(np.ones((8,8)), x=8, y=0)
+        self.assertEqual(screen1.get_num_pixels_lit(), 0)
+        self.assertEqual(screen2.get_num_pixels_lit(), 64)
+        self.assertIs(screen2._pages, screen1._pages) # Unpainted pixels are shared
+
+        screen3 = screen2.copy()
+        self.assertEqual(screen2, screen3)
+        screen3.buffer[0,0] = 1 # Only affects screen3
+        self.assertEqual(screen1.get_num_pixels_lit(), 0)
+        self.assertEqual(screen2.get_num_pixels_lit(), 64)
+        self.assertEqual(screen3.get_num_pixels_lit(), 65)
+
+        screen1.paint(np.ones((1,1)), x=0, y=0) # Also only affects screen1
+        self.assertEqual(screen1.get_num_pixels_lit(), 1)
+        self.assertEqual(screen2.get_num_pixels_lit(), 64)
+
+        expected = np.zeros((8,16))
+        expected[:,8:] = 1
+        self.assertTrue(np.array_equal(screen2.buffer, expected))
+
+    def test_painted_chain(self):
+        screen = Screen(width=128, height=64)
+        expected = np.zeros((64,128))
+        for i in range(2*MAX_DELTA_DEPTH + 1):
+            x, y = 8*(i%16), 8*(i//16)
+            screen = screen.painted(np.ones((8,8)), x=x, y=y)
+            expected[y:y+8,x:x+8] = 1
+        self.assertLessEqual(screen._depth, MAX_DELTA_DEPTH)
+        self.assertTrue(np.array_equal(screen.get_box(0,0,128,64), expected))
+        self.assertEqual(screen, Screen(buff=expected))
+
+    def test_pickle(self):
+        screen1 = Screen(width=16, height=8)
+        screen2 = screen1.painted(np.ones((8,8)), x=0, y=0)
+        (loaded1, loaded2) = pickle.loads(pickle.dumps((screen1, screen2)))
+        self.assertEqual(loaded1, screen1)
+        self.assertEqual(loaded2, screen2)
+        self.assertIs(loaded1._pages, loaded2._pages) # Shared pages are only saved once
+        loaded1.buffer[0,0] = 1
+        self.assertEqual(loaded2, screen2)
+
+    def test_unpickle_buffer(self): # Screens saved before they were packed
+        buff = np.eye(8, 16, dtype=np.uint8)
+        screen = Screen.__new__(Screen)
+        screen.__setstate__({"buffer": buff, "shape": ScreenShape(width=16, height=8)})
+        self.assertEqual(screen, Screen(buff=buff))
+        self.assertIsNone(screen.dirty)
+
+    def test_screen_pool(self):
+        pool = ScreenPool()
+        blank = Screen(width=16, height=8)
+        lit = blank.painted(np.ones((8,8)), x=0, y=0)
+        self.assertIs(pool.intern(blank), blank)
+        self.assertIs(pool.intern(lit), lit) # Keeps sharing blank's pages
+        self.assertIs(lit._pages, blank._pages)
+        interned = pool.intern(Screen.from_pages(lit.to_pages(), 16, 8))
+        self.assertEqual(interned, lit)
+
+        again = Screen(width=16, height=8)
+        again.paint(np.ones((8,8)), x=0, y=0) # Owns a buffer
+        self.assertIs(pool.intern(again)._pages, interned._pages)
+        self.assertIs(pool.intern(Screen(width=16, height=8))._pages, blank._pages)
+        self.assertEqual(len(pool), 2)
+
+        interned.buffer[0,8] = 1 # Doesn't affect the other interned screens
+        self.assertEqual(pool.intern(again), lit)
+        self.assertNotEqual(interned, lit)
+        self.assertNotEqual(interned.digest(), lit.digest())
+
+        self.assertEqual(len(pool), 1) # Pages nothing uses any more are forgotten
+        del blank, lit
+        self.assertEqual(len(pool), 0)
+
+    def test_changed_tiles(self):
+        screen = Screen(width=20, height=12) # Partial tiles on the right and bottom
+        self.assertEqual(screen.changed_region(), (0, 0, 20, 12)) # Unknown
+        other = screen.copy()
+        other.paint(np.ones((1, 1)), x=17, y=9)
+        dirty = changed_tiles(screen.to_pages(), other.to_pages())
+        np.testing.assert_array_equal(dirty, [[False, False, False], [False, False, True]])
+
+        other = screen.painted_tile(np.ones((8, 8)), x=1, y=0)
+        np.testing.assert_array_equal(other.dirty, [[False, True, False], [False, False, False]])
+        self.assertEqual(other.changed_region(), (8, 0, 8, 8))
+        self.assertEqual(other.copy().changed_region(), (8, 0, 8, 8))
+        self.assertIsNone(other.painted_tile(np.ones((8, 8)), x=1, y=0).changed_region())
+        np.testing.assert_array_equal(pickle.loads(pickle.dumps(other)).dirty, other.dirty)
+
+        other.dirty = np.array([[True, False, False], [False, False, True]])
+        self.assertEqual(other.changed_region(), (0, 0, 20, 12)) # Clipped to the screen
+        other.buffer[0, 0] = 1
+        self.assertIsNone(other.dirty) # Unknown once modified in place
+
+    def test_painted_tile_deltas(self):
+        rng = np.random.RandomState(2)
+        screen = Screen(width=20, height=12) # Partial tiles on the right and bottom
+        buff = np.zeros((12, 20), dtype=np.uint8)
+        for i in range(100):
+            x, y = rng.randint(0, 3), rng.randint(0, 2)
+            tile = rng.randint(0, 2, size=(8, 8)).astype(np.uint8)
+            if rng.randint(0, 4) == 0:
+                tile[:] = buff[8*y:8*y+8,8*x:8*x+8][:1,:1].repeat(8, 0).repeat(8, 1)
+            if rng.randint(0, 8) == 0: # A rect partly covering tiles
+                rect = rng.randint(0, 2, size=(3, 3)).astype(np.uint8)
+                screen = screen.painted(rect, 8*x+1, 8*y+1)
+                buff[8*y+1:8*y+4,8*x+1:8*x+4] = rect
+            previous = pack_pixels(buff)
+            screen = screen.painted_tile(tile, x, y)
+            buff[8*y:8*y+8,8*x:8*x+8] = tile[:buff.shape[0]-8*y,:buff.shape[1]-8*x]
+            np.testing.assert_array_equal(screen.dirty, changed_tiles(previous, pack_pixels(buff)))
+        self.assertTrue(np.array_equal(screen.buffer, buff))
+
+        # Tiles are compared without flattening the screen
+        screen = Screen(width=16, height=8).painted_tile(np.ones((8, 8)), x=0, y=0)
+        with unittest.mock.patch.object(Screen, "_flatten") as flatten:
+            for i in range(MAX_DELTA_DEPTH - 1):
+                screen = screen.painted_tile(np.eye(8) if i % 2 else np.ones((8, 8)), x=i % 2, y=0)
+        flatten.assert_not_called()
+
+    def test_packed(self):
+        rng = np.random.RandomState(1)
+        buff = rng.randint(0, 2, size=(13, 10)).astype(np.uint8) # Height not a multiple of 8
+        screen = Screen(buff=buff)
+        self.assertEqual(screen.to_pages().shape, (2, 10))
+        self.assertTrue(np.array_equal(unpack_pixels(screen.to_pages(), 13), buff))
+        self.assertEqual(screen.get_num_pixels_lit(), buff.sum())
+        for (x, y, width, height) in [(0, 0, 10, 13), (2, 5, 3, 6), (4, 9, 6, 10), (0, 12, 1, 1)]:
+            self.assertTrue(np.array_equal(screen.get_box(x, y, width, height),
+                                           buff[y:y+height,x:x+width]))
+        self.assertEqual(Screen.from_pages(screen.to_pages(), 10, 13), screen)
+
+        other = np.copy(buff)
+        other[12,9] ^= 1 # Only differs in the last page
+        self.assertNotEqual(Screen(buff=other), screen)
+        self.assertEqual(screen.get_num_matching_pixels(Screen(buff=other)), 13*10 - 1)
+
     def test_get_box_values(self):
         screen = Screen(width=4, height=3)
         rect = np.ones((2,2))
@@ -39,7 +179,19 @@ class TestScreen(unittest.TestCase):
             [0, 0, 0, 0]
         ]
         actual = screen.get_box_values(box_width, box_height)
-        self.assertEqual(actual, expected)
+        self.assertTrue(np.array_equal(actual, expected))
+
+        # Compare with a straightforward packing of each box, for boxes up to 64 bits and beyond
+        rng = np.random.RandomState(0)
+        screen = Screen(buff=rng.randint(0, 2, size=(12, 20)).astype(np.uint8))
+        padded = np.zeros((30, 40), dtype=np.uint8)
+        padded[:12,:20] = screen.buffer
+        for (box_width, box_height) in [(1, 1), (5, 7), (8, 8), (6, 11), (9, 9)]:
+            actual = screen.get_box_values(box_width, box_height)
+            self.assertEqual(actual.shape, (12, 20))
+            for (y, x) in [(0, 0), (3, 7), (11, 19), (5, 15)]:
+                box = padded[y:y+box_height,x:x+box_width]
+                self.assertEqual(actual[y,x], utils.bitmap_to_int(box.astype(object)))
 
     def test_extract_text(self):
         screen = utils.load('test/resources/screens/multiline_text')
@@ -48,6 +200,65 @@ class TestScreen(unittest.TestCase):
         expected = "This is a multiline stri\nng"
         self.assertEqual(actual, expected)
 
+    def test_compiled_font(self):
+        screen = utils.load('test/resources/screens/multiline_text')
+        font = utils.load('test/resources/fonts/u8g2_5x7')
+        compiled = compile_font(font)
+        self.assertIs(compile_font(font), compiled)
+        self.assertIs(compile_font(compiled), compiled)
+        others = [Font(font.width, font.height, dict(font.chars))
+                  for _ in range(COMPILED_FONTS_SIZE)]
+        for other in others:
+            self.assertIsNot(compile_font(other), compiled)
+        self.assertEqual(len(COMPILED_FONTS), COMPILED_FONTS_SIZE) # font was least recently used
+        self.assertIsNot(compile_font(font), compiled)
+
+        # Reference: look up every box, one at a time
+        lut = {val: chr(key) for (key, val) in font.chars.items()}
+        def reference(ignored_chars, line_delimeter):
+            labels = screen.get_box_values(font.width, font.height)
+            text = ""
+            for row in labels:
+                line = "".join(lut.get(int(v), "") for v in row)
+                line = "".join(c for c in line if c not in ignored_chars).strip()
+                if " " in ignored_chars:
+                    line = "".join(line.split())
+                else:
+                    line = " ".join(line.split())
+                if line:
+                    text += line + line_delimeter
+            return text.strip()
+
+        for ignored_chars in [set(), {"i"}, {" "}, {" ", "s", "T"}]:
+            for line_delimeter in ["\n", "|"]:
+                actual = screen.extract_text(font, ignored_chars=ignored_chars,
+                                             line_delimeter=line_delimeter)
+                self.assertEqual(actual, reference(ignored_chars, line_delimeter))
+
+        blank = Screen(width=screen.shape.width, height=screen.shape.height)
+        texts = extract_texts([screen, blank, screen.copy()], font)
+        self.assertEqual(texts, ["This is a multiline stri\nng", "", "This is a multiline stri\nng"])
+
+    def test_compiled_font_over_64_bits(self):
+        # Box values of 8x9 glyphs don't fit in uint64 (see get_box_values)
+        rng = np.random.RandomState(0)
+        bitmaps = {c: rng.randint(0, 2, size=(9, 8)) for c in "AB"}
+        font = Font(width=8, height=9, chars={ord(c): utils.bitmap_to_int(bitmap.astype(object))
+                                              for (c, bitmap) in bitmaps.items()})
+        screen = Screen(width=40, height=24)
+        for (c, x, y) in [("A", 0, 0), ("B", 10, 0), ("B", 4, 12)]:
+            screen.paint(bitmaps[c], x, y)
+        self.assertEqual(screen.extract_text(font), "AB\nB")
+
+    def test_digest(self):
+        screen = utils.load('test/resources/screens/multiline_text')
+        self.assertEqual(screen.digest(), screen.copy().digest())
+        other = screen.copy()
+        other.paint(1 - other.buffer[:1, :1], 0, 0)
+        self.assertNotEqual(screen.digest(), other.digest())
+        self.assertNotEqual(Screen(width=8, height=16).digest(),
+                            Screen(width=16, height=8).digest())
+
     def test_get_num_matching_pixels(self):
         buffer1 = np.zeros((3,3), dtype=np.uint8)
         buffer1[0:2,0:2] = 1
@@ -77,6 +288,38 @@ class TestScreen(unittest.TestCase):
         with self.assertRaises(ValueError):
             screen2.get_num_matching_pixels(screen3)
 
+    def test_get_shift_matches(self):
+        rng = np.random.RandomState(2)
+        buff1 = rng.randint(0, 2, size=(11, 14)).astype(np.uint8)
+        buff2 = rng.randint(0, 2, size=(11, 14)).astype(np.uint8)
+        screen1, screen2 = Screen(buff=buff1), Screen(buff=buff2)
+        (left, right, up, down) = (2, 3, 1, 4)
+        matches = screen1.get_shift_matches(screen2, left=left, right=right, up=up, down=down)
+        self.assertEqual(matches.shape, (up+down+1, left+right+1))
+
+        padded = np.zeros((11+up+down, 14+left+right), dtype=np.uint8)
+        padded[up:up+11,left:left+14] = buff1
+        for y_shift in range(-up, down+1): # Compare each shift directly
+            for x_shift in range(-left, right+1):
+                window = padded[y_shift+up:y_shift+up+11,x_shift+left:x_shift+left+14]
+                self.assertEqual(matches[y_shift+up,x_shift+left], (window == buff2).sum())
+        self.assertEqual(screen1.get_num_matching_pixels(screen2, left=left, right=right,
+                                                         up=up, down=down), matches.max())
+
+    def test_matches_at_least(self):
+        buffer1 = np.zeros((3,3), dtype=np.uint8)
+        buffer1[0:2,0:2] = 1
+        buffer2 = np.zeros((3,3), dtype=np.uint8)
+        buffer2[1:3,1:3] = 1
+        screen1, screen2 = Screen(buff=buffer1), Screen(buff=buffer2)
+        self.assertTrue(screen1.matches_at_least(screen2, 3))
+        self.assertFalse(screen1.matches_at_least(screen2, 4))
+        self.assertTrue(screen1.matches_at_least(screen2, 9, shift=1))
+        self.assertFalse(screen1.matches_at_least(screen2, 9, right=1, down=1))
+        blank = Screen(width=3, height=3)
+        self.assertFalse(blank.matches_at_least(screen2, 6, shift=1)) # 4 lit pixels unmatchable
+        with self.assertRaises(ValueError):
+            screen1.matches_at_least(Screen(width=4, height=4), 1)
 
     def test_check_functions(self):
         screen_i = Screen(buff=np.eye(3, dtype=np.uint8))
@@ -1,5 +1,51 @@
 from src.sequence import *
+import bisect
+import random
 import unittest
+import numpy as np
+
+from src.screen import Screen
+
+# profile_interval as it was before values were grouped by key, which results must match
+# exactly: portions are summed in order, and sorted stably
+def baseline_profile(times, values, interval):
+    (start, end) = interval
+    if start >= end:
+        return []
+    start_index = bisect.bisect(times, start)
+    if start_index > 0:
+        start_index -= 1 # include lead-in value
+    end_index = bisect.bisect(times, end)
+    if end_index > 0 and end==times[end_index-1]:
+        end_index -= 1 # exclude exact end
+    times = times[start_index:end_index]
+    values = values[start_index:end_index]
+    if len(times) > 0:
+        times[0] = max(times[0], start)
+
+    profile = []
+    for i in range(len(times)):
+        next_time = times[i+1] if i+1 < len(times) else end
+        portion = (next_time-times[i])/(end-start)
+        for j in range(len(profile)):
+            if values[i] == profile[j][0]:
+                profile[j] = (profile[j][0], profile[j][1] + portion)
+                break
+        else:
+            profile.append((values[i], portion))
+    return sorted(profile, key=lambda val: val[1], reverse=True)
+
+# Returns random increasing times (floats if real), values from choices, and intervals
+def random_profile_case(rand, num_points, choices, real):
+    span = 10*num_points
+    if real:
+        times = sorted(set(rand.uniform(0, span) for _ in range(num_points)))
+    else:
+        times = sorted(rand.sample(range(span), num_points))
+    values = [rand.choice(choices) for _ in times]
+    bounds = times + [rand.uniform(-10, span+10) for _ in times]
+    intervals = [(rand.choice(bounds), rand.choice(bounds)) for _ in range(50)]
+    return (times, values, intervals)
 
 class TestSequence(unittest.TestCase):
     def setUp(self):
@@ -99,6 +145,76 @@ class TestSequence(unittest.TestCase):
         self.assertEqual(seq.profile_interval((250,250)), [])
         self.assertEqual(seq.profile_interval((0,200)), [])
 
+    def test_profile_interval_keys(self):
+        blank = Screen(width=8, height=8)
+        lit = blank.painted(np.ones((8, 8)), x=0, y=0)
+        frames = [blank, lit, blank.copy(), lit.copy(), Screen(width=8, height=8)]
+        seq = Sequence(times=[0, 10, 20, 30, 40], values=frames)
+        self.assertEqual(seq.profile_interval((0, 100)), [(blank, 0.8), (lit, 0.2)])
+
+        seq = Sequence(times=[0, 10, 20, 30], values=[[1], "foo", [1], []]) # Unhashable
+        self.assertEqual(seq.profile_interval((0, 40)), [([1], 0.5), ("foo", 0.25), ([], 0.25)])
+
+        class Colliding: # Equal digests, but not equal
+            def __init__(self, n):
+                self.n = n
+            def digest(self):
+                return b"same"
+            def __eq__(self, other):
+                return self.n == other.n
+        values = [Colliding(1), Colliding(2), Colliding(1)]
+        seq = Sequence(times=[0, 10, 30], values=values)
+        self.assertEqual(seq.profile_interval((0, 40)), [(values[0], 0.5), (values[1], 0.5)])
+
+    def test_profile_interval_baseline(self):
+        rand = random.Random(1)
+        for real in [False, True]:
+            for _ in range(20):
+                (times, values, intervals) = random_profile_case(rand, 30, [0, 1.5, -2], real)
+                seq = Sequence(times, values)
+                array_seq = Sequence(times, values).to_arrays()
+                mixed_seq = Sequence(times, [rand.choice([1, 2.5, "a", (1, 2), [1]])
+                                             for _ in times])
+                for interval in intervals:
+                    expected = baseline_profile(times, values, interval)
+                    self.assertEqual(seq.profile_interval(interval), expected)
+                    self.assertEqual(array_seq.profile_interval(interval), expected)
+                    self.assertEqual(mixed_seq.profile_interval(interval),
+                                     baseline_profile(times, mixed_seq.values, interval))
+
+    def test_profile_intervals(self):
+        seq = Sequence(times=[200, 300, 700, 900], values=[0, 1, 0, 2])
+        intervals = [(250, 450), (0, 800), (300, 700), (250, 250), (0, 200), (800, 1000),
+                     (700, 300), (300, 700)] # Unsorted, overlapping and empty
+        expected = [seq.profile_interval(interval) for interval in intervals]
+        self.assertEqual(seq.profile_intervals(intervals), expected)
+        self.assertEqual(seq.to_arrays().profile_intervals(intervals), expected)
+        self.assertEqual(seq.profile_intervals([]), [])
+
+    def test_profile_long_intervals(self):
+        class Colliding: # Unhashable, so all instances share a key
+            __hash__ = None
+            def __init__(self, n):
+                self.n = n
+            def __eq__(self, other):
+                return type(other) is Colliding and self.n == other.n
+        rand = random.Random(0)
+        for real in [False, True]:
+            (times, values, intervals) = random_profile_case(rand, 2000, [0, 1.5, -2], real)
+            intervals += [(-100, 30000), (times[0], times[-1]), (times[5], times[6])]
+            seqs = [Sequence(times, values), Sequence(times, values).to_arrays(),
+                    Sequence(times, [Colliding(rand.randrange(5)) for _ in times]),
+                    Sequence(times, [rand.choice([1, 2.5, "a", (1, 2), Colliding(1)])
+                                     for _ in times])]
+            for seq in seqs:
+                profiles = seq.profile_intervals(intervals) # Long and overlapping, so grouped
+                expected = [baseline_profile(times, list(seq.values), interval)
+                            for interval in intervals]
+                self.assertEqual(profiles, expected)
+                for profile in profiles:
+                    for (value, portion) in profile:
+                        self.assertIs(type(portion), float) # Not a numpy scalar
+
     def test_remove_duplicates(self):
         seq = Sequence(times=[0,1,2,3,4], values=[10,10,11,10,10])
         seq2 = seq.remove_duplicates()
@@ -119,3 +235,99 @@ class TestSequence(unittest.TestCase):
 
         seq4 = seq.interpolate(InterpolationType.Linear, res=2)
         self.assertEqual(seq4, Sequence(times=[0,2,4,5,7,9], values=[0, 0.4, 0.8, 1, 1.5, 2]))
+
+    def test_from_unsorted(self):
+        seq = Sequence.from_unsorted([20, 0, 10, 0], ["c", "a", "b", "a2"])
+        self.assertEqual(seq, Sequence(times=[0, 0, 10, 20], values=["a", "a2", "b", "c"]))
+        seq = Sequence.from_unsorted(np.array([20, 0, 10]), np.array([3, 1, 2]))
+        self.assertTrue(seq.is_array)
+        self.assertEqual(seq, Sequence(times=[0, 10, 20], values=[1, 2, 3]))
+        self.assertEqual(Sequence.from_unsorted([], []), Sequence())
+
+    def test_merge(self):
+        seq0 = Sequence(times=[0, 10, 20], values=["a", "b", "c"])
+        seq1 = Sequence(times=[5, 10, 30], values=["x", "y", "z"])
+        expected = Sequence(times=[0, 5, 10, 10, 20, 30], values=["a", "x", "b", "y", "c", "z"])
+        self.assertEqual(Sequence.merge([seq0, Sequence(), seq1]), expected)
+        self.assertEqual(Sequence.merge([]), Sequence())
+
+        numbers = Sequence(times=[5, 15], values=[1.5, 2])
+        merged = Sequence.merge([numbers, Sequence(times=[0], values=[0]).to_arrays()])
+        self.assertTrue(merged.is_array)
+        self.assertEqual(merged, Sequence(times=[0, 5, 15], values=[0, 1.5, 2]))
+        self.assertFalse(Sequence.merge([seq0, numbers.to_arrays()]).is_array)
+
+    def test_insert_many(self):
+        seq = Sequence(times=[0, 10, 20], values=[0, 1, 2])
+        self.assertIs(seq.insert_many([5, 10, 25], [3, 4, 5]), seq)
+        self.assertEqual(seq, Sequence(times=[0, 5, 10, 10, 20, 25], values=[0, 3, 1, 4, 2, 5]))
+        expected = seq.copy().insert(12, 6).insert(13, 7)
+        self.assertEqual(seq.insert_many([12, 13], [6, 7]), expected)
+
+class TestArraySequence(unittest.TestCase):
+    def setUp(self):
+        times = [0, 10, 20, 30, 45, 60, 61]
+        values = [1.5, 2, 2, -1, 1.5, 3, 3]
+        self.seq = Sequence(times, values)
+        self.array_seq = Sequence(times, values).to_arrays()
+
+    def test_to_arrays(self):
+        self.assertTrue(self.array_seq.is_array)
+        self.assertFalse(self.seq.is_array)
+        self.assertEqual(self.array_seq, self.seq)
+        self.assertEqual(self.seq, self.array_seq)
+        self.assertEqual(repr(self.array_seq), repr(Sequence(self.seq.times, [1.5, 2.0, 2.0,
+                                                  -1.0, 1.5, 3.0, 3.0])))
+        self.assertFalse(Sequence([0, 1], [1, "foo"]).to_arrays().is_array)
+        self.assertEqual(Sequence.from_arrays([], []), Sequence())
+
+        self.array_seq.append(70, "foo") # Goes back to lists
+        self.assertFalse(self.array_seq.is_array)
+        self.assertEqual(self.array_seq[-1], (70, "foo"))
+
+    def test_queries(self):
+        for t in [-1, 0, 5, 10, 44.99, 45, 100]:
+            self.assertEqual(self.array_seq.get_sample(t), self.seq.get_sample(t))
+        for (start, num, period) in [(-1, 3, 5), (0, 0, 5), (0, 20, 3.3), (29, 5, 0.5)]:
+            self.assertEqual(self.array_seq.get_samples(start, num, period),
+                             self.seq.get_samples(start, num, period))
+        for (start, end) in [(0, 100), (5, 30), (10, 10), (12, 61), (12.5, 61), (70, 80)]:
+            for include_start_sample in [False, True]:
+                subseq = self.array_seq.get_subsequence(start, end, include_start_sample)
+                self.assertTrue(subseq.is_array or len(subseq) == 0)
+                self.assertEqual(subseq, self.seq.get_subsequence(start, end,
+                                                                  include_start_sample))
+            self.assertEqual(self.array_seq.profile_interval((start, end)),
+                             self.seq.profile_interval((start, end)))
+        self.assertEqual(self.array_seq.times.tolist(), self.seq.times) # Unchanged
+        self.assertEqual(self.array_seq[1:3], self.seq[1:3])
+        self.assertIs(type(self.array_seq[1].value), float) # Not a numpy scalar
+
+    def test_transforms(self):
+        self.assertEqual(self.array_seq.copy().shift(5), self.seq.copy().shift(5))
+        self.assertEqual(self.array_seq.copy().remove_duplicates(),
+                         self.seq.copy().remove_duplicates())
+        for interpolation_type in InterpolationType:
+            self.assertEqual(self.array_seq.interpolate(interpolation_type, res=4),
+                             self.seq.interpolate(interpolation_type, res=4))
+
+class TestLinearSequence(unittest.TestCase):
+    def setUp(self):
+        self.seq = LinearSequence(times=[0, 5, 9, 20], values=[0, 1, 2, -3.5], res=2)
+        self.materialized = Sequence(times=[0, 5, 9, 20], values=[0, 1, 2, -3.5]).interpolate(
+            InterpolationType.Linear, res=2)
+
+    def test_materialize(self):
+        self.assertEqual(self.seq.materialize(), self.materialized)
+        self.assertEqual(self.seq, self.materialized)
+        self.assertEqual(self.seq, self.seq.copy())
+        self.assertNotEqual(self.seq, LinearSequence(self.seq.times, self.seq.values, res=1))
+
+    def test_get_sample(self):
+        for t in [-1, 0, 0.5, 1.99999, 2, 4.5, 5, 6, 8.9999, 9, 12, 19, 20, 100]:
+            self.assertEqual(self.seq.get_sample(t), self.materialized.get_sample(t))
+
+    def test_get_samples(self):
+        for (start, num, period) in [(-1, 3, 5), (0, 0, 5), (0, 20, 3.3), (1, 15, 1), (19, 5, 0.5)]:
+            self.assertEqual(self.seq.get_samples(start, num, period),
+                             self.materialized.get_samples(start, num, period))
@@ -0,0 +1,106 @@
+from src.simulator import *
+import unittest
+
+import numpy as np
+
+from src.communication import RequestParser
+from src.condition import Condition
+from src.condition import ConditionType
+from src.request import InvalidRequest
+from src.response import ErrorResponse
+from src.transport import FdTransport
+from src.transport import PtyTransport
+
+class TestEncoding(unittest.TestCase):
+    def test_request_to_bytes(self):
+        a_params = AnalogParams(-2, -1, 0, 1)
+        b_params = BatchParams(num=2, period=0.256)
+        screen = Screen(buff=np.eye(8, 16, dtype=np.uint8))
+        no_response = EventRequest(7, EventType.Print, "quiet")
+        no_response.response_expected = False
+        requests = [
+            EventRequest(1, EventType.Init),
+            EventRequest(2, EventType.Print, "hello"),
+            no_response,
+            EventRequest(3, EventType.ScreenInit, ScreenShape(16, 8)),
+            EventRequest(4, EventType.Gps),
+            EventRequest(5, EventType.Wifi, "request"),
+            EventRequest(6, EventType.Wifi, "response"),
+            InputRequest(10, InputType.DigitalRead, [13]),
+            InputRequest(11, InputType.DigitalRead, [13], values=[1, 0], batch_params=b_params),
+            InputRequest(12, InputType.AnalogRead, [14], analog_params=a_params),
+            InputRequest(13, InputType.Accelerometer, THREE_AXIS, values=[-5, 0, 2**31-1],
+                         analog_params=a_params),
+            InputRequest(14, InputType.Gyroscope, THREE_AXIS, analog_params=a_params,
+                         batch_params=b_params),
+            InputRequest(15, InputType.Magnetometer, THREE_AXIS, analog_params=a_params),
+            OutputRequest(20, OutputType.DigitalWrite, [255], [1]),
+            OutputRequest(21, OutputType.AnalogWrite, [3], [-1], a_params),
+            OutputRequest(22, OutputType.Screen, [None], [screen]),
+        ]
+        stream = bytes()
+        for request in requests:
+            stream += request_to_bytes(request)
+        self.assertEqual(RequestParser().feed(stream), requests)
+
+        self.assertIsNone(request_to_bytes(InvalidRequest(0)))
+
+    def test_bytes_to_response(self):
+        digital = InputRequest(0, InputType.DigitalRead, [13])
+        analog = InputRequest(0, InputType.AnalogRead, [13], analog_params=AnalogParams(0,1,0,1))
+        parser = ResponseParser()
+        messages = parser.feed(bytes([0x80, 0, 0, 0x81, 2, 0, 1, 0, 0x83]))
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(parser.pending, bytes([0x83]))
+        self.assertEqual(bytes_to_response(*messages[0], digital), AckResponse())
+        self.assertEqual(bytes_to_response(*messages[1], digital),
+                         ValuesResponse([1, 0], analog=False, complete=True))
+        self.assertEqual(bytes_to_response(0x80, bytes([254, 255, 255, 255]), analog),
+                         ValuesResponse([-2], analog=True))
+        self.assertEqual(bytes_to_response(0x83, bytes(), analog), ErrorResponse(complete=True))
+        self.assertIsNone(bytes_to_response(0x80, bytes([1, 2, 3]), analog))
+        self.assertIsNone(bytes_to_response(0x20, bytes(), analog))
+
+    def test_check_response(self):
+        request = InputRequest(0, InputType.DigitalRead, [13])
+        self.assertIsNone(check_response(request, ValuesResponse([0], analog=False)))
+        self.assertIsNotNone(check_response(request, ValuesResponse([0, 1], analog=False)))
+        self.assertIsNotNone(check_response(request, AckResponse()))
+        self.assertIsNotNone(check_response(request, ErrorResponse()))
+        self.assertIsNotNone(check_response(request, None))
+        self.assertIsNone(check_response(EventRequest(0, EventType.Init), AckResponse()))
+
+class TestSimulate(unittest.TestCase):
+    def test_synthetic_pipe(self):
+        requests = synthetic_requests(20, batch_size=4, screen_every=5)
+        report, log = simulate(requests)
+        self.assertEqual(report.problems, [])
+        self.assertEqual(report.messages, len(requests))
+        self.assertEqual(report.responses, len(requests))
+        self.assertEqual(len(report.latencies), len(requests))
+        self.assertEqual(len(log.requests), len(requests))
+        self.assertEqual(log.requests[-1], requests[-1]) # Screens survive the round trip
+        self.assertIn("Latency p99 (us)", report.describe())
+
+    def test_extra_response(self):
+        host, client = PipeTransport.pair()
+        host.write(bytes([0x80, 0, 0]) * 2) # Two acks for one Init
+        init = EventRequest(0, EventType.Init)
+        report = DeviceSimulator(client, [init], response_timeout=1).run()
+        self.assertEqual(report.responses, 1)
+        self.assertEqual(report.problems, [(init, "Extra response")])
+
+    def test_replay_log_pty(self):
+        requests = synthetic_requests(10)
+        log = RequestLog()
+        for request in requests:
+            log.update(request)
+        handler = RequestHandler(end_condition=Condition(ConditionType.After, cause=50))
+
+        host = PtyTransport()
+        client = FdTransport.open_path(host.slave_path)
+        report, host_log = simulate(log.requests, handler, transports=(host, client))
+        self.assertEqual(report.problems, [])
+        self.assertTrue(report.completed)
+        self.assertEqual(report.messages, 6) # Init, then 5 reads up to t=50
+        self.assertEqual(host_log.requests, requests[:6])
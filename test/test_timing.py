@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+from src.timing import *
+from src.request import EventRequest
+from src.request import InputRequest
+from src.request import InvalidRequest
+from src.utils import EventType
+from src.utils import InputType
+
+class TestTiming(unittest.TestCase):
+    def test_message_type(self):
+        self.assertEqual(message_type(EventRequest(0, EventType.Print, "x")), "Print")
+        self.assertEqual(message_type(InputRequest(0, InputType.Accelerometer, [0])),
+                         "Accelerometer")
+        self.assertEqual(message_type(InvalidRequest(0, None)), "Invalid")
+
+    def test_bucket(self):
+        self.assertEqual(bucket(0), 1)
+        self.assertEqual(bucket(1000), 1)
+        self.assertEqual(bucket(1001), 2)
+        self.assertEqual(bucket(5000), 8)
+
+    def test_summary(self):
+        timer = StageTimer()
+        request = EventRequest(0, EventType.Print, "x")
+        for i in range(1, 101):
+            timer.record(request, {"read": i*1000, "handle": 3000})
+        summary = timer.summary()
+        self.assertEqual(set(summary), {"Print"})
+        read = summary["Print"]["read"]
+        self.assertEqual(read["count"], 100)
+        self.assertEqual(read["p50 (us)"], 50.0)
+        self.assertEqual(read["p95 (us)"], 95.0)
+        self.assertEqual(read["p99 (us)"], 99.0)
+        self.assertEqual(read["max (us)"], 100.0)
+        self.assertEqual(sum(read["histogram (us)"].values()), 100)
+        self.assertEqual(summary["Print"]["handle"]["histogram (us)"], {4: 100})
+
+    def test_save(self):
+        timer = StageTimer()
+        timer.record(EventRequest(0, EventType.Init), {"read": 1000})
+        with tempfile.TemporaryDirectory() as results_dir:
+            timer.save(results_dir)
+            with open(os.path.join(results_dir, TIMING_FILENAME)) as f:
+                self.assertIn("Init", f.read())
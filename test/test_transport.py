@@ -0,0 +1,108 @@
+from src.transport import *
+import unittest
+
+import os
+import socket
+import threading
+import time
+
+class TestPipeTransport(unittest.TestCase):
+    def test_read_write(self):
+        a, b = PipeTransport.pair()
+        a.write(b"abc")
+        a.write(b"de")
+        self.assertEqual(b.read(2), b"ab")
+        self.assertEqual(b.read(), b"cde")
+        self.assertEqual(b.read(timeout=0.01), bytes()) # Timed out
+        b.write(b"f")
+        self.assertEqual(a.read(), b"f")
+
+    def test_blocking_read(self):
+        a, b = PipeTransport.pair()
+        timer = threading.Timer(0.01, a.write, args=[b"late"])
+        timer.start()
+        self.assertEqual(b.read(timeout=5), b"late")
+        timer.join()
+
+    def test_close(self):
+        a, b = PipeTransport.pair()
+        a.write(b"abc")
+        a.close()
+        self.assertEqual(b.read(), b"abc") # Still delivered
+        with self.assertRaises(TransportClosed):
+            b.read()
+        with self.assertRaises(TransportClosed):
+            b.write(b"x")
+
+class TestPtyTransport(unittest.TestCase):
+    def test_read_write(self):
+        host = PtyTransport()
+        client = FdTransport.open_path(host.slave_path)
+        try:
+            client.write(bytes(range(256))) # Raw mode, so every byte value gets through
+            received = bytes()
+            while len(received) < 256:
+                received += host.read(timeout=1)
+            self.assertEqual(received, bytes(range(256)))
+            self.assertEqual(host.read(timeout=0.01), bytes())
+            host.write(b"\n\r")
+            self.assertEqual(client.read(timeout=1), b"\n\r")
+        finally:
+            client.close()
+            host.close()
+        with self.assertRaises(TransportClosed):
+            host.read()
+
+    def test_release_slave(self):
+        host = PtyTransport()
+        client = FdTransport.open_path(host.slave_path)
+        host.release_slave()
+        client.close()
+        with self.assertRaises(TransportClosed):
+            host.read(timeout=1)
+        host.close()
+
+    def test_client_close(self):
+        host = PtyTransport()
+        client = FdTransport.open_path(host.slave_path)
+        client.write(b"abc")
+        client.close()
+        self.assertEqual(host.read(timeout=1), b"abc") # The client has shown up
+        with self.assertRaises(TransportClosed):
+            host.read(timeout=1)
+        host.close()
+
+class TestSocketTransport(unittest.TestCase):
+    def test_read_write(self):
+        a_sock, b_sock = socket.socketpair()
+        a, b = SocketTransport(a_sock), SocketTransport(b_sock)
+        a.write(b"abc")
+        self.assertEqual(b.read(timeout=1), b"abc")
+        self.assertEqual(b.read(timeout=0.01), bytes())
+        a.close()
+        with self.assertRaises(TransportClosed):
+            b.read(timeout=1)
+        b.close()
+
+    def test_open_transport(self):
+        server = socket.create_server(("localhost", 0))
+        port = server.getsockname()[1]
+        client = open_transport("tcp:localhost:{}".format(port), 115200)
+        host = SocketTransport(server.accept()[0])
+        server.close()
+        client.write(b"hi")
+        self.assertEqual(host.read(timeout=1), b"hi")
+        client.close()
+        host.close()
+
+        with self.assertRaises(IOError):
+            open_transport("/dev/not_a_real_serial_port", 115200)
+
+    def test_listen_timeout(self):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        start = time.monotonic()
+        with self.assertRaises(IOError):
+            open_transport("listen:127.0.0.1:{}".format(port), 115200, timeout=0.05)
+        self.assertLess(time.monotonic() - start, 1)
@@ -3,6 +3,7 @@ import numpy as np
 import operator
 
 from src.utils import *
+from src.screen import unpack_pixels
 
 class TestUtils(unittest.TestCase):
 
@@ -49,6 +50,15 @@ class TestUtils(unittest.TestCase):
         with self.assertRaises(ValueError):
             decode_int(bytes([1, 2, 3]), signed=True)
 
+    def test_decode_ints(self):
+        raw = memoryview(bytes([9, 1, 0, 0, 0, 254, 255, 255, 255]))
+        self.assertEqual(decode_ints(raw, 2, width=4, signed=True, offset=1), [1, -2])
+        self.assertEqual(decode_ints(raw, 3, width=1, signed=False), [9, 1, 0])
+        self.assertEqual(decode_ints(raw, 0, width=1), [])
+
+        with self.assertRaises(ValueError):
+            decode_ints(raw, 1, width=3)
+
     def test_encode_int(self):
         # 1 byte
         self.assertEqual(encode_int(1, width=1, signed=False), bytes([1]))
@@ -65,6 +75,16 @@ class TestUtils(unittest.TestCase):
         with self.assertRaises(ValueError):
             encode_int(0, width=3, signed=True)
 
+    def test_encode_ints(self):
+        self.assertEqual(encode_ints([1, -2], width=4, signed=True),
+                         bytes([1, 0, 0, 0, 254, 255, 255, 255]))
+        self.assertEqual(encode_ints([0, 1, 255], width=1, signed=False), bytes([0, 1, 255]))
+        self.assertEqual(encode_ints([], width=1), bytes())
+        self.assertEqual(encode_ints([1, 2], width=2), encode_int(1, 2) + encode_int(2, 2))
+
+        with self.assertRaises(ValueError):
+            encode_ints([0], width=3, signed=True)
+
     def test_analog_to_digital(self):
         params = AnalogParams(-128, 127, 0.0, 5.0)
 
@@ -109,6 +129,30 @@ class TestUtils(unittest.TestCase):
         expected[7,:] = 1 # Bottom edge
         self.assertTrue(np.array_equal(decode_screen_tile(b), expected))
 
+    def test_decode_screen_pages(self):
+        tile_width, tile_height = 3, 2
+        data = bytes(range(1, 8*tile_width*tile_height+1)) + bytes([255]) # Extra byte is ignored
+
+        expected = np.zeros((8*tile_height, 8*tile_width), dtype=np.uint8)
+        for x in range(tile_width): # Reference implementation, tile by tile
+            for y in range(tile_height):
+                start = 8*(y*tile_width + x)
+                tile = decode_screen_tile(data[start:start+8])
+                px, py = 8*(tile_width-x-1), 8*(tile_height-y-1)
+                expected[py:py+8, px:px+8] = tile
+
+        pages = decode_screen_pages(data, tile_width, tile_height)
+        self.assertEqual(pages.shape, (2, 24))
+        self.assertTrue(np.array_equal(unpack_pixels(pages, 16), expected))
+        self.assertEqual(encode_screen_pages(pages), data[:-1])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([7], 50), 7)
+
     def test_bitmap_to_int(self):
         bitmap = np.zeros((2,3), dtype=np.uint8)
         bitmap[0,0] = 1
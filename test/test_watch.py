@@ -0,0 +1,117 @@
+from src.watch import *
+import unittest
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+from src.communication import SerialCommunication
+from src.transport import PtyTransport
+
+class TestBackoff(unittest.TestCase):
+    def test_next(self):
+        backoff = Backoff(initial=0.1, maximum=0.5, factor=2)
+        self.assertEqual([backoff.next() for i in range(4)], [0.1, 0.2, 0.4, 0.5])
+        backoff.reset()
+        self.assertEqual(backoff.next(), 0.1)
+
+class TestWaitUntil(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.dir = self.tempdir.name
+        self.pty = PtyTransport() # Stands in for a board's device node
+        self.attempts = 0
+
+    def tearDown(self):
+        self.pty.close()
+        self.tempdir.cleanup()
+
+    # Plugs in the "board" at path (a link to the pty) after delay seconds
+    def plug_in_later(self, path, delay=0.1):
+        def plug_in():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.symlink(self.pty.slave_path, path)
+        timer = threading.Timer(delay, plug_in)
+        timer.start()
+        return timer
+
+    def exists(self, path):
+        self.attempts += 1
+        return os.path.exists(path)
+
+    def test_polling(self):
+        path = os.path.join(self.dir, "ttyACM0")
+        timer = self.plug_in_later(path)
+        backoff = Backoff(initial=0.01, maximum=0.02)
+        self.assertTrue(wait_until(lambda: self.exists(path), timeout=5, backoff=backoff))
+        timer.join()
+        self.assertFalse(wait_until(lambda: False, timeout=0.05))
+
+    @unittest.skipIf(load_inotify() is None, "Needs inotify")
+    def test_event_driven(self):
+        path = os.path.join(self.dir, "serial", "by-id", "board") # Directories don't exist yet
+        timer = self.plug_in_later(path)
+        backoff = Backoff(initial=60, maximum=60) # Only an event can wake us up in time
+        start = time.monotonic()
+        self.assertTrue(wait_until(lambda: self.exists(path), path, timeout=5, backoff=backoff))
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertLessEqual(self.attempts, 5) # No busy-waiting
+        timer.join()
+
+    @unittest.skipIf(load_inotify() is None, "Needs inotify")
+    def test_unplug_and_replug(self):
+        path = os.path.join(self.dir, "ttyACM0")
+        os.symlink(self.pty.slave_path, path)
+        os.remove(path)
+        timer = self.plug_in_later(path)
+        backoff = Backoff(initial=60, maximum=60)
+        self.assertTrue(wait_until(lambda: self.exists(path), path, timeout=5, backoff=backoff))
+        timer.join()
+
+    @unittest.skipIf(load_inotify() is None, "Needs inotify")
+    def test_refresh(self):
+        path = os.path.join(self.dir, "serial", "by-id", "board")
+        watcher = DirectoryWatcher(path)
+        def num_watches():
+            with open("/proc/self/fdinfo/{}".format(watcher.fileno())) as f:
+                return len([line for line in f if line.startswith("inotify wd:")])
+        try:
+            for i in range(3): # Device directories come and go with the device
+                os.makedirs(os.path.dirname(path))
+                watcher.refresh()
+                self.assertEqual(watcher.directory, os.path.dirname(path))
+                self.assertEqual(num_watches(), 1)
+                os.rmdir(os.path.dirname(path))
+                os.rmdir(os.path.dirname(os.path.dirname(path)))
+                watcher.refresh()
+                self.assertEqual(watcher.directory, self.dir)
+                self.assertEqual(num_watches(), 1)
+        finally:
+            watcher.close()
+
+    def test_wait_for_connection(self):
+        path = os.path.join(self.dir, "ttyACM0")
+        sc = SerialCommunication()
+        self.assertFalse(sc.wait_for_connection("tty:" + path, timeout=0.05))
+        timer = self.plug_in_later(path)
+        self.assertTrue(sc.wait_for_connection("tty:" + path, timeout=5))
+        sc.transport.close()
+        timer.join()
+
+    @unittest.skipIf(load_inotify() is None, "Needs inotify")
+    def test_wait_until_async(self):
+        path = os.path.join(self.dir, "ttyACM0")
+        timer = self.plug_in_later(path)
+        async def attempt():
+            return self.exists(path)
+        backoff = Backoff(initial=60, maximum=60)
+        start = time.monotonic()
+        connected = asyncio.run(wait_until_async(attempt, path, timeout=5, backoff=backoff))
+        self.assertTrue(connected)
+        self.assertLess(time.monotonic() - start, 2)
+        timer.join()
+        async def never():
+            return False
+        self.assertFalse(asyncio.run(wait_until_async(never, timeout=0.05)))